@@ -0,0 +1,101 @@
+import re
+from functools import lru_cache
+
+# USPS street suffix abbreviations
+SUFFIXES = {
+    'ALLEY': 'ALY', 'AVENUE': 'AVE', 'AV': 'AVE', 'BOULEVARD': 'BLVD', 'CIRCLE': 'CIR',
+    'COURT': 'CT', 'COVE': 'CV', 'CROSSING': 'XING', 'DRIVE': 'DR', 'EXPRESSWAY': 'EXPY',
+    'HIGHWAY': 'HWY', 'ISLAND': 'IS', 'ISLE': 'ISLE', 'LANE': 'LN', 'LOOP': 'LOOP', 'PARKWAY': 'PKWY',
+    'PLACE': 'PL', 'PLAZA': 'PLZ', 'POINT': 'PT', 'ROAD': 'RD', 'SQUARE': 'SQ',
+    'STREET': 'ST', 'TERRACE': 'TER', 'TRAIL': 'TRL', 'WAY': 'WAY',
+}
+
+DIRECTIONALS = {
+    'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+    'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE', 'SOUTHWEST': 'SW',
+}
+
+ORDINAL_WORDS = {
+    'FIRST': 1, 'SECOND': 2, 'THIRD': 3, 'FOURTH': 4, 'FIFTH': 5, 'SIXTH': 6,
+    'SEVENTH': 7, 'EIGHTH': 8, 'NINTH': 9, 'TENTH': 10, 'ELEVENTH': 11, 'TWELFTH': 12,
+}
+
+# Unit designators; the designator and the unit number after it are dropped
+UNIT_DESIGNATORS = frozenset(['APT', 'APARTMENT', 'UNIT', 'STE', 'SUITE', 'LOT', 'BLDG', 'RM', 'SPC', '#'])
+
+_ORDINAL_RE = re.compile(r'^(\d+)(ST|ND|RD|TH)$')
+_PUNCTUATION_RE = re.compile(r"[.']")
+
+# Lowercase words capitalize_address prints in upper case
+_UPPERCASE_WORDS = frozenset(['fl', 'st', 'rd', 'dr', 'ave', 'blvd', 'ln', 'pl', 'ct', 'n', 's', 'e', 'w'])
+_ORDINAL_ENDINGS = frozenset(['th', 'st', 'nd', 'rd'])
+
+
+def ordinal(number):
+    number = int(number)
+    if 10 <= number % 100 <= 20:
+        return f'{number}TH'
+    return f"{number}{ {1: 'ST', 2: 'ND', 3: 'RD'}.get(number % 10, 'TH') }"
+
+
+def _canonical_token(token):
+    if token in SUFFIXES:
+        return SUFFIXES[token]
+    if token in DIRECTIONALS:
+        return DIRECTIONALS[token]
+    if token == 'SAINT':
+        return 'ST'
+    if token in ORDINAL_WORDS:
+        return ordinal(ORDINAL_WORDS[token])
+    match = _ORDINAL_RE.match(token)
+    if match:
+        return ordinal(match.group(1))
+    return token
+
+
+@lru_cache(maxsize=65536)
+def canonical_address(address):
+    """Stable key for the street line of an address.
+
+    Upper-cased, cut at the first comma, punctuation dropped, suffixes and
+    directionals abbreviated, "Saint" folded to ST, ordinals written as
+    1ST/2ND/3RD/4TH and unit numbers removed, so that "123 Third Avenue
+    North, Apt 4" and "123 3rd Ave N" share one key.
+    """
+    street = _PUNCTUATION_RE.sub('', (address or '').split(',')[0].upper())
+    tokens = street.replace('#', ' # ').split()
+
+    canonical = []
+    skip_next = False
+    for token in tokens:
+        if skip_next:
+            skip_next = False
+            continue
+        if token in UNIT_DESIGNATORS:
+            skip_next = True
+            continue
+        canonical.append(_canonical_token(token))
+    return ' '.join(canonical)
+
+
+@lru_cache(maxsize=65536)
+def core_address_key(address):
+    # House number, street name and suffix: the canonical key without the
+    # trailing directional
+    return ' '.join(canonical_address(address).split()[:3])
+
+
+@lru_cache(maxsize=65536)
+def capitalize_address(address):
+    words = address.split()
+    capitalized_words = []
+    for word in words:
+        if word.lower() in _UPPERCASE_WORDS:
+            capitalized_words.append(word.upper())
+        elif word.lower() == 'saint':
+            capitalized_words.append('St.')
+        elif word[:-2].isdigit() and word[-2:].lower() in _ORDINAL_ENDINGS:
+            capitalized_words.append(word[:-2] + word[-2:].lower())
+        else:
+            capitalized_words.append(word.capitalize())
+    return ' '.join(capitalized_words)
@@ -1,84 +1,78 @@
-import requests
-import pandas as pd
-
-def get_all_parcels_info():
-    # Define the API endpoint for the Tax Parcels Info
-    api_url = "https://egis.stpete.org/arcgis/rest/services/ServicesDOTS/TaxParcels/MapServer/0/query"
-
-    # Initial parameters
-    params = {
-        "where": "1=1",  # This condition retrieves all records
-        "outFields": "OBJECTID,ADDRESSSHORT,PARCELID",  # Fields to return
-        "resultOffset": 0,  # Start at the beginning
-        "resultRecordCount": 1000,  # Number of records per batch
-        "f": "json",  # Response format
-        "orderByFields": "OBJECTID ASC"  # Order by OBJECTID
-    }
-
-    all_data = []
-
-    while True:
-        # Make the request
-        response = requests.get(api_url, params=params)
-        data = response.json()
-
-        # Append current batch of data to all_data
-        all_data.extend([feature['attributes'] for feature in data['features']])
-
-        # Check if there are more records to fetch
-        if len(data['features']) < params['resultRecordCount']:
-            break  # No more records to fetch
-
-        # Update the resultOffset for the next batch
-        params['resultOffset'] += params['resultRecordCount']
-
-    # Convert to DataFrame
-    parcels_df = pd.DataFrame(all_data)
-    return parcels_df
-
-def get_all_planned_redevelopment_info():
-    # Define the API endpoint for the Zoning information
-    api_url = "https://egis.stpete.org/arcgis/rest/services/ServicesDOTS/Zoning/MapServer/2/query"
-
-    # Initial parameters
-    params = {
-        "where": "LANDUSECODE='PR-MU'",  # Filter by land use code 'PR-MU'
-        "outFields": "*",  # Retrieve all fields
-        "resultOffset": 0,  # Start at the beginning
-        "resultRecordCount": 1000,  # Number of records per batch
-        "f": "json"  # Response format
-    }
-
-    all_data = []
-
-    while True:
-        # Make the request
-        response = requests.get(api_url, params=params)
-        data = response.json()
-
-        # Append current batch of data to all_data
-        all_data.extend([feature['attributes'] for feature in data['features']])
-
-        # Check if there are more records to fetch
-        if len(data['features']) < params['resultRecordCount']:
-            break  # No more records to fetch
-
-        # Update the resultOffset for the next batch
-        params['resultOffset'] += params['resultRecordCount']
-
-    # Convert to DataFrame
-    redevelopment_df = pd.DataFrame(all_data)
-    return redevelopment_df
+import argparse
+import os
+import shutil
+from cassette import Cassette
+from http_client import use_cassette
+from arcgis_download import download_layer, read_layer, merge_with_parts
 
-def main():
-    # Get all parcels info
-    parcels_info_df = get_all_parcels_info()
+PARCELS_LAYER_URL = "https://egis.stpete.org/arcgis/rest/services/ServicesDOTS/TaxParcels/MapServer/0"
+ZONING_LAYER_URL = "https://egis.stpete.org/arcgis/rest/services/ServicesDOTS/Zoning/MapServer/2"
+
+DOWNLOAD_DIR = 'downloads'
+# Replays download into here so they never touch the real checkpoints
+REPLAY_DIR = os.path.join('replay_out', 'downloads')
+
+
+def download_parcels(max_workers=4, fresh=False, directory=DOWNLOAD_DIR):
+    # Tax Parcels Info, downloaded in resumable OBJECTID ranges
+    return download_layer(
+        PARCELS_LAYER_URL, f'{directory}/parcels',
+        where="1=1",  # This condition retrieves all records
+        out_fields="OBJECTID,ADDRESSSHORT,PARCELID",  # Fields to return
+        max_workers=max_workers, fresh=fresh
+    )
+
+
+def download_planned_redevelopment(max_workers=4, fresh=False, directory=DOWNLOAD_DIR):
+    # Zoning information filtered to land use code 'PR-MU'
+    return download_layer(
+        ZONING_LAYER_URL, f'{directory}/planned_redevelopment',
+        where="LANDUSECODE='PR-MU'",
+        out_fields="*",  # Retrieve all fields
+        max_workers=max_workers, fresh=fresh
+    )
 
-    # Get all planned redevelopment info
-    redevelopment_info_df = get_all_planned_redevelopment_info()
 
-    # Merge data on OBJECTID
-    combined_data = pd.merge(redevelopment_info_df, parcels_info_df, on='OBJECTID', how='inner')
+def get_all_parcels_info(max_workers=4, fresh=False, directory=DOWNLOAD_DIR):
+    return read_layer(download_parcels(max_workers, fresh, directory))
+
+
+def get_all_planned_redevelopment_info(max_workers=4, fresh=False, directory=DOWNLOAD_DIR):
+    return read_layer(download_planned_redevelopment(max_workers, fresh, directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge planned redevelopment zoning with tax parcel addresses')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent range downloads per layer')
+    parser.add_argument('--fresh', action='store_true', help='discard checkpointed ranges and download everything again')
+    cassette_args = parser.add_mutually_exclusive_group()
+    cassette_args.add_argument('--record', metavar='CASSETTE', help='save every ArcGIS response to a cassette file')
+    cassette_args.add_argument('--replay', metavar='CASSETTE', help='answer ArcGIS requests from a recorded cassette, offline')
+    args = parser.parse_args()
+
+    directory, fresh = DOWNLOAD_DIR, args.fresh
+    cassette = None
+    if args.record:
+        # Checkpointed ranges would never be requested, so nothing would be recorded
+        cassette, fresh = Cassette(args.record, 'record'), True
+    elif args.replay:
+        cassette, directory = Cassette(args.replay, 'replay'), REPLAY_DIR
+        shutil.rmtree(directory, ignore_errors=True)
+    use_cassette(cassette)
+
+    try:
+        # Get all parcels info
+        parcels_dir = download_parcels(args.workers, fresh, directory)
+
+        # Get all planned redevelopment info
+        redevelopment_info_df = get_all_planned_redevelopment_info(args.workers, fresh, directory)
+    finally:
+        use_cassette(None)
+        if cassette is not None:
+            cassette.close()
+
+    # Merge data on OBJECTID, streaming through the parcel parts
+    combined_data = merge_with_parts(redevelopment_info_df, parcels_dir, on='OBJECTID')
 
     # Print combined data
     print(combined_data)
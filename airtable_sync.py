@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+import urllib.parse
+import requests
+from metrics import METRICS
+
+AIRTABLE_API_URL = 'https://api.airtable.com/v0'
+
+# Airtable allows 5 requests per second per base and at most 10 records per
+# create call; a 429 means waiting 30 seconds before trying again.
+AIRTABLE_RATE = 5
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_RETRY_AFTER = 30
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        # Push every later call back, e.g. after the server answered 429
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+# One limiter per base and rate, shared by every client in the process
+_base_limiters = {}
+_base_limiters_lock = threading.Lock()
+
+
+def base_limiter(base_id, rate=AIRTABLE_RATE):
+    """The RateLimiter shared by every client of ``base_id``.
+
+    Airtable's limit is per base, so clients made for separate deliveries,
+    possibly on different threads, must draw from the same limiter.
+    """
+    with _base_limiters_lock:
+        limiter = _base_limiters.get((base_id, rate))
+        if limiter is None:
+            limiter = _base_limiters[(base_id, rate)] = RateLimiter(rate)
+        return limiter
+
+
+class AirtableClient:
+    def __init__(self, base_id, table_name, access_token, api_url=AIRTABLE_API_URL,
+                 session=None, rate=AIRTABLE_RATE, max_retries=3):
+        self.url = f"{api_url}/{base_id}/{urllib.parse.quote(table_name or '')}"
+        self.session = session or requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {access_token}'})
+        self.limiter = base_limiter(base_id, rate)
+        self.max_retries = max_retries
+
+    def _request(self, method, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            with METRICS.timed('api_request_seconds', service='Airtable'):
+                response = self.session.request(method, self.url, **kwargs)
+            METRICS.inc('api_requests', service='Airtable', status=response.status_code)
+            if response.status_code != 429 or attempt == self.max_retries:
+                response.raise_for_status()
+                return response.json()
+            retry_after = float(response.headers.get('Retry-After') or AIRTABLE_RETRY_AFTER)
+            logging.warning(f'Airtable rate limit hit, waiting {retry_after}s')
+            METRICS.inc('api_retries', service='Airtable')
+            self.limiter.pause(retry_after)
+
+    def list_field(self, field):
+        """Return the set of values of ``field`` across every record in the table."""
+        values = set()
+        params = {'fields[]': field, 'pageSize': 100}
+        while True:
+            data = self._request('GET', params=params)
+            for record in data.get('records', []):
+                value = record.get('fields', {}).get(field)
+                if value is not None:
+                    values.add(value)
+            offset = data.get('offset')
+            if not offset:
+                return values
+            params = {**params, 'offset': offset}
+
+    def create(self, records):
+        """Create up to ten records in one call; raises if the call fails."""
+        data = self._request('POST', json={'records': [{'fields': fields} for fields in records]})
+        return data.get('records', [])
@@ -0,0 +1,230 @@
+import glob
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from pandas.api.types import union_categoricals
+import requests
+from http_client import CircuitOpenError, make_client
+
+# ArcGIS servers have no published rate limit; stay polite
+ARCGIS_RATE = 10
+
+# ArcGIS field types and the narrowest dtype that holds any of their values
+FIELD_DTYPES = {
+    'esriFieldTypeSmallInteger': 'Int16',
+    'esriFieldTypeInteger': 'Int32',
+    'esriFieldTypeOID': 'Int64',
+    'esriFieldTypeBigInteger': 'Int64',
+    'esriFieldTypeDate': 'Int64',  # epoch milliseconds
+    'esriFieldTypeSingle': 'float32',
+    'esriFieldTypeDouble': 'float64',
+}
+
+
+def make_arcgis_client(pool_size=10):
+    return make_client(pool_size, rate=ARCGIS_RATE, name='ArcGIS')
+
+
+def error_status(data):
+    # ArcGIS reports query errors inside a 200 response; pass as body_status
+    if 'error' in data:
+        return data['error'].get('code') or 500
+    return None
+
+
+def query(client, layer_url, params):
+    """Run a query against ``<layer_url>/query`` and return the decoded JSON."""
+    try:
+        return client.get_json(f"{layer_url}/query", body_status=error_status, params={**params, 'f': 'json'})
+    except (requests.RequestException, ValueError, CircuitOpenError) as e:
+        raise RuntimeError(f'ArcGIS query failed: {e}')
+
+
+def get_object_ids(client, layer_url, where='1=1'):
+    data = query(client, layer_url, {'where': where, 'returnIdsOnly': 'true'})
+    return sorted(data.get('objectIds') or [])
+
+
+def split_ranges(object_ids, chunk_size):
+    # Consecutive runs of chunk_size ids, as inclusive (first, last) pairs
+    return [
+        (object_ids[start], object_ids[min(start + chunk_size, len(object_ids)) - 1])
+        for start in range(0, len(object_ids), chunk_size)
+    ]
+
+
+def fetch_range(client, layer_url, where, out_fields, first, last, id_field='OBJECTID'):
+    params = {
+        'where': f"{id_field} >= {first} AND {id_field} <= {last} AND ({where})",
+        'outFields': out_fields,
+        'returnGeometry': 'false',
+        'orderByFields': f'{id_field} ASC',
+        'resultOffset': 0,
+    }
+    rows = []
+    while True:
+        data = query(client, layer_url, params)
+        features = data.get('features', [])
+        rows.extend(feature['attributes'] for feature in features)
+        # Ranges are sized under the server's page limit, but page if not
+        if not data.get('exceededTransferLimit') or not features:
+            return rows
+        params['resultOffset'] += len(features)
+
+
+def get_field_types(client, layer_url):
+    # Field name -> ArcGIS field type from the layer's description, or {} if
+    # the server does not say
+    try:
+        info = client.get_json(layer_url, body_status=error_status, params={'f': 'json'})
+    except (requests.RequestException, ValueError, CircuitOpenError) as e:
+        logging.warning(f'Could not read the fields of {layer_url}: {e}')
+        return {}
+    return {field['name']: field.get('type') for field in info.get('fields') or []}
+
+
+def infer_dtypes(sample, field_types=None):
+    """Pick one compact dtype per column for a whole layer.
+
+    Numbers take the narrowest dtype their ArcGIS field type allows, so no
+    part can hold a value that does not fit; without a field type they stay
+    64-bit. Text columns become categories when ``sample`` (one range of the
+    layer) has at most one distinct value per two rows.
+    """
+    field_types = field_types or {}
+    dtypes = {}
+    for column in sample.columns:
+        series = sample[column]
+        if field_types.get(column) in FIELD_DTYPES:
+            dtypes[column] = FIELD_DTYPES[field_types[column]]
+        elif pd.api.types.is_integer_dtype(series):
+            dtypes[column] = 'Int64'
+        elif pd.api.types.is_float_dtype(series) or pd.api.types.is_bool_dtype(series):
+            dtypes[column] = str(series.dtype)
+        elif len(series) and series.nunique(dropna=True) <= len(series) // 2:
+            dtypes[column] = 'category'
+        else:
+            dtypes[column] = 'string[pyarrow]'
+    return dtypes
+
+
+def apply_dtypes(rows, dtypes):
+    # Every part gets the layer's columns and dtypes, even an empty one
+    df = pd.DataFrame(rows, columns=list(dtypes) or None)
+    for column, dtype in dtypes.items():
+        df[column] = df[column].astype(dtype)
+    return df
+
+
+def _write_manifest(path, manifest):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _part_path(dest_dir, first, last):
+    return os.path.join(dest_dir, f'part-{first:010d}-{last:010d}.parquet')
+
+
+def download_layer(layer_url, dest_dir, where='1=1', out_fields='*', chunk_size=1000,
+                   max_workers=4, client=None, fresh=False):
+    """Download a layer's attributes into one Parquet file per OBJECTID range.
+
+    Ranges are fetched concurrently through one rate-limited, retrying
+    client. Each finished range is its own Parquet part and the range plan is
+    kept in a manifest, so a failed run picks up where it stopped instead of
+    starting over. The manifest also fixes the dtypes, decided from the
+    layer's field types and its first range, so every part has one schema.
+    Returns the directory holding the parts.
+    """
+    manifest_path = os.path.join(dest_dir, 'manifest.json')
+    spec = {'layer_url': layer_url, 'where': where, 'out_fields': out_fields}
+
+    if fresh and os.path.isdir(dest_dir):
+        shutil.rmtree(dest_dir)
+    os.makedirs(dest_dir, exist_ok=True)
+
+    client = client or make_arcgis_client(pool_size=max_workers)
+
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        # Parts from before dtypes were kept in the manifest may disagree
+        stale_parts = 'dtypes' not in manifest and glob.glob(os.path.join(dest_dir, 'part-*.parquet'))
+        if manifest.get('spec') != spec or stale_parts:
+            logging.info(f'Download spec for {dest_dir} changed, starting over')
+            shutil.rmtree(dest_dir)
+            os.makedirs(dest_dir)
+            manifest = None
+
+    if manifest is None:
+        ranges = split_ranges(get_object_ids(client, layer_url, where), chunk_size)
+        manifest = {'spec': spec, 'ranges': ranges}
+        _write_manifest(manifest_path, manifest)
+
+    pending = [
+        (first, last) for first, last in manifest['ranges']
+        if not os.path.exists(_part_path(dest_dir, first, last))
+    ]
+    logging.info(f'{layer_url}: {len(manifest["ranges"]) - len(pending)} of {len(manifest["ranges"])} ranges already downloaded')
+
+    def write_part(first, last, rows):
+        part_path = _part_path(dest_dir, first, last)
+        # Write then rename, so a part on disk is always complete
+        apply_dtypes(rows, manifest['dtypes']).to_parquet(f'{part_path}.tmp', index=False)
+        os.replace(f'{part_path}.tmp', part_path)
+
+    def download(object_range):
+        first, last = object_range
+        rows = fetch_range(client, layer_url, where, out_fields, first, last)
+        write_part(first, last, rows)
+        return len(rows)
+
+    if pending and 'dtypes' not in manifest:
+        # The first range is fetched on its own to settle the dtypes
+        first, last = pending.pop(0)
+        rows = fetch_range(client, layer_url, where, out_fields, first, last)
+        manifest['dtypes'] = infer_dtypes(pd.DataFrame(rows), get_field_types(client, layer_url))
+        _write_manifest(manifest_path, manifest)
+        write_part(first, last, rows)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for count in executor.map(download, pending):
+            logging.debug(f'{layer_url}: downloaded {count} rows')
+
+    return dest_dir
+
+
+def iter_parts(dest_dir, columns=None):
+    for part_path in sorted(glob.glob(os.path.join(dest_dir, 'part-*.parquet'))):
+        yield pd.read_parquet(part_path, columns=columns)
+
+
+def concat_parts(parts):
+    """Concatenate part frames, keeping category columns as categories.
+
+    Each part has its own categories, and concat falls back to object
+    unless they are the same, so they are unioned first.
+    """
+    for column in parts[0].columns:
+        if isinstance(parts[0][column].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([part[column] for part in parts]).categories
+            for part in parts:
+                part[column] = part[column].cat.set_categories(categories)
+    return pd.concat(parts, ignore_index=True)
+
+
+def read_layer(dest_dir, columns=None):
+    parts = list(iter_parts(dest_dir, columns))
+    return concat_parts(parts) if parts else pd.DataFrame(columns=columns)
+
+
+def merge_with_parts(left, dest_dir, on='OBJECTID'):
+    # Inner-join a small frame against a downloaded layer one part at a time,
+    # so the large side is never fully in memory
+    merged = [pd.merge(left, part, on=on, how='inner') for part in iter_parts(dest_dir)]
+    return concat_parts(merged) if merged else left.head(0)
@@ -0,0 +1,60 @@
+import glob
+import gzip
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+ARCHIVE_DIR = 'archive'
+ARCHIVE_RETENTION_DAYS = 14
+
+
+class NDJSONArchive:
+    """Gzip-compressed NDJSON file written one batch at a time.
+
+    Every append is closed off as its own gzip member, so a run that dies
+    part-way still leaves a readable archive of every batch written before it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Start a fresh file for this run
+        open(path, 'wb').close()
+
+    def append(self, records):
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        with gzip.open(self.path, 'ab') as f:
+            f.write(lines.encode())
+        self.count += len(records)
+
+
+def run_archive_path(directory=ARCHIVE_DIR, started=None):
+    # One file per run: a daemon polls many times a day, and each poll's
+    # archive is read back to record exactly the listings that poll saw
+    started = started or datetime.now()
+    stem = os.path.join(directory, f"property_data_{started.strftime('%Y-%m-%d_%H%M%S')}")
+    path, n = f'{stem}.ndjson.gz', 1
+    while os.path.exists(path):
+        path, n = f'{stem}_{n}.ndjson.gz', n + 1
+    return path
+
+
+def read_archive(path):
+    # Yield every complete record, stopping quietly at a truncated tail
+    try:
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        return
+
+
+def prune_archives(directory=ARCHIVE_DIR, keep_days=ARCHIVE_RETENTION_DAYS):
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+    for path in glob.glob(os.path.join(directory, 'property_data_*.ndjson.gz')):
+        date = os.path.basename(path)[len('property_data_'):len('property_data_') + 10]
+        if date < cutoff:
+            os.remove(path)
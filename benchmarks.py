@@ -0,0 +1,471 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import watchlist
+from address import canonical_address, core_address_key, ordinal
+from emails import NTM_CHEAT_SHEET, render_Health_matches, render_NTMmatches, render_match_email
+from fuzzy import FuzzyIndex
+from listing_store import ListingStore, listing_key
+from listings import build_listing_frame
+from main import COLLECTORS, save_daily_stats, update_NTMairtable
+from matcher import AddressMatcher, build_zone_index
+from rules import RULES_FILE, load_rule_engine, load_rules
+from scanner import ScanDeduper, restrict_matches
+from spatial import PolygonIndex
+from stats_store import StatsStore
+from stubs import FakeAirtableServer
+
+# Rough bounding box of St. Petersburg in lon/lat
+BOUNDS = (-82.76, 27.69, -82.62, 27.87)
+
+SUFFIXES = ['ST', 'AVE', 'DR', 'CT', 'PL', 'BLVD', 'LN', 'RD', 'WAY', 'TER']
+DIRECTIONS = ['N', 'S', 'NE', 'NW', 'SE', 'SW']
+# Zone classes in roughly the mix of the real health office watchlist
+ZONES = ['NTM-1'] * 6 + ['CRT-1'] * 3 + ['CCS-1'] * 2 + ['DC-2', 'CCT-1', 'CRS-1', 'RC-1']
+CITIES = [', St Petersburg, FL 33713', ', Saint Petersburg, FL 33704', ', St. Petersburg, FL 33710']
+
+SUITE_SIZES = (1000, 10000, 100000)
+BASELINE_FILE = 'benchmark_baseline.json'
+# A stage has regressed when it takes this many times its baseline time or
+# memory; stages under the noise floors are not compared
+REGRESSION_TOLERANCE = 1.25
+NOISE_SECONDS = 0.05
+NOISE_MB = 1.0
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def make_addresses(count, rng):
+    return [
+        f"{rng.randint(1, 9999)} {ordinal(rng.randint(1, 120))} {rng.choice(SUFFIXES)} {rng.choice(DIRECTIONS)}"
+        for _ in range(count)
+    ]
+
+
+def make_polygons(count, rng, vertices=40):
+    # Jittered circles laid out on a grid across the city
+    side = int(np.ceil(np.sqrt(count)))
+    min_x, min_y, max_x, max_y = BOUNDS
+    step_x, step_y = (max_x - min_x) / side, (max_y - min_y) / side
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    polygons = []
+    for index in range(count):
+        cx = min_x + (index % side + 0.5) * step_x
+        cy = min_y + (index // side + 0.5) * step_y
+        radius = np.array([rng.uniform(0.3, 0.5) for _ in angles])
+        ring = np.column_stack((cx + radius * step_x * np.cos(angles), cy + radius * step_y * np.sin(angles)))
+        polygons.append([np.vstack((ring, ring[:1])).tolist()])
+    return polygons
+
+
+def bench_spatial(listings, watchlist, polygons, seed=0):
+    """Spatial point-in-polygon matching against the two address matchers."""
+    rng = random.Random(seed)
+    watch_addresses = [a.lower() for a in make_addresses(watchlist, rng)]
+    listing_addresses = [
+        (rng.choice(watch_addresses) if rng.random() < 0.2 else a.lower()) + ", st petersburg, fl 33713"
+        for a in make_addresses(listings, rng)
+    ]
+    min_x, min_y, max_x, max_y = BOUNDS
+    points = [(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y)) for _ in range(listings)]
+
+    matcher, build_substring = timed(AddressMatcher, watch_addresses)
+    zone_index, build_core = timed(
+        build_zone_index, [core_address_key(a) for a in watch_addresses], ['CRT-1'] * watchlist, []
+    )
+    polygon_index, build_spatial = timed(PolygonIndex, make_polygons(polygons, rng))
+
+    _, substring_time = timed(lambda: [matcher.contains_any(a) for a in listing_addresses])
+    # Timed with the key, as each listing's key is computed once per run
+    core_address_key.cache_clear()
+    _, core_time = timed(lambda: [zone_index.get(core_address_key(a)) for a in listing_addresses])
+    spatial_hits, spatial_time = timed(lambda: [polygon_index.query(x, y) for x, y in points])
+
+    print(f"{listings:,} listings, {watchlist:,} watchlist addresses, {polygons:,} polygons")
+    print(f"{'mode':<10} {'build (s)':>10} {'match (s)':>10} {'us/listing':>11}")
+    for mode, build, run in (
+        ('substring', build_substring, substring_time),
+        ('core', build_core, core_time),
+        ('spatial', build_spatial, spatial_time),
+    ):
+        print(f"{mode:<10} {build:>10.3f} {run:>10.3f} {run / listings * 1e6:>11.2f}")
+    print(f"spatial hit rate: {sum(1 for hits in spatial_hits if hits) / listings:.1%}")
+
+
+def misspell(address, rng):
+    # Swap two adjacent letters in the street name, or spell the suffix out
+    tokens = address.split()
+    if rng.random() < 0.5:
+        tokens[2] = {'ST': 'STREET', 'AVE': 'AVENUE', 'DR': 'DRIVE'}.get(tokens[2], tokens[2])
+    else:
+        name = tokens[1]
+        i = rng.randrange(len(name) - 1)
+        tokens[1] = name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return ' '.join(tokens)
+
+
+def bench_fuzzy(listings, watchlist, workers, seed=0):
+    """Blocked fuzzy matching throughput, in-process and sharded."""
+    rng = random.Random(seed)
+    watch_addresses = make_addresses(watchlist, rng)
+    listing_addresses = []
+    for address in make_addresses(listings, rng):
+        roll = rng.random()
+        if roll < 0.1:
+            address = rng.choice(watch_addresses)
+        elif roll < 0.2:
+            address = misspell(rng.choice(watch_addresses), rng)
+        listing_addresses.append(address)
+    keys = [canonical_address(a) for a in listing_addresses]
+
+    index, build = timed(FuzzyIndex, [(canonical_address(a), 0, None) for a in watch_addresses], {0: 0.85})
+    serial_hits, serial = timed(index.match_many, keys, 1)
+    sharded_hits, sharded = timed(index.match_many, keys, workers)
+    assert serial_hits == sharded_hits
+
+    print(f"{listings:,} listings, {watchlist:,} watchlist addresses, {len(index.blocks):,} blocks")
+    print(f"build: {build:.3f}s")
+    print(f"{'mode':<18} {'match (s)':>10} {'listings/s':>12}")
+    for mode, run in (('in-process', serial), (f'{workers} processes', sharded)):
+        print(f"{mode:<18} {run:>10.3f} {listings / run:>12,.0f}")
+    print(f"hit rate: {sum(1 for hits in serial_hits if hits) / listings:.1%} (20% seeded, half misspelled)")
+
+
+def make_properties(count, rng):
+    return [
+        {
+            'address': f"{address.lower()}, st petersburg, fl 33713",
+            'detailUrl': f"https://www.zillow.com/homedetails/{index}_zpid/",
+            'imgSrc': f"https://photos.zillowstatic.com/fp/{index}.jpg",
+            'price': rng.randint(100000, 2000000),
+            'lotAreaValue': rng.randint(2000, 15000),
+            'livingArea': rng.randint(600, 5000),
+            'lot_price_per_sf': rng.randint(10, 300),
+            'price_per_sf': rng.randint(50, 900),
+            'lot_tier': rng.choice([5, 4, 0]),
+            'zone_class': 'CRT-1',
+            'match_score': 1.0 if rng.random() < 0.9 else rng.uniform(0.85, 1.0),
+            'ntm_map_url': 'https://egis.stpete.org/ntm',
+            'zoning_map_url': 'https://egis.stpete.org/zoning',
+        }
+        for index, address in enumerate(make_addresses(count, rng))
+    ]
+
+
+def make_listings(count, rng, watch_addresses=(), hit_rate=0.1):
+    """Zillow ``props`` entries shaped like propertyExtendedSearch results.
+
+    About ``hit_rate`` of them are at an address from ``watch_addresses``,
+    written the way Zillow writes them (mixed case, city, state and zip).
+    A fifth give their lot size in acres.
+    """
+    min_x, min_y, max_x, max_y = BOUNDS
+    listings = []
+    for index, address in enumerate(make_addresses(count, rng)):
+        if watch_addresses and rng.random() < hit_rate:
+            address = rng.choice(watch_addresses)
+        zpid = str(40000000 + index)
+        acres = rng.random() < 0.2
+        listings.append({
+            'zpid': zpid,
+            'address': ' '.join(word.capitalize() for word in address.split()) + rng.choice(CITIES),
+            'detailUrl': f"/homedetails/{zpid}_zpid/",
+            'imgSrc': f"https://photos.zillowstatic.com/fp/{zpid}-p_e.jpg",
+            'price': rng.randint(100000, 2000000),
+            'lotAreaValue': round(rng.uniform(0.05, 1.5), 4) if acres else rng.randint(2000, 20000),
+            'lotAreaUnit': 'acres' if acres else 'sqft',
+            'livingArea': rng.randint(600, 5000),
+            'bedrooms': rng.randint(1, 6),
+            'bathrooms': rng.randint(1, 4),
+            'propertyType': rng.choice(['SINGLE_FAMILY', 'MULTI_FAMILY', 'CONDO', 'TOWNHOUSE']),
+            'listingStatus': 'FOR_SALE',
+            'daysOnZillow': rng.randint(0, 1),
+            'latitude': rng.uniform(min_y, max_y),
+            'longitude': rng.uniform(min_x, max_x),
+        })
+    return listings
+
+
+def make_watchlist_csvs(directory, count, rng):
+    """Write NTM and health office watchlist CSVs of ``count`` rows each.
+
+    Returns both paths and both address lists.
+    """
+    ntm, health = make_addresses(count, rng), make_addresses(count, rng)
+    ntm_csv = os.path.join(directory, watchlist.NTM_CSV)
+    health_csv = os.path.join(directory, watchlist.HEALTH_CSV)
+    pd.DataFrame({'Address': ntm}).to_csv(ntm_csv, index=False)
+    pd.DataFrame({'Address': health, 'Zone_Class': [rng.choice(ZONES) for _ in health]}).to_csv(health_csv, index=False)
+    return ntm_csv, health_csv, ntm, health
+
+
+def measure(prepare, repeat=1, memory=True):
+    """Best wall time of ``repeat`` runs, plus the peak traced memory of one more.
+
+    ``prepare`` sets up a run outside the clock and returns the call to
+    measure. Memory is traced in a separate run since tracing slows
+    Python down several times over.
+    """
+    seconds = min(timed(prepare())[1] for _ in range(repeat))
+    peak_mb = None
+    if memory:
+        run = prepare()
+        tracemalloc.start()
+        try:
+            run()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return {'seconds': seconds, 'peak_mb': peak_mb}
+
+
+def make_scans(listings, page_size=41):
+    """Two overlapping location searches over ``listings``, as scan result pages.
+
+    The citywide search applies every rule and finds all of them; a
+    downtown search applies the health rule and finds every third listing
+    again. Returns the scans and their ``(scan index, page, props)`` pages.
+    """
+    scans = [
+        {'name': 'citywide', 'rules': frozenset({'ntm', 'health'})},
+        {'name': 'downtown', 'rules': frozenset({'health'})},
+    ]
+    pages = []
+    for index, found in enumerate((listings, listings[::3])):
+        for page, start in enumerate(range(0, len(found), page_size), 1):
+            pages.append((index, page, found[start:start + page_size]))
+    return scans, pages
+
+
+def suite_stages(directory, size, rng, airtable):
+    """The monitor's stages over ``size`` listings and watchlist rows, in run order.
+
+    ``airtable`` is the FakeAirtableServer the Airtable sync writes to.
+    """
+    ntm_csv, health_csv, ntm, health = make_watchlist_csvs(directory, size, rng)
+    rules_path = os.path.join(directory, RULES_FILE)
+    with open(rules_path, 'w') as f:
+        json.dump([
+            {'name': 'ntm', 'csv': ntm_csv, 'match': 'key', 'template': 'ntm'},
+            {'name': 'health', 'csv': health_csv, 'match': 'core', 'template': 'health',
+             'exclude_zones': watchlist.HEALTH_EXCLUSION_ZONES},
+        ], f)
+    rules = load_rules(rules_path)
+    cache_dir = os.path.join(directory, 'cache')
+
+    scans, pages = make_scans(make_listings(size, rng, ntm + health))
+    deduper = ScanDeduper(scans)
+    listings = deduper.collect(pages)
+    entry_rules = [deduper.granted[listing_key(entry)] for entry in listings]
+    matches = restrict_matches(load_rule_engine(rules, cache_dir).evaluate(build_listing_frame(listings)), entry_rules)
+    ntm_matches = COLLECTORS['ntm'](matches['ntm'])
+    health_matches = COLLECTORS['health'](matches['health'])
+
+    def fresh_process():
+        # Each run is a new process that loads the compiled watchlists from disk
+        watchlist._loaded.clear()
+
+    def open_store(recorded):
+        path = os.path.join(directory, 'listings.db')
+        if os.path.exists(path):
+            os.remove(path)
+        store = ListingStore(path)
+        store.record(recorded)
+        return store
+
+    def changed():
+        # Half the listings were seen by an earlier run, a tenth of those at
+        # another price
+        seen = [
+            {**entry, 'price': entry['price'] + 1000} if i % 10 == 0 else entry
+            for i, entry in enumerate(listings[::2])
+        ]
+        store = open_store(seen)
+        return lambda: (store.changed(listings), store.close())
+
+    def match():
+        fresh_process()
+        return lambda: restrict_matches(
+            load_rule_engine(rules, cache_dir).evaluate(build_listing_frame(listings)), entry_rules
+        )
+
+    def record_listings():
+        store = open_store(listings[::2])
+        return lambda: (store.record(listings), store.close())
+
+    def save_stats():
+        path = os.path.join(directory, 'stats.db')
+        if os.path.exists(path):
+            os.remove(path)
+        stats = StatsStore(path)
+        return lambda: (save_daily_stats(stats, size, {'ntm': ntm_matches, 'health': health_matches}), stats.close())
+
+    def airtable_sync():
+        # Half the matches are in the table already. Airtable's own rate
+        # limit is lifted: the stage measures the lookup, dedup and batching.
+        airtable.records = [
+            {'id': f'rec{i}', 'fields': {'Name': p['address'].capitalize()}} for i, p in enumerate(ntm_matches[::2])
+        ]
+        return lambda: update_NTMairtable(ntm_matches, airtable.api_url(), 'base', 'Properties', 'token', rate=1e6)
+
+    return {
+        'compile_watchlists': lambda: lambda: load_rule_engine(rules, cache_dir, rebuild=True),
+        'dedup_scans': lambda: lambda: ScanDeduper(scans).collect(pages),
+        'changed_listings': changed,
+        'match': match,
+        'render_ntm_email': lambda: lambda: render_match_email(render_NTMmatches(ntm_matches), NTM_CHEAT_SHEET),
+        'render_health_email': lambda: lambda: render_match_email(render_Health_matches(health_matches)),
+        'update_NTMairtable': airtable_sync,
+        'save_daily_stats': save_stats,
+        'record_listings': record_listings,
+    }, len(ntm_matches), len(health_matches)
+
+
+def bench_suite(sizes=SUITE_SIZES, repeat=1, memory=True, stages=None, seed=0):
+    """Time and peak memory of each monitor stage at each size.
+
+    Runs in a scratch directory so the generated CSVs and their compiled
+    cache never touch the real ones. Returns ``{size: {stage: result}}``.
+    """
+    # update_NTMairtable logs every record it writes
+    logging.getLogger().setLevel(logging.WARNING)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='monitor-bench-')
+    results = {}
+    try:
+        os.chdir(workdir)
+        for size in sizes:
+            directory = os.path.join(workdir, str(size))
+            os.makedirs(directory)
+            with FakeAirtableServer() as airtable:
+                suite, ntm_count, health_count = suite_stages(directory, size, random.Random(seed), airtable)
+                print(f"{size:,} listings and watchlist rows: {ntm_count:,} NTM and {health_count:,} health matches")
+                results[str(size)] = {}
+                for name, prepare in suite.items():
+                    if stages and name not in stages:
+                        continue
+                    results[str(size)][name] = measure(prepare, repeat, memory)
+                    print(f"  {name:<24} {format_result(results[str(size)][name])}", flush=True)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_result(result):
+    peak = f"{result['peak_mb']:>9.1f} MB" if result['peak_mb'] is not None else ''
+    return f"{result['seconds']:>9.3f} s {peak}"
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    with open(path, 'w') as f:
+        json.dump({
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2)
+
+
+def compare_baseline(results, path=BASELINE_FILE, tolerance=REGRESSION_TOLERANCE):
+    """Print each stage against the baseline and return the regressions found."""
+    with open(path, 'r') as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    print(f"{'size':>9} {'stage':<24} {'time':>8} {'memory':>8}")
+    for size, stages in results.items():
+        for name, result in stages.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            changes = []
+            for field, floor in (('seconds', NOISE_SECONDS), ('peak_mb', NOISE_MB)):
+                if result[field] is None or not before.get(field):
+                    changes.append('')
+                    continue
+                ratio = result[field] / before[field]
+                changes.append(f"{ratio:.2f}x")
+                if ratio > tolerance and result[field] > floor:
+                    regressions.append(f"{name} at {int(size):,}: {field} {before[field]:.3f} -> {result[field]:.3f}")
+            print(f"{int(size):>9,} {name:<24} {changes[0]:>8} {changes[1]:>8}")
+    return regressions
+
+
+def bench_render(matches, seed=0):
+    """Email rendering of a large match list."""
+    properties = make_properties(matches, random.Random(seed))
+    print(f"{matches:,} matches")
+    print(f"{'template':<10} {'render (s)':>11} {'us/match':>9} {'html (MB)':>10}")
+    for name, render in (('ntm', render_NTMmatches), ('health', render_Health_matches)):
+        html, elapsed = timed(lambda: render_match_email(render(properties)))
+        print(f"{name:<10} {elapsed:>11.3f} {elapsed / matches * 1e6:>9.2f} {len(html) / 1e6:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Matcher benchmarks on synthetic data')
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    spatial = sub.add_parser('spatial', help='point-in-polygon vs address matching')
+    spatial.add_argument('--listings', type=int, default=100000)
+    spatial.add_argument('--watchlist', type=int, default=13000)
+    spatial.add_argument('--polygons', type=int, default=2000)
+
+    fuzzy = sub.add_parser('fuzzy', help='blocked fuzzy address matching')
+    fuzzy.add_argument('--listings', type=int, default=100000)
+    fuzzy.add_argument('--watchlist', type=int, default=13000)
+    fuzzy.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    render = sub.add_parser('render', help='email rendering of a large match list')
+    render.add_argument('--matches', type=int, default=10000)
+
+    suite = sub.add_parser('suite', help='time and peak memory of every monitor stage, against a baseline')
+    suite.add_argument(
+        '--sizes', type=lambda value: [int(size) for size in value.split(',')], default=list(SUITE_SIZES),
+        help='comma-separated listing and watchlist row counts, e.g. 1000,10000,100000,1000000'
+    )
+    suite.add_argument('--stages', help='comma-separated stages to run (default: all)')
+    suite.add_argument('--repeat', type=int, default=3, help='timed runs per stage; the best one counts')
+    suite.add_argument('--no-memory', action='store_true', help='skip the traced run that measures peak memory')
+    suite.add_argument('--baseline', default=BASELINE_FILE)
+    suite.add_argument('--save', action='store_true', help='save these results as the new baseline')
+    suite.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+
+    args = parser.parse_args()
+    if args.benchmark == 'spatial':
+        bench_spatial(args.listings, args.watchlist, args.polygons)
+    elif args.benchmark == 'fuzzy':
+        bench_fuzzy(args.listings, args.watchlist, args.workers)
+    elif args.benchmark == 'render':
+        bench_render(args.matches)
+    elif args.benchmark == 'suite':
+        results = bench_suite(
+            args.sizes, args.repeat, not args.no_memory, args.stages.split(',') if args.stages else None
+        )
+        if args.save:
+            save_baseline(results, args.baseline)
+            print(f"Baseline saved to {args.baseline}")
+        elif os.path.exists(args.baseline):
+            regressions = compare_baseline(results, args.baseline, args.tolerance)
+            if regressions:
+                print('Regressions:\n  ' + '\n  '.join(regressions))
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
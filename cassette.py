@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import urllib.parse
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Response headers kept in a cassette. Retry-After and quota headers are
+# left out so a replay runs as fast as the disk allows instead of waiting
+# out the original run's throttling.
+KEPT_HEADERS = ('Content-Type',)
+
+
+class CassetteMiss(requests.RequestException):
+    # Not a ConnectionError, so clients fail at once instead of retrying
+    pass
+
+
+def request_key(method, url, body=None):
+    """Identify a request by method, URL and sorted query, plus a body digest.
+
+    Headers are left out, so API keys never reach the cassette and a replay
+    does not need them.
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{method} {parts.scheme}://{parts.netloc}{parts.path}?{query}"
+    if body:
+        key += ' ' + hashlib.sha1(body if isinstance(body, bytes) else body.encode()).hexdigest()
+    return key
+
+
+class Cassette:
+    """Gzipped JSON-lines file of recorded HTTP interactions.
+
+    In ``record`` mode every response is appended as it arrives; in
+    ``replay`` mode identical requests get their recorded responses back in
+    the order they were recorded, the last one repeating.
+    """
+
+    def __init__(self, path, mode):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f'Unknown cassette mode {mode}')
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.interactions = {}
+        self._served = {}
+        if mode == 'record':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self._file = None
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    interaction = json.loads(line)
+                    self.interactions.setdefault(interaction['key'], []).append(interaction)
+
+    def __len__(self):
+        return sum(len(recorded) for recorded in self.interactions.values())
+
+    def record(self, request, response):
+        interaction = {
+            'key': request_key(request.method, request.url, request.body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            'body': response.content.decode('utf-8', errors='replace'),
+        }
+        with self._lock:
+            self.interactions.setdefault(interaction['key'], []).append(interaction)
+            self._file.write(json.dumps(interaction) + '\n')
+
+    def lookup(self, request):
+        key = request_key(request.method, request.url, request.body)
+        with self._lock:
+            recorded = self.interactions.get(key)
+            if not recorded:
+                raise CassetteMiss(f'No recorded response for {key} in {self.path}')
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+        return recorded[min(served, len(recorded) - 1)]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def adapter(self, pool_size=10):
+        if self.mode == 'record':
+            return RecordingAdapter(self, pool_connections=pool_size, pool_maxsize=pool_size)
+        return ReplayAdapter(self)
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        self.cassette.record(request, response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        interaction = self.cassette.lookup(request)
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.reason = interaction.get('reason')
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response._content = interaction['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class LocalSink:
+    """Stands in for SendGrid and Airtable during replays.
+
+    Emails and Airtable syncs are appended to JSON-lines files in
+    ``directory`` instead of leaving the machine.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _append(self, name, record):
+        with self._lock:
+            with open(os.path.join(self.directory, name), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def send(self, subject, recipients, html):
+        # Same call as Mailer.send
+        self._append('emails.jsonl', {'subject': subject, 'recipients': recipients, 'html': html})
+        response = requests.Response()
+        response.status_code = 202
+        return response
+
+    def deliver_email(self, payload):
+        self.send(payload['subject'], payload['recipients'], payload['html'])
+
+    def deliver_airtable(self, payload):
+        self._append('airtable.jsonl', payload)
@@ -0,0 +1,26 @@
+import os
+import shutil
+import pytest
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch copy of the watchlists to run ``main.main`` in.
+
+    Notifications, live ones included, are written under ``live/`` instead
+    of being sent, so runs can be inspected and compared.
+    """
+    import main
+    from cassette import LocalSink
+
+    for name in ('NTMaddresses.csv', 'HealthOfficeAddresses.csv', 'watchlists.json'):
+        shutil.copy(os.path.join(REPO, name), tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+
+    live = LocalSink(str(tmp_path / 'live'))
+    handlers = main.notification_handlers
+    monkeypatch.setattr(main, 'notification_handlers', lambda rules, sink=None: handlers(rules, sink or live))
+    monkeypatch.setattr(main, 'MAILER', live)
+    return tmp_path
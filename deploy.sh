@@ -2,12 +2,14 @@
 # Deployment script for stpete-ntm-crt-property-monitor
 # Target: Debian 12 VPS on Vultr
 # Usage: scp this script to your VPS and run: bash deploy.sh
+#        MODE=daemon bash deploy.sh  runs the monitor as a polling systemd service instead of a daily cron job
 
 set -e
 
 APP_DIR="/opt/stpete-monitor"
 REPO="https://github.com/grbod/stpete-ntm-crt-property-monitor.git"
 USER="monitor"
+MODE="${MODE:-cron}"
 
 echo "=== St Pete Property Monitor - VPS Deployment ==="
 
@@ -38,6 +40,8 @@ echo "[4/7] Setting up Python environment..."
 python3 -m venv "$APP_DIR/venv"
 "$APP_DIR/venv/bin/pip" install --quiet --upgrade pip
 "$APP_DIR/venv/bin/pip" install --quiet -r "$APP_DIR/requirements.txt"
+echo "  Prebuilding compiled watchlists..."
+(cd "$APP_DIR" && "$APP_DIR/venv/bin/python" watchlist.py build --force)
 
 # 5. Prompt for .env if it doesn't exist
 echo "[5/7] Checking .env file..."
@@ -66,7 +70,32 @@ echo "[6/7] Setting permissions..."
 chown -R $USER:$USER "$APP_DIR"
 chmod 600 "$APP_DIR/.env"
 
-# 7. Set up cron job (8am ET daily)
+# 7. Set up cron job (8am ET daily), or the polling daemon
+if [ "$MODE" = "daemon" ]; then
+echo "[7/7] Setting up daemon service..."
+rm -f /etc/cron.d/stpete-monitor
+cat > /etc/systemd/system/stpete-monitor.service << 'UNIT'
+[Unit]
+Description=St Pete Property Monitor
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+User=monitor
+WorkingDirectory=/opt/stpete-monitor
+ExecStart=/opt/stpete-monitor/venv/bin/python /opt/stpete-monitor/main.py --daemon
+# SIGTERM lets the poll in progress finish
+KillSignal=SIGTERM
+TimeoutStopSec=300
+Restart=on-failure
+RestartSec=60
+
+[Install]
+WantedBy=multi-user.target
+UNIT
+systemctl daemon-reload
+systemctl enable --now stpete-monitor
+else
 echo "[7/7] Setting up cron schedule..."
 CRON_FILE="/etc/cron.d/stpete-monitor"
 cat > "$CRON_FILE" << 'CRON'
@@ -79,13 +108,18 @@ MAILTO=root
 0 13 * * * monitor cd /opt/stpete-monitor && /opt/stpete-monitor/venv/bin/python /opt/stpete-monitor/main.py >> /opt/stpete-monitor/cron.log 2>&1
 CRON
 chmod 644 "$CRON_FILE"
+fi
 
 echo ""
 echo "=== Deployment complete ==="
 echo ""
 echo "  App directory:  $APP_DIR"
 echo "  Python venv:    $APP_DIR/venv"
+if [ "$MODE" = "daemon" ]; then
+echo "  Service:        stpete-monitor (polls every POLL_INTERVAL seconds, default 900)"
+else
 echo "  Cron schedule:  8:00 AM ET daily"
+fi
 echo "  Cron log:       $APP_DIR/cron.log"
 echo "  App log:        $APP_DIR/property_matches.log"
 echo ""
@@ -0,0 +1,195 @@
+from address import capitalize_address
+from metrics import METRICS
+
+# Templates are compiled once, at import, to bound str.format calls.
+# Renderers format each piece into a list and join it once at the end.
+
+NTM_MATCH = (
+    "<p><a href='{detailUrl}'>{title}</a></p>"
+    "{confidence}"
+    "<p>Price: ${price:,}, Lot Size: {lot_area}, Living Area: {livingArea:,} SF<br>Land Price/SF: ${lot_price_per_sf:,}/SF</p>"
+    "<img src='{imgSrc}' alt='Property Image' style='width:200px; height:200px;'><br>"
+    "<p><a href='{ntm_map_url}'>NTM Map</a> | <a href='{zoning_map_url}'>Zoning Map</a></p><br><br>"
+).format
+
+# Lot size coloured by how many NTM-1 units it allows
+LOT_AREA = {
+    5: "<span style='color:green;'>{:,} SF</span>".format,
+    4: "<span style='color:orange;'>{:,} SF</span>".format,
+}
+PLAIN_LOT_AREA = "{:,} SF".format
+
+HEALTH_MATCH = (
+    "<p><a href='{detailUrl}'>{title}</a></p>"
+    "{confidence}"
+    "<img src='{imgSrc}' alt='Property Image' style='width:200px; height:200px;'>"
+    "<p>Price: ${price:,} (${price_per_sf:,}/SF)<br>Floor Area: {livingArea:,} SF, Lot Size: {lotAreaValue:,} SF<br>Zone: {zone_class}</p>"
+    "<p><a href='{zoning_map_url}'>Zoning Map</a></p><br><br>"
+).format
+
+CONFIDENCE = "<p style='color:gray;'>Fuzzy address match, {:.0%} confidence</p>".format
+TOTAL = "<p>Total Matches Found: {}</p>".format
+
+MATCH_EMAIL = '''
+            <h2>Matching Properties</h2>
+            <p>Here are the matching properties found:</p>
+            {results}
+            <p>Thank you!</p>
+            <hr>{footer}
+        '''.format
+
+ERROR_EMAIL = '''
+            <h2>Property Monitor Script Error</h2>
+            <p>The property monitoring script encountered an error:</p>
+            <pre>{error}</pre>
+            <p>Please check the logs for details.</p>
+        '''.format
+
+WEEKLY_SUMMARY = '''
+        <h2>Weekly Property Monitor Summary</h2>
+        <table border="1" cellpadding="5" cellspacing="0">
+            <tr><th>Date</th><th>Total Scanned</th>{headers}</tr>
+            {rows}
+        </table>
+        {zero_match_note}
+        {match_recap}
+    '''.format
+WEEKLY_HEADER = "<th>{} Matches</th>".format
+WEEKLY_ROW = "<tr><td>{}</td><td>{}</td>{}</tr>".format
+WEEKLY_CELL = "<td>{}</td>".format
+# Column and recap headings of the rules the weekly summary knows; any
+# other rule is headed by its own name
+WEEKLY_LABELS = {'ntm': ('NTM', 'NTM-1'), 'health': ('Health', 'Medical Office')}
+WEEKLY_LINK = "<li>{} — {} — <a href='{}'>Zillow</a></li>".format
+
+NTM_CHEAT_SHEET = '''
+            <h3>Cheat Sheet:</h3>
+            <ul>
+                <li>Min Lot SF for 5 units: <span style='color:green;'>7260 SF</span></li>
+                <li>Min Lot SF for 4 units: <span style='color:orange;'>5810 SF</span></li>
+                <li>Search PCPAO: <a href="https://www.pcpao.gov/quick-search?qu=1">PCPAO Quick Search</a></li>
+                <li>Link to NTM ordinance: <a href="https://cms5.revize.com/revize/stpete/Business/Planning%20&%20Zoning/Land%20Development/Ord%20540-H.pdf">NTM Ordinance</a></li>
+                <li>City Zoning Map: <a href="https://egis.stpete.org/portal/apps/webappviewer/index.html?id=f0ff270cad0940a2879b38e955319dfa">City Zoning Map</a></li>
+                <li>NTM Zoning Map: <a href="https://egis.stpete.org/portal/apps/webappviewer/index.html?id=76797e9d8d8b4d20982cb1a2c77acd11">NTM Zoning Map</a></li>
+            </ul>
+'''
+
+
+def match_confidence(property):
+    # Fuzzy matches carry a similarity score below 1; show it so the reader
+    # knows to double-check the address
+    score = property.get('match_score', 1.0)
+    if score is None or score != score or score >= 1.0:
+        return ""
+    return CONFIDENCE(score)
+
+
+def render_NTMmatches(properties):
+    parts = [
+        NTM_MATCH(
+            **property,
+            title=property['address'].capitalize(),
+            confidence=match_confidence(property),
+            lot_area=LOT_AREA.get(property['lot_tier'], PLAIN_LOT_AREA)(property['lotAreaValue'])
+        )
+        for property in properties
+    ]
+    parts.append(TOTAL(len(properties)))
+    return ''.join(parts)
+
+
+def render_Health_matches(properties):
+    parts = [
+        HEALTH_MATCH(
+            **property,
+            title=capitalize_address(property['address']),
+            confidence=match_confidence(property)
+        )
+        for property in properties
+    ]
+    parts.append(TOTAL(len(properties)))
+    return ''.join(parts)
+
+
+def render_match_email(results, footer=''):
+    return MATCH_EMAIL(results=results, footer=footer)
+
+
+def render_error_email(error):
+    return ERROR_EMAIL(error=error)
+
+
+def render_weekly_summary(recent_stats):
+    # One column and one recap list per rule found in the stats, in the
+    # order the stats first list them
+    rules = {}
+    for day in recent_stats:
+        rules.update((key[:-len('_matches')], []) for key in day if key.endswith('_matches'))
+
+    rows = []
+    zero_match_days = []
+    for day in recent_stats:
+        counts = [day.get(f'{rule}_matches', 0) for rule in rules]
+        rows.append(WEEKLY_ROW(day['date'], day['total_scanned'], ''.join(WEEKLY_CELL(count) for count in counts)))
+        if not any(counts):
+            zero_match_days.append(day['date'])
+        for rule, links in rules.items():
+            for link in day.get(f'{rule}_links', []):
+                links.append(WEEKLY_LINK(day['date'], capitalize_address(link['address']), link['url']))
+
+    zero_match_note = f"<p>Days with 0 matches: {', '.join(zero_match_days)}</p>" if zero_match_days else ""
+
+    # Match recap links
+    recap = []
+    if any(rules.values()):
+        recap.append("<hr><h3>All Matches This Week</h3>")
+        for rule, links in rules.items():
+            if links:
+                recap.extend((f"<h4>{WEEKLY_LABELS.get(rule, (rule, rule))[1]} Matches</h4><ul>", *links, "</ul>"))
+
+    headers = ''.join(WEEKLY_HEADER(WEEKLY_LABELS.get(rule, (rule, rule))[0]) for rule in rules)
+    return WEEKLY_SUMMARY(
+        headers=headers, rows=''.join(rows), zero_match_note=zero_match_note, match_recap=''.join(recap)
+    )
+
+
+# Renderer and email footer for each rule template
+RENDERERS = {
+    'ntm': (render_NTMmatches, NTM_CHEAT_SHEET),
+    'health': (render_Health_matches, ''),
+}
+
+
+class Mailer:
+    """Sends every email of a run through one SendGrid client.
+
+    The client is created on the first send, so runs without matches never
+    build one.
+    """
+
+    def __init__(self, api_key, sender, host=None):
+        self.api_key = api_key
+        self.sender = sender
+        self.host = host
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # sendgrid is imported here so runs that send nothing never load it
+            from sendgrid import SendGridAPIClient
+
+            if self.host:
+                self._client = SendGridAPIClient(self.api_key, host=self.host)
+            else:
+                self._client = SendGridAPIClient(self.api_key)
+        return self._client
+
+    def send(self, subject, recipients, html):
+        from sendgrid.helpers.mail import Mail
+
+        message = Mail(from_email=self.sender, to_emails=recipients, subject=subject, html_content=html)
+        with METRICS.timed('api_request_seconds', service='SendGrid'):
+            response = self.client.send(message)
+        METRICS.inc('api_requests', service='SendGrid', status=response.status_code)
+        return response
@@ -0,0 +1,104 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from address import DIRECTIONALS
+
+DEFAULT_MIN_SCORE = 0.85
+
+# Street-name characters that must agree for two addresses to be compared
+BLOCK_PREFIX = 2
+
+# Batches smaller than this are scored in-process; process start-up and
+# shipping the index to workers would cost more than it saves
+SHARD_THRESHOLD = 20000
+SHARD_SIZE = 5000
+
+_DIRECTIONAL_TOKENS = frozenset(DIRECTIONALS.values())
+
+
+def block_key(key):
+    # House number plus the start of the street name
+    tokens = key.split()
+    if len(tokens) < 2 or not tokens[0][:1].isdigit():
+        return None
+    return tokens[0], tokens[1][:BLOCK_PREFIX]
+
+
+def _split(key):
+    tokens = key.split()
+    directionals = frozenset(token for token in tokens[1:] if token in _DIRECTIONAL_TOKENS)
+    street = ' '.join(token for token in tokens[1:] if token not in _DIRECTIONAL_TOKENS)
+    return directionals, street
+
+
+def similarity(a, b):
+    """Score two canonical keys that share a block, from 0 to 1.
+
+    Directionals must agree when both sides have one (123 MAIN ST N is not
+    123 MAIN ST S); the rest of the street line is scored by edit similarity.
+    """
+    if a == b:
+        return 1.0
+    directionals_a, street_a = _split(a)
+    directionals_b, street_b = _split(b)
+    if directionals_a and directionals_b and directionals_a != directionals_b:
+        return 0.0
+    return SequenceMatcher(None, street_a, street_b).ratio()
+
+
+class FuzzyIndex:
+    """Watchlist keys grouped into blocks for approximate matching.
+
+    ``entries`` are (canonical key, rule index, zone) triples; ``min_scores``
+    gives each rule's acceptance threshold.
+    """
+
+    def __init__(self, entries, min_scores):
+        self.min_scores = dict(min_scores)
+        self.blocks = {}
+        for key, rule_index, zone in entries:
+            block = block_key(key)
+            if block is not None:
+                self.blocks.setdefault(block, {}).setdefault(key, []).append((rule_index, zone))
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.blocks.values())
+
+    def match(self, key):
+        """Return (rule index, zone, score) for the best candidate of each rule."""
+        candidates = self.blocks.get(block_key(key))
+        if not candidates:
+            return ()
+        best = {}
+        for candidate, owners in candidates.items():
+            score = similarity(key, candidate)
+            for rule_index, zone in owners:
+                if score >= self.min_scores[rule_index] and score > best.get(rule_index, (None, -1))[1]:
+                    best[rule_index] = (zone, score)
+        return tuple((rule_index, zone, score) for rule_index, (zone, score) in best.items())
+
+    def match_many(self, keys, workers=None):
+        """Score a batch of keys, sharded across a process pool when it is large."""
+        keys = list(keys)
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(keys) < SHARD_THRESHOLD:
+            return [self.match(key) for key in keys]
+
+        shards = [keys[start:start + SHARD_SIZE] for start in range(0, len(keys), SHARD_SIZE)]
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+            for shard in executor.map(_match_shard, shards):
+                results.extend(shard)
+        return results
+
+
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _match_shard(keys):
+    return [_worker_index.match(key) for key in keys]
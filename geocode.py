@@ -0,0 +1,201 @@
+import json
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from arcgis_download import error_status, make_arcgis_client
+
+GEOCODE_CACHE_DB = 'geocode_cache.db'
+
+# Points closer than this (in spatial reference units; feet for 2882) share
+# one cached reverse geocode
+DEFAULT_TOLERANCE = 10.0
+
+WORLD_GEOCODER_URL = "https://geocode.arcgis.com/arcgis/rest/services/World/GeocodeServer"
+
+# How reverseGeocode explains the error it returns for a point with no address nearby
+NO_ADDRESS_DETAIL = 'Unable to find address'
+
+
+def ring_centroids(rings):
+    """Area-weighted centroids of many polygon rings at once.
+
+    ``rings`` is a list of vertex lists ``[[x, y], ...]``. Degenerate rings
+    with no area fall back to the mean of their vertices. Returns an
+    ``(n, 2)`` array.
+    """
+    lengths = np.array([len(ring) for ring in rings], dtype=np.int64)
+    result = np.full((len(rings), 2), np.nan)
+    if not lengths.sum():
+        return result
+
+    points = np.concatenate([np.asarray(ring, dtype=float)[:, :2] for ring in rings if len(ring)])
+    present = lengths > 0
+    starts = np.concatenate(([0], np.cumsum(lengths[present])[:-1]))
+    ends = starts + lengths[present]
+
+    # Index of the following vertex within the same ring, wrapping around
+    following = np.arange(len(points)) + 1
+    following[ends - 1] = starts
+
+    x, y = points[:, 0], points[:, 1]
+    nx, ny = x[following], y[following]
+    cross = x * ny - nx * y
+
+    area = np.add.reduceat(cross, starts) / 2.0
+    cx = np.add.reduceat((x + nx) * cross, starts)
+    cy = np.add.reduceat((y + ny) * cross, starts)
+    mean_x = np.add.reduceat(x, starts) / lengths[present]
+    mean_y = np.add.reduceat(y, starts) / lengths[present]
+
+    flat = np.isclose(area, 0.0)
+    safe_area = np.where(flat, 1.0, area)
+    result[present, 0] = np.where(flat, mean_x, cx / (6.0 * safe_area))
+    result[present, 1] = np.where(flat, mean_y, cy / (6.0 * safe_area))
+    return result
+
+
+class GeocodeCache:
+    """Persistent reverse-geocode results keyed by rounded coordinates."""
+
+    def __init__(self, path=GEOCODE_CACHE_DB, tolerance=DEFAULT_TOLERANCE):
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS reverse_geocode (
+                wkid INTEGER NOT NULL,
+                gx INTEGER NOT NULL,
+                gy INTEGER NOT NULL,
+                address TEXT,
+                PRIMARY KEY (wkid, gx, gy)
+            )'''
+        )
+        self.conn.commit()
+
+    def key(self, x, y, wkid):
+        return (int(wkid), int(round(x / self.tolerance)), int(round(y / self.tolerance)))
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self.conn.execute(
+                    'SELECT address FROM reverse_geocode WHERE wkid = ? AND gx = ? AND gy = ?', key
+                ).fetchone()
+                if row is not None:
+                    found[key] = row[0]
+        return found
+
+    def put(self, key, address):
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO reverse_geocode (wkid, gx, gy, address) VALUES (?, ?, ?, ?)',
+                (*key, address)
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def arcgis_backend():
+    # The arcgis package is heavy, so only import it when it is the backend
+    from arcgis.gis import GIS
+    from arcgis.geocoding import reverse_geocode
+
+    GIS()
+
+    def geocode(x, y, wkid):
+        result = reverse_geocode({'x': x, 'y': y, 'spatialReference': {'wkid': wkid}})
+        return result['address']['Match_addr']
+    return geocode
+
+
+def reverse_geocode_status(data):
+    # A point with no address nearby is answered with an error inside a 200.
+    # That is a real answer, worth caching; any other error is passed on as
+    # body_status, so transient ones are retried and the rest raise.
+    details = (data.get('error') or {}).get('details') or []
+    if any(NO_ADDRESS_DETAIL in detail for detail in details):
+        return None
+    return error_status(data)
+
+
+def rest_backend(geocoder_url=WORLD_GEOCODER_URL, client=None):
+    # Calls a GeocodeServer's reverseGeocode endpoint directly; point it at a
+    # local stub to run without the ArcGIS service
+    client = client or make_arcgis_client()
+
+    def geocode(x, y, wkid):
+        location = json.dumps({'x': x, 'y': y, 'spatialReference': {'wkid': wkid}})
+        data = client.get_json(
+            f"{geocoder_url}/reverseGeocode", body_status=reverse_geocode_status,
+            params={'location': location, 'f': 'json'}
+        )
+        if 'error' in data:
+            return None
+        return data['address']['Match_addr']
+    return geocode
+
+
+def reverse_geocode_points(points, backend, cache, wkid=2882, max_workers=8):
+    """Reverse geocode ``(x, y)`` points, one backend call per uncached cell.
+
+    Points that round to the same cache cell are geocoded once; cache misses
+    go through a bounded thread pool and are written back as they complete.
+    Returns one address (or None) per input point.
+    """
+    keys = [
+        cache.key(x, y, wkid) if not (np.isnan(x) or np.isnan(y)) else None
+        for x, y in points
+    ]
+    # First point seen for each cell is the one sent to the backend
+    cells = {}
+    for key, (x, y) in zip(keys, points):
+        if key is not None and key not in cells:
+            cells[key] = (float(x), float(y))
+
+    addresses = cache.get_many(cells)
+    misses = [key for key in cells if key not in addresses]
+    logging.info(f'Reverse geocoding {len(points)} points: {len(cells)} cells, {len(misses)} not cached')
+
+    def lookup(key):
+        x, y = cells[key]
+        try:
+            address = backend(x, y, wkid)
+        except Exception as e:
+            logging.error(f'Reverse geocode failed at {x}, {y}: {e}')
+            return key, None, False
+        return key, address, True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for key, address, ok in executor.map(lookup, misses):
+            addresses[key] = address
+            if ok:
+                cache.put(key, address)
+
+    return [addresses.get(key) if key is not None else None for key in keys]
+
+
+def geocode_shapes(shapes, backend, cache, wkid=2882, max_workers=8):
+    """Address each polygon by its ring centroids, "; "-joined per shape."""
+    shape_rings = [
+        [ring for ring in (shape['rings'] if shape else []) if ring]
+        for shape in shapes
+    ]
+    all_rings = [ring for rings in shape_rings for ring in rings]
+    centroids = ring_centroids(all_rings)
+    addresses = reverse_geocode_points(centroids.tolist(), backend, cache, wkid, max_workers)
+
+    results = []
+    position = 0
+    for shape, rings in zip(shapes, shape_rings):
+        if not shape:
+            results.append(None)
+            continue
+        ring_addresses = addresses[position:position + len(rings)]
+        position += len(rings)
+        results.append("; ".join(address for address in ring_addresses if address))
+    return results
@@ -0,0 +1,272 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import METRICS
+
+# Statuses worth retrying: throttling, timeouts and server-side failures.
+# Anything else (bad request, auth, not found) fails straight away.
+RETRYABLE_STATUSES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+# RapidAPI's quota headers: requests left in the current window and the
+# seconds until it resets
+RAPIDAPI_QUOTA_HEADERS = ('X-RateLimit-Requests-Remaining', 'X-RateLimit-Requests-Reset')
+
+# A quota only slows the token bucket once this few requests are left; above
+# it there is plenty for the configured rate, however long the window
+QUOTA_LOW_WATER = 50
+# Longest a quota makes the bucket wait for one token, or pause once it is
+# spent. RapidAPI plans reset monthly: better to fail on the next 429 than to
+# sleep for days.
+MAX_QUOTA_WAIT = 60.0
+
+
+# Cassette every new session records to or replays from (see cassette.py)
+_cassette = None
+
+
+def use_cassette(cassette):
+    global _cassette
+    _cassette = cassette
+
+
+def make_session(pool_size=10):
+    # One keep-alive connection pool shared by every request
+    session = requests.Session()
+    if _cassette is not None:
+        adapter = _cassette.adapter(pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    """Token bucket shared by every thread of a client.
+
+    Holds up to ``capacity`` tokens refilled at ``rate`` per second. When the
+    provider reports no more than ``low_water`` requests left, the rate is
+    lowered to spread them over the rest of the window; an exhausted quota
+    pauses the bucket until the window resets. Neither waits longer than
+    ``max_wait`` seconds at a time.
+    """
+
+    def __init__(self, rate, capacity=None, low_water=QUOTA_LOW_WATER, max_wait=MAX_QUOTA_WAIT):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.low_water = low_water
+        self.max_wait = max_wait
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate if self.rate else 1.0)
+            time.sleep(wait)
+
+    def paused_for(self):
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_quota(self, remaining, reset):
+        with self._lock:
+            self._refill(time.monotonic())
+            if remaining <= 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + min(reset, self.max_wait))
+                self.rate = self.base_rate
+                return
+            if remaining > self.low_water or reset <= 0:
+                self.rate = self.base_rate
+            else:
+                # Never faster than configured, never so fast the quota runs
+                # out before the window resets, never slower than a token
+                # every max_wait seconds
+                self.rate = min(self.base_rate, max(remaining / reset, 1.0 / self.max_wait))
+            self._tokens = min(self._tokens, remaining)
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while.
+
+    After ``threshold`` consecutive failures the circuit opens and calls fail
+    fast with CircuitOpenError; after ``reset_timeout`` seconds one trial
+    call is let through, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def before(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial):
+                raise CircuitOpenError(f'Circuit open after {self.failures} consecutive failures')
+            if state == 'half-open':
+                self._trial = True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+def retry_after(response):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+class HttpClient:
+    """Rate-limited, retrying HTTP client around a pooled session.
+
+    Every request waits for a token, is retried only for connection errors
+    and RETRYABLE_STATUSES with full-jitter exponential backoff (or the
+    server's Retry-After, when given), and goes through a circuit breaker so
+    a service that is down fails fast instead of being retried into the
+    ground. ``quota_headers`` names the (remaining, reset seconds) response
+    headers that steer the token bucket.
+    """
+
+    def __init__(self, session=None, rate=5.0, burst=None, max_retries=4, backoff=1.0, max_backoff=60.0,
+                 breaker=None, quota_headers=None, retry_statuses=RETRYABLE_STATUSES, name='http'):
+        self.session = session or make_session()
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.quota_headers = quota_headers
+        self.retry_statuses = retry_statuses
+        self.name = name
+
+    def _delay(self, attempt, response):
+        # The server's Retry-After, else the wait until an exhausted quota
+        # resets, else full jitter
+        delay = retry_after(response)
+        if delay is None:
+            delay = self.bucket.paused_for() or random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return delay
+
+    def _update_quota(self, response):
+        if not self.quota_headers:
+            return
+        remaining, reset = (response.headers.get(header) for header in self.quota_headers)
+        try:
+            self.bucket.update_quota(float(remaining), float(reset))
+        except (TypeError, ValueError):
+            pass
+
+    def _send(self, method, url, decode, body_status, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before()
+            self.bucket.acquire()
+            response = None
+            data = None
+            try:
+                with METRICS.timed('api_request_seconds', service=self.name):
+                    response = self.session.request(method, url, **kwargs)
+                self._update_quota(response)
+                status = response.status_code
+                if status < 400 and decode:
+                    data = response.json()
+                    if body_status is not None:
+                        status = body_status(data) or status
+            except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+                # ValueError: a truncated or non-JSON body, worth another try
+                error = e
+                status = None
+            else:
+                METRICS.inc('api_requests', service=self.name, status=status)
+                if status < 400:
+                    self.breaker.success()
+                    return response, data
+                error = requests.HTTPError(f'{status} error from {url}', response=response)
+                if status not in self.retry_statuses:
+                    # The service answered; it is the request that is wrong
+                    self.breaker.success()
+                    raise error
+
+            # Throttling is not a sign the service is down
+            if status != 429:
+                self.breaker.failure()
+            if status is None:
+                METRICS.inc('api_requests', service=self.name, status='error')
+            if attempt == self.max_retries:
+                raise error
+            METRICS.inc('api_retries', service=self.name)
+            delay = self._delay(attempt, response)
+            if status == 429:
+                self.bucket.pause(delay)
+            logging.warning(
+                f'{self.name} request attempt {attempt + 1} failed: {error}. Retrying in {delay:.1f}s...'
+            )
+            time.sleep(delay)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, returning the response or raising once retries are spent."""
+        return self._send(method, url, False, None, **kwargs)[0]
+
+    def get_json(self, url, body_status=None, **kwargs):
+        """GET and decode a JSON body, retrying bodies that do not decode.
+
+        ``body_status`` maps the decoded body to an error status for APIs
+        that report failures inside a 200, or returns None when it is fine.
+        """
+        return self._send('GET', url, True, body_status, **kwargs)[1]
+
+
+def make_client(pool_size=10, **kwargs):
+    if _cassette is not None and _cassette.mode == 'replay':
+        # Recorded responses come off disk: nothing to throttle or back off from
+        kwargs.update(rate=1e6, backoff=0)
+    return HttpClient(make_session(pool_size), **kwargs)
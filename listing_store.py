@@ -0,0 +1,105 @@
+import json
+import sqlite3
+from datetime import datetime
+
+DEFAULT_DB_PATH = 'listings.db'
+
+# SQLite caps the number of bound parameters per statement
+_CHUNK_SIZE = 500
+
+
+def listing_key(entry):
+    # zpid is the stable id; fall back to the detail URL for odd records
+    zpid = entry.get('zpid')
+    if zpid is not None and zpid != '':
+        return str(zpid)
+    return entry.get('detailUrl') or entry.get('address', '')
+
+
+class ListingStore:
+    """Local record of every listing seen, keyed by zpid.
+
+    Stores the last price and status seen for each listing together with the
+    raw API record, so a run can pick out only the listings that are new or
+    have changed since they were last processed.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS listings (
+                zpid TEXT PRIMARY KEY,
+                price INTEGER,
+                status TEXT,
+                address TEXT,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                raw TEXT
+            )'''
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def _known(self, keys):
+        known = {}
+        keys = list(keys)
+        for start in range(0, len(keys), _CHUNK_SIZE):
+            chunk = keys[start:start + _CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'SELECT zpid, price, status FROM listings WHERE zpid IN ({placeholders})', chunk
+            )
+            for zpid, price, status in rows:
+                known[zpid] = (price, status)
+        return known
+
+    def changed(self, listings):
+        """Return the listings that are new or whose price or status changed."""
+        latest = {}
+        for entry in listings:
+            latest[listing_key(entry)] = entry
+
+        known = self._known(latest)
+        return [
+            entry for key, entry in latest.items()
+            if known.get(key) != (entry.get('price'), entry.get('listingStatus'))
+        ]
+
+    def record(self, listings):
+        """Upsert the current price, status and raw record of each listing."""
+        now = datetime.now().isoformat(timespec='seconds')
+        self.conn.executemany(
+            '''INSERT INTO listings (zpid, price, status, address, first_seen, last_seen, raw)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(zpid) DO UPDATE SET
+                   price = excluded.price,
+                   status = excluded.status,
+                   address = excluded.address,
+                   last_seen = excluded.last_seen,
+                   raw = excluded.raw''',
+            (
+                (
+                    listing_key(entry),
+                    entry.get('price'),
+                    entry.get('listingStatus'),
+                    entry.get('address', ''),
+                    now,
+                    now,
+                    json.dumps(entry),
+                )
+                for entry in listings
+            )
+        )
+        self.conn.commit()
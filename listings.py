@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from address import canonical_address, core_address_key
+
+SQFT_PER_ACRE = 43560
+
+# Minimum lot sizes under NTM-1 for 5 and 4 units
+LOT_SF_5_UNITS = 7260
+LOT_SF_4_UNITS = 5810
+
+
+def _numeric(values):
+    # Missing or null numbers count as 0; keep integers as integers so they
+    # format the same way the raw API values did
+    column = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').fillna(0)
+    if len(column) and (column % 1 == 0).all():
+        return column.astype('int64')
+    return column
+
+
+def _text(values):
+    return pd.Series(values, dtype=object).fillna('').astype(str)
+
+
+def normalize_lot_areas(values, units):
+    """Lot areas in acres (or tiny sqft values, which are really acres) to whole square feet."""
+    value = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').fillna(0).astype(float).to_numpy()
+    unit = pd.Series(units, dtype=object).to_numpy()
+    in_acres = (unit == 'acres') | ((value > 0) & (value < 2))
+    return np.rint(np.where(in_acres, value * SQFT_PER_ACRE, value)).astype('int64')
+
+
+def _per_sf(price, area):
+    # int(round(price / area)), or 0 where there is no area to divide by
+    safe_area = np.where(area > 0, area, 1)
+    return np.where(area > 0, np.rint(price / safe_area), 0).astype('int64')
+
+
+def build_listing_frame(json_data):
+    """Parse the raw Zillow ``props`` once into typed columns.
+
+    Lot normalization, price per square foot and lot-size tiers are computed
+    here for the whole batch, and every matcher works off the resulting frame.
+    """
+    if isinstance(json_data, pd.DataFrame):
+        return json_data
+
+    json_data = list(json_data)
+
+    def field(name, default=None):
+        return [entry.get(name, default) for entry in json_data]
+
+    address = _text(field('address', '')).str.lower()
+    frame = pd.DataFrame({
+        'zpid': _text(field('zpid', '')),
+        'address': address,
+        'address_key': address.map(canonical_address),
+        'core_address': address.map(core_address_key),
+        'detailUrl': 'http://www.zillow.com' + _text(field('detailUrl', '')),
+        'price': _numeric(field('price', 0)),
+        'lotAreaValue': normalize_lot_areas(field('lotAreaValue', 0), field('lotAreaUnit', 'sqft')),
+        'livingArea': _numeric(field('livingArea', 0)),
+        'imgSrc': _text(field('imgSrc', '')),
+        'latitude': pd.to_numeric(pd.Series(field('latitude'), dtype=object), errors='coerce'),
+        'longitude': pd.to_numeric(pd.Series(field('longitude'), dtype=object), errors='coerce'),
+    })
+
+    lot_area = frame['lotAreaValue'].to_numpy()
+    frame['lot_price_per_sf'] = _per_sf(frame['price'].to_numpy(), lot_area)
+    frame['price_per_sf'] = _per_sf(frame['price'].to_numpy(), frame['livingArea'].to_numpy())
+
+    # Number of units the lot supports under NTM-1 (0 below both thresholds)
+    frame['lot_tier'] = np.select(
+        [lot_area >= LOT_SF_5_UNITS, lot_area >= LOT_SF_4_UNITS], [5, 4], default=0
+    )
+    return frame
+
+
+def listing_records(frame):
+    # Plain dicts with native Python values, for rendering and API payloads
+    return frame.to_dict('records')
+
+
+def concat_listing_frames(frames):
+    if not frames:
+        return build_listing_frame([])
+    return pd.concat(frames, ignore_index=True)
@@ -1,16 +1,28 @@
-import requests
-import json
-import pandas as pd
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from datetime import datetime, timedelta
-from airtable import Airtable
+import argparse
+import hashlib
+from datetime import datetime
 import logging
 import urllib.parse
-import time
 import os
+import shutil
+import signal
+import threading
+import time
 import traceback
 from dotenv import load_dotenv
+from emails import Mailer, RENDERERS, render_match_email, render_error_email, render_weekly_summary
+# listings, rules and watchlist pull in pandas; they are imported where they
+# are used so --help, error paths and other light invocations start fast
+from zillow import ZILLOW_URL, ZILLOW_HOST, make_zillow_client
+from scanner import SCANS_FILE, RequestBudget, ScanDeduper, iter_scan_pages, load_scans, restrict_matches
+from listing_store import ListingStore, listing_key
+from archive import ARCHIVE_DIR, NDJSONArchive, read_archive, run_archive_path, prune_archives
+from airtable_sync import AIRTABLE_API_URL, AIRTABLE_BATCH_SIZE, AIRTABLE_RATE, AirtableClient
+from outbox import OUTBOX_DB, Outbox, OutboxDispatcher
+from stats_store import STATS_DB, StatsStore, date_range
+from cassette import Cassette, LocalSink
+from http_client import use_cassette
+from metrics import METRICS, METRICS_TEXTFILE, RUN_REPORT, profiled
 
 load_dotenv()
 
@@ -19,10 +31,45 @@ RAPIDAPI_KEY = os.getenv('RAPIDAPI_KEY')
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
 RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
-RECIPIENT_EMAILS = [e.strip() for e in os.getenv('RECIPIENT_EMAILS', '').split(',') if e.strip()]
 AIRTABLE_BASE_ID = os.getenv('AIRTABLE_BASE_ID')
 AIRTABLE_TABLE_NAME = os.getenv('AIRTABLE_TABLE_NAME')
 AIRTABLE_ACCESS_TOKEN = os.getenv('AIRTABLE_ACCESS_TOKEN')
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '4'))
+LISTING_DB = os.getenv('LISTING_DB', 'listings.db')
+RULES_FILE = os.getenv('RULES_FILE', 'watchlists.json')
+SCANS_FILE = os.getenv('SCANS_FILE', SCANS_FILE)
+# Most Zillow requests one run may make across all location searches
+FETCH_BUDGET = int(os.getenv('FETCH_BUDGET')) if os.getenv('FETCH_BUDGET') else None
+OUTBOX_DB = os.getenv('OUTBOX_DB', OUTBOX_DB)
+STATS_DB = os.getenv('STATS_DB', STATS_DB)
+# How long a run waits at exit for queued notifications; the rest go out on
+# the next run. Deliveries that succeed finish well within it, but a failing
+# one keeps the run waiting for its retries (5s, then 30s) until the timeout,
+# so every run, and every daemon poll, can take this much longer.
+OUTBOX_TIMEOUT = float(os.getenv('OUTBOX_TIMEOUT', '30'))
+# Where a --replay run keeps its state and the emails and Airtable records
+# it would have sent; wiped at the start of every replay
+REPLAY_DIR = os.getenv('REPLAY_DIR', 'replay_out')
+# Each run's JSON report and Prometheus textfile; point METRICS_TEXTFILE into
+# node_exporter's --collector.textfile.directory to scrape it
+RUN_REPORT = os.getenv('RUN_REPORT', RUN_REPORT)
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', METRICS_TEXTFILE)
+# Seconds between polls in --daemon mode
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '900'))
+# How often an idle daemon checks the watchlists for edits, in seconds
+WATCH_INTERVAL = 5
+# A daemon emails a failure the first time it happens, then again only if
+# it is still failing this many seconds later; a poll that succeeds resets it
+ERROR_EMAIL_INTERVAL = float(os.getenv('ERROR_EMAIL_INTERVAL', '3600'))
+
+# One mail client for the whole run
+MAILER = Mailer(SENDGRID_API_KEY, SENDER_EMAIL, host=os.getenv('SENDGRID_HOST'))
+
+# Outbox items delivered per second for each destination
+NOTIFY_RATES = {'email': 5, 'airtable': 1}
+
+# Matched-property fields the Airtable sync needs
+AIRTABLE_FIELDS = ('address', 'detailUrl', 'lotAreaValue', 'price', 'imgSrc', 'ntm_map_url', 'zoning_map_url')
 
 # Set up logging configuration
 logging.basicConfig(
@@ -33,428 +80,484 @@ logging.basicConfig(
 )
 
 
-def normalize_lot_area(entry):
-    value = entry.get("lotAreaValue", 0) or 0
-    unit = entry.get("lotAreaUnit", "sqft")
-    if unit == "acres" or (value > 0 and value < 2):
-        value = value * 43560
-    return round(value)
+ZILLOW_QUERY = {
+    "location": "st petersburg, fl",
+    "page": "1",
+    "status_type": "ForSale",
+    "home_type": "Houses, Apartments, Multi-Family",
+    "daysOn": "1"
+}
 
 
-# Function to get property data from Zillow API
-def get_property_data():
-    url = "https://us-housing-market-data1.p.rapidapi.com/propertyExtendedSearch"
-    querystring = {
-        "location": "st petersburg, fl",
-        "page": "1",
-        "status_type": "ForSale",
-        "home_type": "Houses, Apartments, Multi-Family",
-        "daysOn": "1"
-    }
-    headers = {
+def zillow_headers():
+    return {
         "x-rapidapi-key": RAPIDAPI_KEY,
-        "x-rapidapi-host": "us-housing-market-data1.p.rapidapi.com"
+        "x-rapidapi-host": ZILLOW_HOST
     }
 
-    def fetch_page(page_num):
-        delays = [5, 10, 20]
-        params = {**querystring, "page": str(page_num)}
-        for attempt in range(3):
-            try:
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, json.JSONDecodeError) as e:
-                if attempt < 2:
-                    logging.warning(f'Page {page_num} attempt {attempt + 1} failed: {e}. Retrying in {delays[attempt]}s...')
-                    time.sleep(delays[attempt])
-                else:
-                    raise RuntimeError(f'Failed to fetch page {page_num} after 3 attempts: {e}')
-
-    data = fetch_page(1)
-    total_pages = data.get('totalPages', 1)
-
-    all_properties = data.get('props', [])
-    for page in range(2, total_pages + 1):
-        page_data = fetch_page(page)
-        all_properties.extend(page_data.get('props', []))
-
-    # Save the JSON data with today's date
-    today_date = datetime.now().strftime("%Y-%m-%d")
-    with open(f'all_property_data_{today_date}.json', 'w') as json_file:
-        json.dump(all_properties, json_file)
-
-    return all_properties
-
-# Function to compare addresses and generate results string with additional URLs
-def compare_NTMaddresses(json_data, csv_file_path):
-    json_addresses = [
-        {
-            "address": entry.get("address", "").lower(),
-            "detailUrl": "http://www.zillow.com" + entry.get("detailUrl", ""),
-            "price": entry.get("price", 0),
-            "lotAreaValue": normalize_lot_area(entry),
-            "livingArea": entry.get("livingArea", 0),
-            "imgSrc": entry.get("imgSrc", "")
-        }
-        for entry in json_data
-    ]
 
-    csv_addresses_df = pd.read_csv(csv_file_path)
-    csv_addresses_df['Address'] = csv_addresses_df['Address'].str.lower()
+def scan_property_data(scans, max_workers=1, url=ZILLOW_URL, client=None):
+    """Run every location search concurrently under one request budget.
+
+    Returns the unique listings, in search and page order, and the rules
+    each listing's searches apply, keyed by listing_key.
+    """
+    if client is None:
+        client = make_zillow_client(pool_size=max(max_workers, 1))
+
+    pages = list(iter_scan_pages(client, url, zillow_headers(), scans, max_workers, RequestBudget(FETCH_BUDGET)))
+    for index, _, _ in pages:
+        METRICS.inc('pages', scan=scans[index]['name'])
+    deduper = ScanDeduper(scans)
+    listings = deduper.collect(pages)
+    METRICS.inc('listings_found', deduper.found)
+    logging.info(f'{deduper.found} listings found by {len(scans)} location searches, {len(listings)} unique')
+    return listings, deduper.granted
+
+
+def stream_matches(engine, store, archive, scans, full=False, max_workers=1, url=ZILLOW_URL, client=None):
+    """Match every result page as it arrives instead of after the last one.
+
+    Raw records go to the archive page by page and only the matched rows are
+    kept, so memory stays bounded by the page size. Returns the number of
+    unique listings scanned and the matches per rule, in search and page
+    order.
+    """
+    from listings import build_listing_frame, concat_listing_frames
+
+    if client is None:
+        client = make_zillow_client(pool_size=max(max_workers, 1))
+    deduper = ScanDeduper(scans)
+    matched_pages = {rule['name']: [] for rule in engine.rules}
+
+    scan_pages = iter_scan_pages(client, url, zillow_headers(), scans, max_workers, RequestBudget(FETCH_BUDGET))
+    for index, page, props in scan_pages:
+        METRICS.inc('pages', scan=scans[index]['name'])
+        with METRICS.span('archive'):
+            archive.append(props)
+
+        # Overlapping searches can repeat a listing; only match it once per
+        # run for each rule
+        fresh = deduper.add(index, props)
+        rules_by_key = {listing_key(entry): rules for entry, rules in fresh}
+        with METRICS.span('changed'):
+            pending = [entry for entry, _ in fresh] if full else store.changed([entry for entry, _ in fresh])
+        METRICS.inc('listings_pending', len(pending))
+
+        with METRICS.span('match'):
+            matches = engine.evaluate(build_listing_frame(pending))
+            matches = restrict_matches(matches, [rules_by_key[listing_key(entry)] for entry in pending])
+        for name, matched in matches.items():
+            if len(matched):
+                matched_pages[name].append(((index, page), matched))
+    METRICS.inc('listings_found', deduper.found)
+
+    matches = {
+        name: concat_listing_frames([matched for _, matched in sorted(pages, key=lambda item: item[0])])
+        for name, pages in matched_pages.items()
+    }
+    return len(deduper.granted), matches
+
+
+def NTM_match_properties(matched):
+    from listings import listing_records
 
-    results = ""
-    match_count = 0
     matched_properties = []
+    for property in listing_records(matched):
+        address_encoded = urllib.parse.quote(property['address'])
+        matched_properties.append({
+            **property,
+            "ntm_map_url": f"https://egis.stpete.org/portal/apps/webappviewer/index.html?id=76797e9d8d8b4d20982cb1a2c77acd11&find={address_encoded}",
+            "zoning_map_url": f"https://egis.stpete.org/portal/apps/webappviewer/index.html?id=f0ff270cad0940a2879b38e955319dfa&find={address_encoded}"
+        })
+    return matched_properties
 
-    for property in json_addresses:
-        if any(csv_address in property['address'] for csv_address in csv_addresses_df['Address']):
-            address_encoded = urllib.parse.quote(property['address'])
-            ntm_map_url = f"https://egis.stpete.org/portal/apps/webappviewer/index.html?id=76797e9d8d8b4d20982cb1a2c77acd11&find={address_encoded}"
-            zoning_map_url = f"https://egis.stpete.org/portal/apps/webappviewer/index.html?id=f0ff270cad0940a2879b38e955319dfa&find={address_encoded}"
-
-            lot_area_value = property['lotAreaValue']
-            if lot_area_value >= 7260:
-                lot_area_formatted = f"<span style='color:green;'>{lot_area_value:,} SF</span>"
-            elif 5810 <= lot_area_value < 7260:
-                lot_area_formatted = f"<span style='color:orange;'>{lot_area_value:,} SF</span>"
-            else:
-                lot_area_formatted = f"{lot_area_value:,} SF"
 
-            lot_price_per_sf = int(round(property['price'] / lot_area_value)) if lot_area_value > 0 else 0
+# Function to generate zoning map URL
+def generate_zoning_map_url(address):
+    address_encoded = urllib.parse.quote(address)
+    zoning_map_url = f"https://egis.stpete.org/portal/apps/webappviewer/index.html?id=f0ff270cad0940a2879b38e955319dfa&find={address_encoded}"
+    return zoning_map_url
 
-            results += (
-                f"<p><a href='{property['detailUrl']}'>{property['address'].capitalize()}</a></p>"
-                f"<p>Price: ${property['price']:,}, Lot Size: {lot_area_formatted}, Living Area: {property['livingArea']:,} SF<br>Land Price/SF: ${lot_price_per_sf:,}/SF</p>"
-                f"<img src='{property['imgSrc']}' alt='Property Image' style='width:200px; height:200px;'><br>"
-                f"<p><a href='{ntm_map_url}'>NTM Map</a> | <a href='{zoning_map_url}'>Zoning Map</a></p><br><br>"
-            )
-            match_count += 1
-            matched_properties.append({
-                **property,
-                "ntm_map_url": ntm_map_url,
-                "zoning_map_url": zoning_map_url
-            })
-
-    results += f"<p>Total Matches Found: {match_count}</p>"
-    return results, matched_properties
-
-
-def capitalize_address(address):
-    words = address.split()
-    capitalized_words = []
-    for word in words:
-        if word.lower() in ['fl', 'st', 'rd', 'dr', 'ave', 'blvd', 'ln', 'pl', 'ct', 'n', 's', 'e', 'w']:
-            capitalized_words.append(word.upper())
-        elif word.lower() == 'saint':
-            capitalized_words.append('St.')
-        elif word[:-2].isdigit() and word[-2:].lower() in ['th', 'st', 'nd', 'rd']:
-            capitalized_words.append(word[:-2] + word[-2:].lower())
-        else:
-            capitalized_words.append(word.capitalize())
-    return ' '.join(capitalized_words)
-
-def compare_HealthAddresses(json_data, csv_file_path):
-    # Extract and normalize JSON addresses
-    json_addresses = [
-        {
-            "address": entry.get("address", "").lower(),
-            "core_address": " ".join(entry.get("address", "").lower().split(",")[0].split()[:3]),  # Strip to core part
-            "detailUrl": "http://www.zillow.com" + entry.get("detailUrl", ""),
-            "price": entry.get("price", 0),
-            "lotAreaValue": normalize_lot_area(entry),
-            "livingArea": entry.get("livingArea", 0),
-            "imgSrc": entry.get("imgSrc", "")
-        }
-        for entry in json_data
+
+def Health_match_properties(matched):
+    from listings import listing_records
+
+    return [
+        {**property, "zoning_map_url": generate_zoning_map_url(property['address'])}
+        for property in listing_records(matched)
     ]
 
-    # Load and normalize CSV addresses and zones
-    csv_addresses_df = pd.read_csv(csv_file_path)
-    csv_addresses_df['Address'] = csv_addresses_df['Address'].str.lower()
 
-    # Extract core addresses from CSV
-    csv_addresses_df['Core_Address'] = csv_addresses_df['Address'].apply(lambda x: " ".join(x.split()[:3]))
+def digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
 
-    # Initialize results and matched properties
-    results = ""
-    match_count = 0
-    matched_properties = []
 
-    # Function to generate zoning map URL
-    def generate_zoning_map_url(address):
-        address_encoded = urllib.parse.quote(address)
-        zoning_map_url = f"https://egis.stpete.org/portal/apps/webappviewer/index.html?id=f0ff270cad0940a2879b38e955319dfa&find={address_encoded}"
-        return zoning_map_url
-
-    # Define exclusion zones
-    exclusion_zones = ['NTM-1', 'RC-1', 'RC-2', 'RC-3']
-
-    # Match JSON addresses against CSV addresses
-    for property in json_addresses:
-        match = csv_addresses_df[(csv_addresses_df['Core_Address'] == property['core_address']) & (~csv_addresses_df['Zone_Class'].isin(exclusion_zones))]
-        if not match.empty:
-            zone_class = match['Zone_Class'].values[0]
-            zoning_map_url = generate_zoning_map_url(property['address'])
-
-            formatted_address = capitalize_address(property['address'])
-            price_per_sf = int(round(property['price'] / property['livingArea'])) if property['livingArea'] > 0 else 0
-            results += (
-                f"<p><a href='{property['detailUrl']}'>{formatted_address}</a></p>"
-                f"<img src='{property['imgSrc']}' alt='Property Image' style='width:200px; height:200px;'>"
-                f"<p>Price: ${property['price']:,} (${price_per_sf:,}/SF)<br>Floor Area: {property['livingArea']:,} SF, Lot Size: {property['lotAreaValue']:,} SF<br>Zone: {zone_class}</p>"
-                f"<p><a href='{zoning_map_url}'>Zoning Map</a></p><br><br>"
-            )
-            match_count += 1
-            matched_properties.append({
-                **property,
-                "zone_class": zone_class,
-                "zoning_map_url": zoning_map_url
-            })
-
-    results += f"<p>Total Matches Found: {match_count}</p>"
-    return results, matched_properties
-
-# Function to send property matches via email
-def send_NTMproperty_matches(results_string, match_count):
-    current_date = datetime.now().strftime("%m/%d/%y")
-
-    message = Mail(
-        from_email=SENDER_EMAIL,
-        to_emails=RECIPIENT_EMAIL,
-        subject=f'NTM-1 Property Matches ({match_count}) - {current_date}',
-        html_content=f'''
-            <h2>Matching Properties</h2>
-            <p>Here are the matching properties found:</p>
-            {results_string}
-            <p>Thank you!</p>
-            <hr>
-            <h3>Cheat Sheet:</h3>
-            <ul>
-                <li>Min Lot SF for 5 units: <span style='color:green;'>7260 SF</span></li>
-                <li>Min Lot SF for 4 units: <span style='color:orange;'>5810 SF</span></li>
-                <li>Search PCPAO: <a href="https://www.pcpao.gov/quick-search?qu=1">PCPAO Quick Search</a></li>
-                <li>Link to NTM ordinance: <a href="https://cms5.revize.com/revize/stpete/Business/Planning%20&%20Zoning/Land%20Development/Ord%20540-H.pdf">NTM Ordinance</a></li>
-                <li>City Zoning Map: <a href="https://egis.stpete.org/portal/apps/webappviewer/index.html?id=f0ff270cad0940a2879b38e955319dfa">City Zoning Map</a></li>
-                <li>NTM Zoning Map: <a href="https://egis.stpete.org/portal/apps/webappviewer/index.html?id=76797e9d8d8b4d20982cb1a2c77acd11">NTM Zoning Map</a></li>
-            </ul>
-        '''
-    )
-    try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        logging.info(f'Email sent: Status Code: {response.status_code}')
-    except Exception as e:
-        logging.error(f'Error sending email: {e}')
-
-
-def send_Health_property_matches(results_string, match_count):
-    current_date = datetime.now().strftime("%m/%d/%y")
-
-    message = Mail(
-        from_email=SENDER_EMAIL,
-        to_emails=RECIPIENT_EMAILS,
-        subject=f'Medical Office Property Matches ({match_count}) - {current_date}',
-        html_content=f'''
-            <h2>Matching Properties</h2>
-            <p>Here are the matching properties found:</p>
-            {results_string}
-            <p>Thank you!</p>
-            <hr>
-        '''
-    )
+def queue_email(outbox, kind, subject, recipients, html):
+    # The key covers the content, so rerunning a day with the same matches
+    # does not send the same email twice
+    key = f"email:{kind}:{datetime.now().strftime('%Y-%m-%d')}:{digest(html)}"
+    outbox.enqueue('email', {'subject': subject, 'recipients': recipients, 'html': html}, key)
 
+
+def deliver_email(payload):
+    # Outbox handler; raising leaves the email queued for a retry
+    response = MAILER.send(payload['subject'], payload['recipients'], payload['html'])
+    logging.info(f'Email sent: Status Code: {response.status_code}')
+
+
+def send_error_email(error_message, mailer=None):
     try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        logging.info(f'Email sent: Status Code: {response.status_code}')
-    except Exception as e:
-        logging.error(f'Error sending email: {e}')
-
-
-def send_error_email(error_message):
-    message = Mail(
-        from_email=SENDER_EMAIL,
-        to_emails=RECIPIENT_EMAIL,
-        subject=f'Property Monitor ERROR - {datetime.now().strftime("%m/%d/%y")}',
-        html_content=f'''
-            <h2>Property Monitor Script Error</h2>
-            <p>The property monitoring script encountered an error:</p>
-            <pre>{error_message}</pre>
-            <p>Please check the logs for details.</p>
-        '''
-    )
-    try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        sg.send(message)
+        (mailer or MAILER).send(
+            f'Property Monitor ERROR - {datetime.now().strftime("%m/%d/%y")}',
+            RECIPIENT_EMAIL,
+            render_error_email(error_message)
+        )
     except Exception as e:
         logging.error(f'Error sending error email: {e}')
 
 
-def save_daily_stats(total_scanned, ntm_matches, health_matches, ntm_properties=None, health_properties=None):
-    stats_file = 'daily_stats.json'
-    try:
-        with open(stats_file, 'r') as f:
-            stats = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        stats = []
-
-    ntm_links = [{'address': p.get('address', ''), 'url': p.get('detailUrl', '')} for p in (ntm_properties or [])]
-    health_links = [{'address': p.get('address', ''), 'url': p.get('detailUrl', '')} for p in (health_properties or [])]
-
-    stats.append({
-        'date': datetime.now().strftime('%Y-%m-%d'),
-        'total_scanned': total_scanned,
-        'ntm_matches': ntm_matches,
-        'health_matches': health_matches,
-        'ntm_links': ntm_links,
-        'health_links': health_links
-    })
-    with open(stats_file, 'w') as f:
-        json.dump(stats, f, indent=2)
-
-
-def send_weekly_summary():
-    stats_file = 'daily_stats.json'
-    try:
-        with open(stats_file, 'r') as f:
-            stats = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        logging.info('No daily stats file found for weekly summary')
-        return
+class ErrorThrottle:
+    """Keeps a failing daemon from sending the same error email every poll.
+
+    A new error is always sent; a repeat of the last one is sent once
+    ``interval`` seconds have passed since it was last sent.
+    """
 
-    week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    recent_stats = [s for s in stats if s['date'] >= week_ago]
+    def __init__(self, interval=ERROR_EMAIL_INTERVAL):
+        self.interval = interval
+        self.last_error = None
+        self.last_sent = None
 
+    def allow(self, error):
+        now = time.monotonic()
+        if error == self.last_error and now - self.last_sent < self.interval:
+            return False
+        self.last_error, self.last_sent = error, now
+        return True
+
+    def reset(self):
+        self.last_error = None
+
+
+def save_daily_stats(stats, total_scanned, matched_by_rule):
+    # One appended run row per run; earlier history is never rewritten
+    stats.record(total_scanned, matched_by_rule)
+
+
+def send_weekly_summary(outbox, stats):
+    start, end = date_range(7)
+    recent_stats = stats.days(start, end)
     if not recent_stats:
+        logging.info('No stats recorded this week for the weekly summary')
         return
 
-    rows = ""
-    zero_match_days = []
-    for day in recent_stats:
-        rows += f"<tr><td>{day['date']}</td><td>{day['total_scanned']}</td><td>{day['ntm_matches']}</td><td>{day['health_matches']}</td></tr>"
-        if day['ntm_matches'] == 0 and day['health_matches'] == 0:
-            zero_match_days.append(day['date'])
-
-    zero_match_note = ""
-    if zero_match_days:
-        zero_match_note = f"<p>Days with 0 matches: {', '.join(zero_match_days)}</p>"
-
-    # Build match recap links
-    match_recap = ""
-    ntm_links_html = ""
-    health_links_html = ""
-    for day in recent_stats:
-        for link in day.get('ntm_links', []):
-            ntm_links_html += f"<li>{day['date']} — {capitalize_address(link['address'])} — <a href='{link['url']}'>Zillow</a></li>"
-        for link in day.get('health_links', []):
-            health_links_html += f"<li>{day['date']} — {capitalize_address(link['address'])} — <a href='{link['url']}'>Zillow</a></li>"
-
-    if ntm_links_html or health_links_html:
-        match_recap = "<hr><h3>All Matches This Week</h3>"
-        if ntm_links_html:
-            match_recap += f"<h4>NTM-1 Matches</h4><ul>{ntm_links_html}</ul>"
-        if health_links_html:
-            match_recap += f"<h4>Medical Office Matches</h4><ul>{health_links_html}</ul>"
-
-    html = f'''
-        <h2>Weekly Property Monitor Summary</h2>
-        <table border="1" cellpadding="5" cellspacing="0">
-            <tr><th>Date</th><th>Total Scanned</th><th>NTM Matches</th><th>Health Matches</th></tr>
-            {rows}
-        </table>
-        {zero_match_note}
-        {match_recap}
-    '''
-
-    message = Mail(
-        from_email=SENDER_EMAIL,
-        to_emails=RECIPIENT_EMAIL,
-        subject=f'Weekly Property Monitor Summary - {datetime.now().strftime("%m/%d/%y")}',
-        html_content=html
+    # Keyed by date so a second run on the same Sunday does not resend it
+    outbox.enqueue('email', {
+        'subject': f'Weekly Property Monitor Summary - {datetime.now().strftime("%m/%d/%y")}',
+        'recipients': RECIPIENT_EMAIL,
+        'html': render_weekly_summary(recent_stats),
+    }, f"weekly:{end}")
+    logging.info('Weekly summary email queued')
+
+
+def update_NTMairtable(properties, api_url=AIRTABLE_API_URL, base_id=None, table_name=None, access_token=None,
+                       rate=AIRTABLE_RATE):
+    airtable = AirtableClient(
+        base_id or AIRTABLE_BASE_ID,
+        table_name or AIRTABLE_TABLE_NAME,
+        access_token or AIRTABLE_ACCESS_TOKEN,
+        api_url=api_url,
+        rate=rate
     )
-    try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        sg.send(message)
-        logging.info('Weekly summary email sent')
-        # Clear stats file after sending
-        with open(stats_file, 'w') as f:
-            json.dump([], f)
-    except Exception as e:
-        logging.error(f'Error sending weekly summary: {e}')
-
 
-def update_NTMairtable(properties):
-    # Initialize Airtable SDK
-    airtable = Airtable(AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME, AIRTABLE_ACCESS_TOKEN)
+    # Fetch every existing Name once and dedup in memory
+    existing = airtable.list_field('Name')
 
-    # Update Airtable database
+    new_records = []
     for property in properties:
         address = property.get("address", "").capitalize()
-        detail_url = property.get("detailUrl", "")
-        lot_size = property.get("lotAreaValue", 0)
-        img_src = property.get("imgSrc", "")
-        price = property.get("price", 0)
-        ntm_map_url = property.get("ntm_map_url", "")
-        zoning_map_url = property.get("zoning_map_url", "")
-
-        existing = airtable.search('Name', address)
-        if existing:
+        if address in existing:
             logging.info(f'Skipping duplicate: {address}')
             continue
+        existing.add(address)
+
+        new_records.append({
+            "Name": address,
+            "URL": property.get("detailUrl", ""),
+            "Lot Size": property.get("lotAreaValue", 0),
+            "Price": property.get("price", 0),
+            "Photo": [{"url": property.get("imgSrc", "")}],
+            "NTM Map": property.get("ntm_map_url", ""),
+            "Zoning Map": property.get("zoning_map_url", "")
+        })
+
+    # Write new records in batches of ten under the client's rate limiter. A
+    # failed batch raises so the outbox retries the sync, and the retry's
+    # Name lookup skips whatever was already written.
+    for start in range(0, len(new_records), AIRTABLE_BATCH_SIZE):
+        for record in airtable.create(new_records[start:start + AIRTABLE_BATCH_SIZE]):
+            logging.info(f'Successfully inserted: {record.get("fields", {}).get("Name", "")}')
+
+
+def notification_handlers(rules, sink=None):
+    if sink is not None:
+        # Replays write notifications to local files instead
+        return {'email': sink.deliver_email, 'airtable': sink.deliver_airtable}
+
+    # Airtable payloads name their rule rather than carry its access token
+    airtable_configs = {rule['name']: rule['airtable'] for rule in rules if rule['airtable']}
+
+    def deliver_airtable(payload):
+        config = airtable_configs[payload['rule']]
+        update_NTMairtable(
+            payload['properties'],
+            api_url=config.get('api_url') or AIRTABLE_API_URL,
+            base_id=config.get('base_id'),
+            table_name=config.get('table'),
+            access_token=config.get('access_token')
+        )
 
-        try:
-            airtable.insert({
-                "Name": address,
-                "URL": detail_url,
-                "Lot Size": lot_size,
-                "Price": price,
-                "Photo": [{"url": img_src}],
-                "NTM Map": ntm_map_url,
-                "Zoning Map": zoning_map_url
-            })
-            logging.info(f'Successfully inserted: {address}')
-        except Exception as e:
-            logging.error(f'Error inserting {address}: {e}')
-
-
-def main():
-    try:
-        zillow_data = get_property_data()
+    return {'email': deliver_email, 'airtable': deliver_airtable}
 
-        NTMresults_string, NTMmatched_properties = compare_NTMaddresses(zillow_data, 'NTMaddresses.csv')
-        if NTMmatched_properties:
-            send_NTMproperty_matches(NTMresults_string, len(NTMmatched_properties))
-            update_NTMairtable(NTMmatched_properties)
-        else:
-            logging.info('No NTM matches today')
 
-        time.sleep(15)
+# Matched-property builder for each rule template; the HTML comes from
+# the renderer of the same name in emails.py
+COLLECTORS = {
+    'ntm': NTM_match_properties,
+    'health': Health_match_properties,
+}
 
-        med_results_string, med_matched_properties = compare_HealthAddresses(zillow_data, 'HealthOfficeAddresses.csv')
-        if med_matched_properties:
-            send_Health_property_matches(med_results_string, len(med_matched_properties))
-        else:
-            logging.info('No Health matches today')
-
-        # Save daily stats
-        save_daily_stats(
-            total_scanned=len(zillow_data),
-            ntm_matches=len(NTMmatched_properties),
-            health_matches=len(med_matched_properties),
-            ntm_properties=NTMmatched_properties,
-            health_properties=med_matched_properties
+
+def dispatch_rule(rule, matched, outbox):
+    # Queues the rule's email and Airtable sync; the dispatcher delivers them
+    matched_properties = COLLECTORS[rule['template']](matched)
+    if matched_properties:
+        render, footer = RENDERERS[rule['template']]
+        current_date = datetime.now().strftime("%m/%d/%y")
+        queue_email(
+            outbox, rule['name'],
+            f"{rule['subject']} ({len(matched_properties)}) - {current_date}",
+            rule['recipients'], render_match_email(render(matched_properties), footer)
         )
+        if rule['airtable']:
+            properties = [{field: p.get(field) for field in AIRTABLE_FIELDS} for p in matched_properties]
+            names = '\n'.join(sorted(str(p['address']) for p in properties))
+            outbox.enqueue(
+                'airtable', {'rule': rule['name'], 'properties': properties},
+                f"airtable:{rule['name']}:{datetime.now().strftime('%Y-%m-%d')}:{digest(names)}"
+            )
+    else:
+        logging.info(f"No {rule['name']} matches today")
+    METRICS.inc('matches', len(matched_properties), rule=rule['name'])
+    return matched_properties
+
+
+def main(full=False, stream=False, record=None, replay=None, client=None, errors=None):
+    """One poll: fetch, match, notify and record.
+
+    ``client`` is the Zillow client to fetch with; by default each run makes
+    its own (one with the cassette's adapter when recording or replaying).
+    ``errors`` is the daemon's ErrorThrottle; without one every failure is
+    emailed.
+    """
+    from listings import build_listing_frame
+    from rules import load_rules, load_rule_engine
+
+    METRICS.reset()
+    dispatcher = None
+    store = None
+    stats = None
+    cassette = None
+    sink = None
+    error = None
+    listing_db, outbox_db, stats_db, archive_dir = LISTING_DB, OUTBOX_DB, STATS_DB, ARCHIVE_DIR
+    report_path, textfile_path = RUN_REPORT, METRICS_TEXTFILE
+    try:
+        if record:
+            # Every Zillow page is saved as it arrives, for later replays
+            cassette = Cassette(record, 'record')
+        elif replay:
+            # Pages come from the cassette and notifications go to local
+            # files; the run starts from empty state of its own so it never
+            # touches, or depends on, the real run's databases
+            cassette = Cassette(replay, 'replay')
+            shutil.rmtree(REPLAY_DIR, ignore_errors=True)
+            sink = LocalSink(REPLAY_DIR)
+            listing_db, outbox_db, stats_db, archive_dir, report_path, textfile_path = (
+                os.path.join(REPLAY_DIR, name) for name in (
+                    'listings.db', 'outbox.db', 'stats.db', 'archive', os.path.basename(RUN_REPORT),
+                    os.path.basename(METRICS_TEXTFILE)
+                )
+            )
+        use_cassette(cassette)
+
+        with METRICS.span('load_rules'):
+            store = ListingStore(listing_db)
+            rules = load_rules(RULES_FILE)
+            engine = load_rule_engine(rules)
+
+        # Emails and Airtable writes go through a durable outbox and are
+        # delivered in the background while the run carries on; anything an
+        # earlier run left undelivered goes out first
+        outbox = Outbox(outbox_db)
+        dispatcher = OutboxDispatcher(outbox, notification_handlers(rules, sink), rates=NOTIFY_RATES).start()
+
+        # Every location search runs concurrently under one request budget
+        scans = load_scans(SCANS_FILE, ZILLOW_QUERY, [rule['name'] for rule in rules])
+
+        if stream:
+            # Pages are matched and archived as they arrive; the fetch span
+            # includes the per-page archive, changed and match spans
+            archive = NDJSONArchive(run_archive_path(archive_dir))
+            with METRICS.span('fetch'):
+                total_scanned, matches = stream_matches(
+                    engine, store, archive, scans, full, FETCH_WORKERS, client=client
+                )
+        else:
+            with METRICS.span('fetch'):
+                zillow_data, granted = scan_property_data(scans, max_workers=FETCH_WORKERS, client=client)
+            total_scanned = len(zillow_data)
+
+            # Only listings that are new or changed since the last run go downstream
+            with METRICS.span('changed'):
+                pending = zillow_data if full else store.changed(zillow_data)
+            METRICS.inc('listings_pending', len(pending))
+            logging.info(f'{len(pending)} of {len(zillow_data)} listings are new or changed')
+
+            # Every watchlist rule is evaluated in one pass over the listings
+            with METRICS.span('match'):
+                matches = engine.evaluate(build_listing_frame(pending))
+                # Each rule only applies to listings from the searches that list it
+                matches = restrict_matches(matches, [granted[listing_key(entry)] for entry in pending])
+        METRICS.inc('listings_scanned', total_scanned)
+
+        with METRICS.span('dispatch'):
+            matched_by_rule = {rule['name']: dispatch_rule(rule, matches[rule['name']], outbox) for rule in rules}
+        dispatcher.notify()
+
+        # Save daily stats; a daily_stats.json from before the stats store
+        # is imported once and renamed
+        with METRICS.span('stats'):
+            stats = StatsStore(stats_db)
+            if not replay:
+                stats.import_legacy()
+            save_daily_stats(stats, total_scanned, matched_by_rule)
+
+        with METRICS.span('record_listings'):
+            if stream:
+                store.record(read_archive(archive.path))
+                prune_archives(archive_dir)
+            else:
+                store.record(zillow_data)
 
         # Send weekly summary on Sundays
         if datetime.now().strftime('%A') == 'Sunday':
-            send_weekly_summary()
+            send_weekly_summary(outbox, stats)
+            dispatcher.notify()
 
     except Exception as e:
+        error = str(e)
         tb = traceback.format_exc()
         logging.error(f'Script error: {e}\n{tb}')
-        send_error_email(f'{e}\n\n{tb}')
+        if errors is None or errors.allow(f'{type(e).__name__}: {e}'):
+            send_error_email(f'{e}\n\n{tb}', sink)
+        else:
+            logging.info('Same error as the last poll; not emailing it again yet')
+    finally:
+        if dispatcher is not None:
+            # Waiting for the last notifications to go out
+            with METRICS.span('drain_outbox'):
+                dispatcher.close(timeout=OUTBOX_TIMEOUT)
+            METRICS.inc('outbox_left', sum(dispatcher.outbox.counts().get(status, 0) for status in ('pending', 'sending')))
+            dispatcher.outbox.close()
+        for db in (store, stats):
+            if db is not None:
+                db.close()
+        use_cassette(None)
+        if cassette is not None:
+            cassette.close()
+        try:
+            METRICS.write(
+                report_path, textfile_path, status='error' if error else 'ok', error=error,
+                mode='stream' if stream else 'batch', replay=bool(replay)
+            )
+        except OSError as e:
+            logging.error(f'Could not write the run report: {e}')
+        if errors is not None and error is None:
+            errors.reset()
+
+
+def refresh_watchlists():
+    # Recompiles the rule indexes if watchlists.json or a watchlist CSV
+    # changed; otherwise it costs a few stat calls
+    from rules import load_rules, load_rule_engine
+
+    try:
+        load_rule_engine(load_rules(RULES_FILE))
+    except Exception as e:
+        # Possibly caught mid-edit; the next check or poll tries again
+        logging.error(f'Could not reload watchlists: {e}')
+
+
+def run_daemon(interval=POLL_INTERVAL, full=False, stream=False):
+    """Poll every ``interval`` seconds until SIGTERM or SIGINT.
+
+    The process keeps its imports, compiled watchlists, mail client and
+    Zillow client (connection pool, token bucket and circuit breaker) warm
+    between polls. While idle it checks the watchlists every WATCH_INTERVAL
+    seconds and recompiles them as soon as they change on disk, so edits
+    apply from the next poll without a restart. A failure that repeats every
+    poll is emailed once per ERROR_EMAIL_INTERVAL. A signal lets the poll in
+    progress finish; a second one exits at once.
+    """
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if stop.is_set():
+            raise SystemExit(f'Received {signal.Signals(signum).name} again; exiting now')
+        logging.info(f'Received {signal.Signals(signum).name}; stopping after the current poll')
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    client = make_zillow_client(pool_size=max(FETCH_WORKERS, 1))
+    errors = ErrorThrottle()
+    logging.info(f'Daemon started; polling every {interval:.0f}s')
+    while not stop.is_set():
+        next_poll = time.monotonic() + interval
+        main(full=full, stream=stream, client=client, errors=errors)
+        while not stop.is_set() and time.monotonic() < next_poll:
+            stop.wait(max(0.0, min(WATCH_INTERVAL, next_poll - time.monotonic())))
+            if not stop.is_set():
+                refresh_watchlists()
+    logging.info('Daemon stopped')
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='St. Pete NTM/CRT property monitor')
+    parser.add_argument('--full', action='store_true', help='reprocess every listing, not just new or changed ones')
+    parser.add_argument('--stream', action='store_true', help='match pages as they arrive and archive them as compressed NDJSON')
+    cassette_args = parser.add_mutually_exclusive_group()
+    cassette_args.add_argument('--record', metavar='CASSETTE', help='save every Zillow response to a cassette file')
+    cassette_args.add_argument(
+        '--replay', metavar='CASSETTE',
+        help=f'run offline from a recorded cassette, writing state and notifications to {REPLAY_DIR}/'
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='profiles', metavar='DIR',
+        help='dump cProfile and tracemalloc data for the run to DIR (default: profiles/)'
+    )
+    parser.add_argument('--daemon', action='store_true', help='keep running, polling every --interval seconds')
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help='seconds between daemon polls')
+    args = parser.parse_args()
+    if args.daemon:
+        if args.record or args.replay or args.profile:
+            parser.error('--daemon cannot be combined with --record, --replay or --profile')
+        run_daemon(args.interval, full=args.full, stream=args.stream)
+    elif args.profile:
+        with profiled(args.profile):
+            main(full=args.full, stream=args.stream, record=args.record, replay=args.replay)
+    else:
+        main(full=args.full, stream=args.stream, record=args.record, replay=args.replay)
@@ -0,0 +1,100 @@
+from collections import deque
+
+
+class AddressMatcher:
+    """Aho-Corasick automaton over a list of watchlist addresses.
+
+    Answers "which watchlist addresses occur as substrings of this listing
+    address" in a single pass over the listing string, independent of how
+    many addresses are on the watchlist.
+    """
+
+    def __init__(self, patterns):
+        # Keep first-seen order so results are stable, drop duplicates
+        self.patterns = list(dict.fromkeys(patterns))
+        self._has_empty = '' in self.patterns
+
+        goto = [{}]
+        fail = [0]
+        out = [()]
+
+        # Build the trie
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                child = goto[node].get(ch)
+                if child is None:
+                    child = len(goto)
+                    goto[node][ch] = child
+                    goto.append({})
+                    fail.append(0)
+                    out.append(())
+                node = child
+            out[node] = out[node] + (index,)
+
+        # Breadth-first pass to wire failure links and merge outputs
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(ch, 0) if node else 0
+                fail[child] = target
+                if out[target]:
+                    out[child] = out[child] + out[target]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def iter_matches(self, text):
+        """Yield the index of every pattern occurrence in ``text``."""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                yield from out[node]
+
+    def find_all(self, text):
+        """Return every pattern contained in ``text``, in order of first occurrence."""
+        found = dict.fromkeys(self.iter_matches(text))
+        matches = [self.patterns[index] for index in found]
+        if self._has_empty:
+            matches.insert(0, '')
+        return matches
+
+    def contains_any(self, text):
+        """Equivalent to ``any(pattern in text for pattern in patterns)``."""
+        if self._has_empty:
+            return True
+        for _ in self.iter_matches(text):
+            return True
+        return False
+
+
+def build_zone_index(core_addresses, zone_classes, exclusion_zones=()):
+    """Map each core address to the first zone class that is not excluded.
+
+    Rows are visited in watchlist order, so the zone kept for a core address
+    is the same one a filtered DataFrame lookup would return first.
+    """
+    excluded = set(exclusion_zones)
+    index = {}
+    for core_address, zone_class in zip(core_addresses, zone_classes):
+        if zone_class in excluded:
+            continue
+        index.setdefault(core_address, zone_class)
+    return index
@@ -0,0 +1,215 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RUN_REPORT = 'run_report.json'
+METRICS_TEXTFILE = 'property_monitor.prom'
+METRIC_PREFIX = 'property_monitor'
+
+# Upper bounds, in seconds, of the API latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _prometheus_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """Timing spans, counters and latency histograms for one run.
+
+    Shared by every thread of the run. ``span`` times a pipeline stage; a
+    stage entered several times (one per page, say) adds up. ``inc`` counts
+    things and ``observe`` records a latency. Everything is written at the end
+    of the run as a JSON report and a Prometheus textfile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._started = time.perf_counter()
+            self.spans = {}
+            self.counters = {}
+            self.histograms = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                span = self.spans.setdefault(name, {'seconds': 0.0, 'count': 0})
+                span['seconds'] += elapsed
+                span['count'] += 1
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+
+    @contextmanager
+    def timed(self, name, **labels):
+        # Observes how long the block took, whether or not it raised
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self, status='ok', error=None, **extra):
+        with self._lock:
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'status': status,
+                'error': error,
+                'duration_seconds': round(time.perf_counter() - self._started, 3),
+                'peak_rss_mb': peak_rss_mb(),
+                **extra,
+                'spans': {name: {'seconds': round(span['seconds'], 4), 'count': span['count']}
+                          for name, span in self.spans.items()},
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'count': h['count'], 'sum': round(h['sum'], 4),
+                     'buckets': dict(zip(map(str, LATENCY_BUCKETS), h['buckets']))}
+                    for (name, labels), h in sorted(self.histograms.items())
+                ],
+            }
+
+    def prometheus(self, report):
+        """The run in the Prometheus text format, for node_exporter's textfile collector.
+
+        Every value describes the last run, so counters are exported as gauges;
+        histograms keep their type.
+        """
+        lines = []
+
+        def gauge(name, samples, help_text):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+            lines.extend(f'{METRIC_PREFIX}_{name}{labels} {value}' for labels, value in samples)
+
+        finished = datetime.fromisoformat(report['finished_at']).timestamp()
+        gauge('last_run_timestamp_seconds', [('', finished)], 'When the last run finished.')
+        gauge('last_run_success', [('', int(report['status'] == 'ok'))], '1 if the last run finished without error.')
+        gauge('last_run_duration_seconds', [('', report['duration_seconds'])], 'Wall time of the last run.')
+        if report['peak_rss_mb'] is not None:
+            gauge('last_run_peak_rss_bytes', [('', int(report['peak_rss_mb'] * 1e6))], 'Peak resident memory of the last run.')
+        gauge(
+            'stage_seconds',
+            [(_prometheus_labels((), stage=name), span['seconds']) for name, span in report['spans'].items()],
+            'Time spent in each pipeline stage during the last run.'
+        )
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        for name in sorted({name for (name, _), _ in counters}):
+            gauge(name, [(_prometheus_labels(labels), value) for (n, labels), value in counters if n == name],
+                  f'{name.replace("_", " ")} during the last run.')
+
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} Latency during the last run.')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} histogram')
+            for (n, labels), h in histograms:
+                if n != name:
+                    continue
+                for bound, count in zip(LATENCY_BUCKETS, h['buckets']):
+                    lines.append(f'{METRIC_PREFIX}_{name}_bucket{_prometheus_labels(labels, le=bound)} {count}')
+                lines.append(f'{METRIC_PREFIX}_{name}_bucket{_prometheus_labels(labels, le="+Inf")} {h["count"]}')
+                lines.append(f'{METRIC_PREFIX}_{name}_sum{_prometheus_labels(labels)} {h["sum"]}')
+                lines.append(f'{METRIC_PREFIX}_{name}_count{_prometheus_labels(labels)} {h["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, report_path=RUN_REPORT, textfile_path=METRICS_TEXTFILE, **report_args):
+        """Write the JSON run report and the Prometheus textfile; either path may be empty."""
+        report = self.report(**report_args)
+        if report_path:
+            _write_atomic(report_path, json.dumps(report, indent=2))
+        if textfile_path:
+            # The collector may read at any moment, so never leave a half-written file
+            _write_atomic(textfile_path, self.prometheus(report))
+        return report
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+
+@contextmanager
+def profiled(directory, top=50):
+    """Profile the block with cProfile and tracemalloc, dumping both to ``directory``.
+
+    Writes ``run-<timestamp>.prof`` (open with pstats or snakeviz) and
+    ``run-<timestamp>-memory.txt``, the ``top`` lines that allocated most.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        profiler.dump_stats(f'{stem}.prof')
+        with open(f'{stem}-memory.txt', 'w') as f:
+            f.write(f'Peak traced memory: {peak / 1e6:.1f} MB\n\n')
+            for stat in snapshot.statistics('lineno')[:top]:
+                f.write(f'{stat}\n')
+        logging.info(f'Profile written to {stem}.prof and {stem}-memory.txt')
+
+
+# The run's metrics, shared by every module
+METRICS = Metrics()
@@ -1,54 +1,61 @@
-from arcgis.gis import GIS
-from arcgis.geocoding import reverse_geocode
-from arcgis.features import FeatureLayer
-import pandas as pd
-
-# Connect to ArcGIS Online
-gis = GIS()
+import argparse
+from geocode import GeocodeCache, GEOCODE_CACHE_DB, DEFAULT_TOLERANCE, arcgis_backend, rest_backend, geocode_shapes
 
 # Define the feature layer URL
 url = "https://egis.stpete.org/arcgis/rest/services/ServicesDSD/NTM/MapServer/0"
 
-# Create a FeatureLayer object
-feature_layer = FeatureLayer(url)
-
-# Define the query parameters
-query = feature_layer.query(where='1=1', out_fields='OBJECTID,Shape,TYPE,Shape_Length,Shape_Area,ACRES', return_geometry=True, result_record_count=25)
-
-# Convert the query results to a SpatiallyEnabledDataFrame
-df = query.sdf
-
-# Select only the required columns
-df = df[['OBJECTID', 'SHAPE', 'TYPE', 'Shape_Length', 'Shape_Area', 'ACRES']]
-
-# Define the CSV file path
-csv_file = 'c:/Users/greg.BODYNUTRITION/OneDrive - bodynutrition.com/Python Arcgis/NTM_1_Zoning_Specified_Fields.csv'
-
-# Save the DataFrame to a CSV file
-df.to_csv(csv_file, index=False)
-
-# Reverse geocode the coordinates (using the centroid of each ring of the shape)
-addresses = []
-for index, row in df.iterrows():
-    shape = row['SHAPE']
-    if shape:
-        rings = shape['rings']
-        ring_addresses = []
-        for ring in rings:
-            if ring:
-                centroid = ring[0]  # Get the first point of the ring as an example
-                location = {'x': centroid[0], 'y': centroid[1], 'spatialReference': {'wkid': 2882}}
-                result = reverse_geocode(location)
-                address = result['address']['Match_addr']
-                ring_addresses.append(address)
-        addresses.append("; ".join(ring_addresses))  # Combine all addresses for the shape
-    else:
-        addresses.append(None)
-
-df['Address'] = addresses
-
-# Save the updated DataFrame with addresses to a CSV file
-csv_file_with_addresses = 'c:/Users/greg.BODYNUTRITION/OneDrive - bodynutrition.com/Python Arcgis/NTM_1_Zoning_Specified_Fields_With_Addresses.csv'
-df.to_csv(csv_file_with_addresses, index=False)
-
-print(f"Data with addresses successfully saved to {csv_file_with_addresses}")
+
+def query_ntm_layer(record_count=None):
+    from arcgis.gis import GIS
+    from arcgis.features import FeatureLayer
+
+    # Connect to ArcGIS Online
+    GIS()
+
+    # Create a FeatureLayer object
+    feature_layer = FeatureLayer(url)
+
+    # Define the query parameters; without a record count the whole layer is returned
+    query_args = {}
+    if record_count:
+        query_args['result_record_count'] = record_count
+    query = feature_layer.query(where='1=1', out_fields='OBJECTID,Shape,TYPE,Shape_Length,Shape_Area,ACRES', return_geometry=True, **query_args)
+
+    # Convert the query results to a SpatiallyEnabledDataFrame
+    df = query.sdf
+
+    # Select only the required columns
+    return df[['OBJECTID', 'SHAPE', 'TYPE', 'Shape_Length', 'Shape_Area', 'ACRES']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the NTM layer and reverse geocode each polygon')
+    parser.add_argument('--limit', type=int, default=None, help='only fetch this many features (default: the whole layer)')
+    parser.add_argument('--output', default='NTM_1_Zoning_Specified_Fields.csv')
+    parser.add_argument('--output-with-addresses', default='NTM_1_Zoning_Specified_Fields_With_Addresses.csv')
+    parser.add_argument('--geocoder-url', default=None, help='GeocodeServer URL to call instead of the arcgis package')
+    parser.add_argument('--cache', default=GEOCODE_CACHE_DB, help='on-disk reverse geocode cache')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='coordinates within this distance share a cached result')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent reverse geocode requests')
+    args = parser.parse_args()
+
+    df = query_ntm_layer(args.limit)
+
+    # Save the DataFrame to a CSV file
+    df.to_csv(args.output, index=False)
+
+    # Reverse geocode the true centroid of each ring of the shape, reusing
+    # cached results for nearby points
+    backend = rest_backend(args.geocoder_url) if args.geocoder_url else arcgis_backend()
+    cache = GeocodeCache(args.cache, tolerance=args.tolerance)
+    df['Address'] = geocode_shapes(df['SHAPE'].tolist(), backend, cache, max_workers=args.workers)
+    cache.close()
+
+    # Save the updated DataFrame with addresses to a CSV file
+    df.to_csv(args.output_with_addresses, index=False)
+
+    print(f"Data with addresses successfully saved to {args.output_with_addresses}")
+
+
+if __name__ == '__main__':
+    main()
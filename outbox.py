@@ -0,0 +1,211 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from airtable_sync import RateLimiter
+from metrics import METRICS
+
+OUTBOX_DB = 'outbox.db'
+
+# Seconds before each retry of a failed delivery; an item that has failed
+# once more than this is dead and stays in the table for inspection
+RETRY_DELAYS = [5, 30, 120, 600]
+
+
+def _json_default(value):
+    # numpy scalars from listing frames
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class Outbox:
+    """Durable queue of pending side effects (emails, Airtable writes).
+
+    Each item has a destination, a JSON payload and an idempotency key;
+    enqueueing a key that is already present is a no-op, so a run that is
+    repeated after a crash does not send the same notification twice.
+    Items move pending -> sending -> done, or back to pending with a later
+    ``next_attempt`` when delivery fails.
+    """
+
+    def __init__(self, path=OUTBOX_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                destination TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL,
+                delivered REAL
+            )'''
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)')
+        # Anything still marked sending was cut off by a crash; send it again
+        self.conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+        self.conn.commit()
+
+    def enqueue(self, destination, payload, key):
+        """Queue a side effect; returns False if ``key`` was already queued."""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                '''INSERT OR IGNORE INTO outbox (key, destination, payload, next_attempt, created)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (key, destination, json.dumps(payload, default=_json_default), now, now)
+            )
+            self.conn.commit()
+        if not cursor.rowcount:
+            logging.info(f'Outbox already has {key}, not queueing it again')
+        return bool(cursor.rowcount)
+
+    def claim_due(self, limit=50):
+        """Mark up to ``limit`` due items as sending and return them."""
+        with self._lock:
+            rows = self.conn.execute(
+                '''SELECT id, key, destination, payload, attempts FROM outbox
+                   WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?''',
+                (time.time(), limit)
+            ).fetchall()
+            self.conn.executemany("UPDATE outbox SET status = 'sending' WHERE id = ?", [(row[0],) for row in rows])
+            self.conn.commit()
+        return [
+            {'id': id, 'key': key, 'destination': destination, 'payload': json.loads(payload), 'attempts': attempts}
+            for id, key, destination, payload, attempts in rows
+        ]
+
+    def mark_done(self, item):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'done', attempts = attempts + 1, delivered = ?, last_error = NULL WHERE id = ?",
+                (time.time(), item['id'])
+            )
+            self.conn.commit()
+
+    def mark_failed(self, item, error, delays=RETRY_DELAYS):
+        attempts = item['attempts'] + 1
+        status = 'pending' if attempts <= len(delays) else 'dead'
+        delay = delays[attempts - 1] if status == 'pending' else 0
+        with self._lock:
+            self.conn.execute(
+                'UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?',
+                (status, attempts, time.time() + delay, str(error), item['id'])
+            )
+            self.conn.commit()
+        return status
+
+    def counts(self):
+        with self._lock:
+            return dict(self.conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+
+    def next_due(self):
+        # Time of the earliest pending item, or None
+        with self._lock:
+            row = self.conn.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class OutboxDispatcher:
+    """Delivers outbox items on a background thread pool.
+
+    ``handlers`` maps a destination to a function taking the item's payload;
+    raising marks the item for retry. ``rates`` caps calls per second per
+    destination. Items queued while the dispatcher runs are picked up after
+    ``notify()``; anything still undelivered when ``close()`` times out is
+    left in the outbox for the next run.
+    """
+
+    def __init__(self, outbox, handlers, rates=None, max_workers=4, delays=RETRY_DELAYS, poll=1.0):
+        self.outbox = outbox
+        self.handlers = handlers
+        self.limiters = {destination: RateLimiter(rate) for destination, rate in (rates or {}).items()}
+        self.delays = delays
+        self.poll = poll
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.delivered = 0
+        self.failed = 0
+        self._count_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._deadline = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def notify(self):
+        self._wake.set()
+
+    def close(self, timeout=None):
+        """Finish due and retrying items for up to ``timeout`` seconds, then stop."""
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+        self._closing.set()
+        self._wake.set()
+        self._thread.join()
+        self.executor.shutdown(wait=True)
+        counts = self.outbox.counts()
+        logging.info(
+            f'Outbox: {self.delivered} delivered, {self.failed} failed attempts, '
+            f'{counts.get("pending", 0)} pending, {counts.get("dead", 0)} dead'
+        )
+        return counts
+
+    def _deliver(self, item):
+        handler = self.handlers.get(item['destination'])
+        try:
+            if handler is None:
+                raise ValueError(f'No handler for outbox destination {item["destination"]}')
+            limiter = self.limiters.get(item['destination'])
+            if limiter is not None:
+                limiter.wait()
+            with METRICS.timed('delivery_seconds', destination=item['destination']):
+                handler(item['payload'])
+        except Exception as e:
+            METRICS.inc('deliveries', destination=item['destination'], outcome='failed')
+            with self._count_lock:
+                self.failed += 1
+            status = self.outbox.mark_failed(item, e, self.delays)
+            log = logging.error if status == 'dead' else logging.warning
+            log(f'Delivering {item["key"]} failed (attempt {item["attempts"] + 1}, now {status}): {e}')
+        else:
+            METRICS.inc('deliveries', destination=item['destination'], outcome='delivered')
+            with self._count_lock:
+                self.delivered += 1
+            self.outbox.mark_done(item)
+            logging.info(f'Delivered {item["key"]}')
+
+    def _past_deadline(self):
+        return self._closing.is_set() and self._deadline is not None and time.monotonic() >= self._deadline
+
+    def _run(self):
+        while not self._past_deadline():
+            items = self.outbox.claim_due()
+            if items:
+                wait([self.executor.submit(self._deliver, item) for item in items])
+                continue
+
+            next_due = self.outbox.next_due()
+            if self._closing.is_set():
+                if next_due is None:
+                    return
+                # Wait for the next retry, but not past the deadline
+                pause = max(0.0, next_due - time.time())
+                if self._deadline is not None:
+                    pause = min(pause, self._deadline - time.monotonic())
+            else:
+                pause = self.poll if next_due is None else min(self.poll, max(0.0, next_due - time.time()))
+            self._wake.wait(pause)
+            self._wake.clear()
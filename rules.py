@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import re
+import pandas as pd
+from address import canonical_address, core_address_key
+from emails import RENDERERS
+from fuzzy import DEFAULT_MIN_SCORE, FuzzyIndex
+from matcher import AddressMatcher, build_zone_index
+from spatial import PolygonIndex, load_polygons
+from watchlist import CACHE_DIR, load_compiled
+
+RULES_FILE = 'watchlists.json'
+
+# key: the listing's canonical street line equals a watchlist entry's
+# core: canonical house number, street name and suffix equal a watchlist entry's
+# substring: a watchlist address appears anywhere in the listing address
+# spatial: the listing's coordinates fall inside a polygon of a local layer
+# fuzzy: like key, falling back to the most similar watchlist entry with the
+#   same house number and street-name prefix scoring at least min_score
+MATCH_MODES = ('key', 'core', 'substring', 'spatial', 'fuzzy')
+
+THRESHOLDS = {
+    'min_lot_sf': ('lotAreaValue', '>='),
+    'max_lot_sf': ('lotAreaValue', '<='),
+    'min_price': ('price', '>='),
+    'max_price': ('price', '<='),
+    'min_living_sf': ('livingArea', '>='),
+    'max_living_sf': ('livingArea', '<='),
+}
+
+
+def _expand(value):
+    # Config values may reference the environment, e.g. "${RECIPIENT_EMAIL}";
+    # unset variables expand to an empty string
+    if not isinstance(value, str):
+        return value
+    return re.sub(r'\$\{(\w+)\}', lambda m: os.getenv(m.group(1), ''), value)
+
+
+def _normalize_rule(raw):
+    rule = dict(raw)
+    rule.setdefault('match', 'key')
+    source = 'layer' if rule['match'] == 'spatial' else 'csv'
+    for key in ('name', source):
+        if not rule.get(key):
+            raise ValueError(f'Watchlist rule is missing "{key}": {raw}')
+    if rule['match'] not in MATCH_MODES:
+        raise ValueError(f'Unknown match mode "{rule["match"]}" in rule {rule["name"]}')
+    rule['source'] = rule[source]
+    rule.setdefault('zone_field', None)
+    if rule['match'] == 'fuzzy':
+        rule['min_score'] = float(rule.get('min_score', DEFAULT_MIN_SCORE))
+    rule['exclude_zones'] = list(rule.get('exclude_zones') or [])
+    rule.setdefault('template', rule['name'])
+    # Checked here, so a bad rule fails before anything is fetched
+    if rule['template'] not in RENDERERS:
+        raise ValueError(
+            f'Unknown template "{rule["template"]}" in rule {rule["name"]}; '
+            f'set "template" to one of: {", ".join(RENDERERS)}'
+        )
+    rule.setdefault('subject', f'{rule["name"]} Property Matches')
+
+    recipients = _expand(rule.get('recipients') or '')
+    if isinstance(recipients, str):
+        recipients = recipients.split(',')
+    rule['recipients'] = [e.strip() for e in recipients if e and e.strip()]
+
+    airtable = rule.get('airtable')
+    rule['airtable'] = {key: _expand(value) for key, value in airtable.items()} if airtable else None
+    return rule
+
+
+def load_rules(path=RULES_FILE):
+    with open(path, 'r') as f:
+        rules = [_normalize_rule(raw) for raw in json.load(f)]
+    names = [rule['name'] for rule in rules]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f'Duplicate watchlist rule names: {", ".join(sorted(duplicates))}')
+    return rules
+
+
+def _read_watchlist(rule):
+    df = pd.read_csv(rule['csv']).dropna(subset=['Address'])
+    addresses = df['Address'].str.lower()
+    zones = df['Zone_Class'] if 'Zone_Class' in df else pd.Series([None] * len(df), index=df.index)
+    return addresses, zones
+
+
+def compile_rules(rules):
+    """Merge every rule's watchlist into one index per match mode.
+
+    ``key_index`` and ``core_index`` map a canonical address key to the
+    (rule index, first non-excluded zone) pairs of every rule that lists it;
+    ``owners[i]`` lists the (rule index, zone) pairs that own substring
+    pattern ``i`` of the shared automaton. Fuzzy rules also register their
+    keys in ``key_index`` so exact hits skip scoring.
+    """
+    patterns = {}
+    owners = []
+    key_index = {}
+    core_index = {}
+    polygons = []
+    polygon_owners = []
+    fuzzy_entries = []
+    min_scores = {}
+
+    for rule_index, rule in enumerate(rules):
+        if rule['match'] == 'spatial':
+            excluded = set(rule['exclude_zones'])
+            for feature in load_polygons(rule['layer']):
+                zone = feature['attributes'].get(rule['zone_field']) if rule['zone_field'] else None
+                if zone in excluded:
+                    continue
+                polygons.append(feature['rings'])
+                polygon_owners.append((rule_index, zone))
+            continue
+
+        addresses, zones = _read_watchlist(rule)
+
+        if rule['match'] == 'substring':
+            excluded = set(rule['exclude_zones'])
+            claimed = set()
+            for address, zone in zip(addresses, zones):
+                if zone in excluded or address in claimed:
+                    continue
+                claimed.add(address)
+                pattern_index = patterns.setdefault(address, len(patterns))
+                if pattern_index == len(owners):
+                    owners.append([])
+                owners[pattern_index].append((rule_index, zone))
+
+        else:
+            key_fn, index = (core_address_key, core_index) if rule['match'] == 'core' else (canonical_address, key_index)
+            for key, zone in build_zone_index(addresses.map(key_fn), zones, rule['exclude_zones']).items():
+                index.setdefault(key, []).append((rule_index, zone))
+                if rule['match'] == 'fuzzy':
+                    fuzzy_entries.append((key, rule_index, zone))
+            if rule['match'] == 'fuzzy':
+                min_scores[rule_index] = rule['min_score']
+
+    return {
+        'matcher': AddressMatcher(list(patterns)),
+        'owners': [tuple(owner) for owner in owners],
+        'key_index': {key: tuple(hits) for key, hits in key_index.items()},
+        'core_index': {core: tuple(hits) for core, hits in core_index.items()},
+        'polygons': PolygonIndex(polygons) if polygons else None,
+        'polygon_owners': polygon_owners,
+        'fuzzy': FuzzyIndex(fuzzy_entries, min_scores) if min_scores else None,
+    }
+
+
+class RuleEngine:
+    """Evaluates every watchlist rule in a single pass over a listing frame.
+
+    Each listing is looked up once in each combined hash index (and scanned
+    once by the shared automaton if any substring rules exist), however many
+    rules are configured. Listings without an exact hit for a fuzzy rule are
+    scored against that rule's blocked candidates, in a process pool for
+    large frames.
+    """
+
+    def __init__(self, rules, compiled):
+        self.rules = rules
+        self.matcher = compiled['matcher']
+        self.owners = compiled['owners']
+        self.key_index = compiled['key_index']
+        self.core_index = compiled['core_index']
+        self.polygons = compiled['polygons']
+        self.polygon_owners = compiled['polygon_owners']
+        self.fuzzy = compiled['fuzzy']
+        self.fuzzy_rules = frozenset(self.fuzzy.min_scores) if self.fuzzy is not None else frozenset()
+
+    def evaluate(self, listings, workers=None):
+        """Return {rule name: matched listings frame with zone_class and match_score columns}.
+
+        ``match_score`` is 1.0 for exact hits and the similarity of the best
+        candidate for fuzzy ones.
+        """
+        hits = [([], [], []) for _ in self.rules]
+        owners = self.owners
+        key_index = self.key_index
+        core_index = self.core_index
+        matcher = self.matcher if owners else None
+        polygons = self.polygons
+        polygon_owners = self.polygon_owners
+
+        addresses = listings['address'].tolist()
+        keys = listings['address_key'].tolist()
+        cores = listings['core_address'].tolist()
+        longitudes = listings['longitude'].tolist()
+        latitudes = listings['latitude'].tolist()
+        fuzzy_hits = self._fuzzy_hits(keys, workers) if self.fuzzy is not None else None
+        for position, (address, key, core, x, y) in enumerate(zip(addresses, keys, cores, longitudes, latitudes)):
+            seen = set()
+            for rule_index, zone in key_index.get(key, ()) + core_index.get(core, ()):
+                if rule_index not in seen:
+                    seen.add(rule_index)
+                    hits[rule_index][0].append(position)
+                    hits[rule_index][1].append(zone)
+                    hits[rule_index][2].append(1.0)
+            if matcher is not None:
+                for pattern_index in matcher.iter_matches(address):
+                    for rule_index, zone in owners[pattern_index]:
+                        if rule_index not in seen:
+                            seen.add(rule_index)
+                            hits[rule_index][0].append(position)
+                            hits[rule_index][1].append(zone)
+                            hits[rule_index][2].append(1.0)
+            if polygons is not None:
+                for polygon_index in polygons.query(x, y):
+                    rule_index, zone = polygon_owners[polygon_index]
+                    if rule_index not in seen:
+                        seen.add(rule_index)
+                        hits[rule_index][0].append(position)
+                        hits[rule_index][1].append(zone)
+                        hits[rule_index][2].append(1.0)
+            if fuzzy_hits is not None:
+                for rule_index, zone, score in fuzzy_hits[position]:
+                    if rule_index not in seen:
+                        seen.add(rule_index)
+                        hits[rule_index][0].append(position)
+                        hits[rule_index][1].append(zone)
+                        hits[rule_index][2].append(score)
+
+        results = {}
+        for rule, (positions, zones, scores) in zip(self.rules, hits):
+            matched = listings.iloc[positions].assign(zone_class=zones, match_score=scores)
+            results[rule['name']] = apply_thresholds(rule, matched)
+        return results
+
+    def _fuzzy_hits(self, keys, workers=None):
+        # Only keys without an exact hit for every fuzzy rule are scored, each
+        # distinct key once; results are scattered back by position
+        key_index = self.key_index
+        fuzzy_rules = self.fuzzy_rules
+        positions = {}
+        for position, key in enumerate(keys):
+            if not fuzzy_rules <= {rule_index for rule_index, _ in key_index.get(key, ())}:
+                positions.setdefault(key, []).append(position)
+
+        hits = [()] * len(keys)
+        for key, matched in zip(positions, self.fuzzy.match_many(list(positions), workers)):
+            for position in positions[key]:
+                hits[position] = matched
+        return hits
+
+
+def apply_thresholds(rule, matched):
+    for key, (column, op) in THRESHOLDS.items():
+        limit = rule.get(key)
+        if limit is None:
+            continue
+        matched = matched[matched[column] >= limit] if op == '>=' else matched[matched[column] <= limit]
+    return matched
+
+
+def load_rule_engine(rules, cache_dir=CACHE_DIR, rebuild=False):
+    # The compiled index depends on the CSVs and on how each rule reads them
+    spec = [
+        (rule['source'], rule['match'], rule['exclude_zones'], rule['zone_field'], rule.get('min_score'))
+        for rule in rules
+    ]
+    kind = 'rules-' + hashlib.sha1(json.dumps(spec).encode()).hexdigest()[:8]
+    paths = sorted({rule['source'] for rule in rules})
+    compiled = load_compiled(paths, kind, lambda _: compile_rules(rules), cache_dir, rebuild)
+    return RuleEngine(rules, compiled)
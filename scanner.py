@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from listing_store import listing_key
+from zillow import fetch_page
+
+SCANS_FILE = 'locations.json'
+
+
+def load_scans(path, default_query, rule_names):
+    """Read the location searches to run, one Zillow query each.
+
+    Each entry has a ``name``, the query parameters (``location``,
+    ``status_type``, ``home_type``, ``daysOn``, ...; anything left out comes
+    from ``default_query``) and optionally ``rules``, the watchlist rules
+    that apply to listings it finds (all of them by default). Without a
+    file there is one search, ``default_query`` itself.
+    """
+    if not os.path.exists(path):
+        return [{'name': default_query['location'], 'query': dict(default_query), 'rules': frozenset(rule_names)}]
+
+    with open(path, 'r') as f:
+        raw_scans = json.load(f)
+
+    scans = []
+    for raw in raw_scans:
+        raw = dict(raw)
+        name = raw.pop('name', None) or raw.get('location')
+        rules = raw.pop('rules', None)
+        if not name or not raw.get('location', default_query.get('location')):
+            raise ValueError(f'Location search is missing "location": {raw}')
+        unknown = set(rules or ()) - set(rule_names)
+        if unknown:
+            raise ValueError(f'Location search {name} names unknown rules: {", ".join(sorted(unknown))}')
+        scans.append({
+            'name': name,
+            'query': {**default_query, **{key: str(value) for key, value in raw.items()}},
+            'rules': frozenset(rule_names if rules is None else rules),
+        })
+    names = [scan['name'] for scan in scans]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Duplicate location search names in {path}')
+    return scans
+
+
+class RequestBudget:
+    """Caps the requests one run may make across every search (None: no cap)."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if self.limit is not None and self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+
+def iter_scan_pages(client, url, headers, scans, max_workers=1, budget=None):
+    """Yield ``(scan index, page number, props)`` for every page of every search.
+
+    All searches share one worker pool, one client (so one token bucket and
+    circuit breaker) and one request budget. First pages are queued first and
+    each search's remaining pages as soon as its first page says how many
+    there are, so the run takes about as long as the slowest search. At most
+    ``max_workers`` pages are in flight; the next queued page is requested
+    as one completes. Pages are yielded in completion order.
+    """
+    budget = budget or RequestBudget()
+    window = max(1, max_workers)
+    queued = deque((index, 1) for index in range(len(scans)))
+    with ThreadPoolExecutor(max_workers=window) as executor:
+        futures = {}
+
+        def fill():
+            while queued and len(futures) < window:
+                index, page = queued.popleft()
+                if not budget.take():
+                    logging.warning(f'Request budget of {budget.limit} spent; skipping {scans[index]["name"]} page {page}')
+                    continue
+                future = executor.submit(fetch_page, client, url, headers, scans[index]['query'], page)
+                futures[future] = (index, page)
+
+        fill()
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                index, page = futures.pop(future)
+                data = future.result()
+                if page == 1:
+                    queued.extend((index, next_page) for next_page in range(2, data.get('totalPages', 1) + 1))
+                fill()
+                yield index, page, data.get('props', [])
+
+
+class ScanDeduper:
+    """Tracks which rules each listing has been granted across searches.
+
+    A listing found by several overlapping searches is matched once, against
+    the union of their rules; if a later search grants rules the listing
+    has not been matched against yet, it is passed on again for those only.
+    """
+
+    def __init__(self, scans):
+        self.scans = scans
+        self.granted = {}
+        self.found = 0
+
+    def add(self, index, props):
+        """Return ``(entry, rules)`` for each listing with rules still to match."""
+        rules = self.scans[index]['rules']
+        fresh = []
+        for entry in props:
+            self.found += 1
+            key = listing_key(entry)
+            granted = self.granted.get(key, frozenset())
+            new_rules = rules - granted
+            if key not in self.granted or new_rules:
+                self.granted[key] = granted | rules
+                fresh.append((entry, new_rules))
+        return fresh
+
+    def collect(self, pages):
+        """Return the unique listings of ``(index, page, props)`` results, in search and page order."""
+        listings = {}
+        for index, _, props in sorted(pages, key=lambda item: item[:2]):
+            for entry, _ in self.add(index, props):
+                listings.setdefault(listing_key(entry), entry)
+        return list(listings.values())
+
+
+def restrict_matches(matches, entry_rules):
+    """Drop matches for rules the listing's searches do not apply.
+
+    ``entry_rules[i]`` is the rule set for row ``i`` of the frame that was
+    evaluated; each matched frame keeps that frame's index.
+    """
+    restricted = {}
+    for name, matched in matches.items():
+        if len(matched) and not all(name in entry_rules[i] for i in matched.index):
+            matched = matched[[name in entry_rules[i] for i in matched.index]]
+        restricted[name] = matched
+    return restricted
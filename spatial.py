@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from arcgis_download import get_object_ids, make_arcgis_client, query, split_ranges
+
+# Layers the watchlists were derived from; queried in WGS84 so they line up
+# with the latitude/longitude Zillow returns
+LAYERS = {
+    'ntm': {
+        'url': "https://egis.stpete.org/arcgis/rest/services/ServicesDSD/NTM/MapServer/0",
+        'where': '1=1',
+        'out_fields': 'OBJECTID,TYPE,ACRES',
+    },
+    'zoning': {
+        'url': "https://egis.stpete.org/arcgis/rest/services/ServicesDOTS/Zoning/MapServer/2",
+        'where': '1=1',
+        'out_fields': '*',
+    },
+}
+LAYER_DIR = 'layers'
+
+
+def download_polygons(layer_url, path, where='1=1', out_fields='*', chunk_size=500, max_workers=4, client=None):
+    """Save a polygon layer's attributes and rings (in lon/lat) to a local JSON file."""
+    client = client or make_arcgis_client(pool_size=max_workers)
+    ranges = split_ranges(get_object_ids(client, layer_url, where), chunk_size)
+
+    def fetch(object_range):
+        first, last = object_range
+        params = {
+            'where': f"OBJECTID >= {first} AND OBJECTID <= {last} AND ({where})",
+            'outFields': out_fields,
+            'returnGeometry': 'true',
+            'outSR': 4326,
+            'resultOffset': 0,
+        }
+        features = []
+        while True:
+            data = query(client, layer_url, params)
+            page = data.get('features', [])
+            features.extend(
+                {'attributes': feature['attributes'], 'rings': (feature.get('geometry') or {}).get('rings', [])}
+                for feature in page
+            )
+            if not data.get('exceededTransferLimit') or not page:
+                return features
+            params['resultOffset'] += len(page)
+
+    features = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in executor.map(fetch, ranges):
+            features.extend(chunk)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'layer_url': layer_url, 'where': where, 'features': features}, f)
+    os.replace(f'{path}.tmp', path)
+    logging.info(f'Saved {len(features)} polygons from {layer_url} to {path}')
+    return path
+
+
+def load_polygons(path):
+    with open(path, 'r') as f:
+        return json.load(f)['features']
+
+
+class PolygonIndex:
+    """Uniform-grid spatial index answering point-in-polygon queries.
+
+    Each polygon is registered in every grid cell its bounding box touches;
+    a query checks only the polygons in the point's cell, first by bounding
+    box and then with an even-odd ray cast over all of the polygon's rings
+    (so holes are handled).
+    """
+
+    def __init__(self, polygons, cell_size=None):
+        self.edges = []
+        bboxes = []
+        for rings in polygons:
+            starts, ends = [], []
+            for ring in rings:
+                if len(ring) < 3:
+                    continue
+                points = np.asarray(ring, dtype=float)[:, :2]
+                starts.append(points)
+                ends.append(np.roll(points, -1, axis=0))
+            if starts:
+                start = np.concatenate(starts)
+                end = np.concatenate(ends)
+                self.edges.append((start[:, 0], start[:, 1], end[:, 0], end[:, 1]))
+                bboxes.append((start[:, 0].min(), start[:, 1].min(), start[:, 0].max(), start[:, 1].max()))
+            else:
+                self.edges.append(None)
+                bboxes.append((np.inf, np.inf, -np.inf, -np.inf))
+        self.bboxes = np.array(bboxes, dtype=float).reshape(-1, 4)
+
+        valid = np.isfinite(self.bboxes).all(axis=1)
+        if cell_size is None:
+            # About one typical polygon per cell
+            spans = np.maximum(self.bboxes[valid, 2] - self.bboxes[valid, 0], self.bboxes[valid, 3] - self.bboxes[valid, 1])
+            cell_size = float(np.median(spans)) if len(spans) and np.median(spans) > 0 else 1.0
+        self.cell_size = cell_size
+
+        self.grid = {}
+        for index in np.flatnonzero(valid):
+            min_x, min_y, max_x, max_y = self.bboxes[index]
+            for gx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for gy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self.grid.setdefault((gx, gy), []).append(int(index))
+
+    def __len__(self):
+        return len(self.edges)
+
+    def _cell(self, value):
+        return int(np.floor(value / self.cell_size))
+
+    def _contains(self, index, x, y):
+        x1, y1, x2, y2 = self.edges[index]
+        crossing = (y1 > y) != (y2 > y)
+        if not crossing.any():
+            return False
+        x1, y1, x2, y2 = x1[crossing], y1[crossing], x2[crossing], y2[crossing]
+        intersect_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        return np.count_nonzero(x < intersect_x) % 2 == 1
+
+    def query(self, x, y):
+        """Return the indices of every polygon containing the point."""
+        if x != x or y != y:
+            return []
+        hits = []
+        for index in self.grid.get((self._cell(x), self._cell(y)), ()):
+            min_x, min_y, max_x, max_y = self.bboxes[index]
+            if min_x <= x <= max_x and min_y <= y <= max_y and self._contains(index, x, y):
+                hits.append(index)
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download polygon layers for spatial watchlist matching')
+    parser.add_argument('command', choices=['download'])
+    parser.add_argument('layers', nargs='*', default=list(LAYERS), help=f'layers to download ({", ".join(LAYERS)})')
+    parser.add_argument('--dir', default=LAYER_DIR)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    for name in args.layers:
+        layer = LAYERS[name]
+        path = download_polygons(
+            layer['url'], os.path.join(args.dir, f'{name}.json'),
+            where=layer['where'], out_fields=layer['out_fields'], max_workers=args.workers
+        )
+        print(f"{name}: saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
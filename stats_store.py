@@ -0,0 +1,203 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+STATS_DB = 'stats.db'
+LEGACY_STATS_FILE = 'daily_stats.json'
+
+
+class StatsStore:
+    """Append-only log of run statistics.
+
+    Every run appends one ``runs`` row plus a match count and the matched
+    links per rule; nothing is rewritten or cleared. Summaries over any date
+    range are GROUP BY queries on the date indexes, so their cost depends on
+    the range asked for, not on how much history has built up.
+
+    Each run scans the whole day's listings again (a daemon polls dozens of
+    times a day), so a day's listings scanned is its largest run, not the
+    sum of its runs. Matches are only counted for new or changed listings
+    and do add up.
+    """
+
+    def __init__(self, path=STATS_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            '''CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                recorded_at TEXT NOT NULL,
+                total_scanned INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS runs_date ON runs (date);
+            CREATE TABLE IF NOT EXISTS run_matches (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                date TEXT NOT NULL,
+                rule TEXT NOT NULL,
+                matches INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS run_matches_date ON run_matches (date, rule);
+            CREATE TABLE IF NOT EXISTS match_links (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                date TEXT NOT NULL,
+                rule TEXT NOT NULL,
+                address TEXT,
+                url TEXT
+            );
+            CREATE INDEX IF NOT EXISTS match_links_date ON match_links (date, rule);'''
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, total_scanned, matched_by_rule, date=None):
+        """Append one run: ``matched_by_rule`` maps a rule name to its matched properties."""
+        return self._append(
+            date or datetime.now().strftime('%Y-%m-%d'),
+            datetime.now().isoformat(timespec='seconds'),
+            total_scanned,
+            {rule: len(properties) for rule, properties in matched_by_rule.items()},
+            [
+                (rule, p.get('address', ''), p.get('detailUrl', ''))
+                for rule, properties in matched_by_rule.items() for p in properties
+            ]
+        )
+
+    def _append(self, date, recorded_at, total_scanned, counts, links):
+        with self.conn:
+            run_id = self.conn.execute(
+                'INSERT INTO runs (date, recorded_at, total_scanned) VALUES (?, ?, ?)',
+                (date, recorded_at, total_scanned)
+            ).lastrowid
+            self.conn.executemany(
+                'INSERT INTO run_matches (run_id, date, rule, matches) VALUES (?, ?, ?, ?)',
+                ((run_id, date, rule, count) for rule, count in counts.items())
+            )
+            self.conn.executemany(
+                'INSERT INTO match_links (run_id, date, rule, address, url) VALUES (?, ?, ?, ?, ?)',
+                ((run_id, date, rule, address, url) for rule, address, url in links)
+            )
+        return run_id
+
+    def rules(self, start, end):
+        """Names of the rules with runs recorded between two ISO dates, in the order first recorded."""
+        return [rule for rule, in self.conn.execute(
+            'SELECT rule FROM run_matches WHERE date BETWEEN ? AND ? GROUP BY rule ORDER BY MIN(rowid)',
+            (start, end)
+        )]
+
+    def days(self, start, end):
+        """Per-day totals between two ISO dates (inclusive), oldest first.
+
+        Each day has ``date`` and ``total_scanned`` plus ``<rule>_matches`` and
+        ``<rule>_links`` for every rule recorded in the range, zero and empty
+        on days it has no runs. Matches from several runs on one day are
+        summed; listings scanned is the day's largest run.
+        """
+        rules = self.rules(start, end)
+        days = {}
+        for date, total_scanned in self.conn.execute(
+            'SELECT date, MAX(total_scanned) FROM runs WHERE date BETWEEN ? AND ? GROUP BY date ORDER BY date',
+            (start, end)
+        ):
+            day = {'date': date, 'total_scanned': total_scanned}
+            for rule in rules:
+                day[f'{rule}_matches'] = 0
+                day[f'{rule}_links'] = []
+            days[date] = day
+
+        for date, rule, matches in self.conn.execute(
+            'SELECT date, rule, SUM(matches) FROM run_matches WHERE date BETWEEN ? AND ? GROUP BY date, rule',
+            (start, end)
+        ):
+            days[date][f'{rule}_matches'] = matches
+
+        for date, rule, address, url in self.conn.execute(
+            'SELECT date, rule, address, url FROM match_links WHERE date BETWEEN ? AND ? ORDER BY rowid',
+            (start, end)
+        ):
+            days[date][f'{rule}_links'].append({'address': address, 'url': url})
+        return list(days.values())
+
+    def summary(self, start, end):
+        """Totals between two ISO dates (inclusive): runs, listings scanned and matches per rule."""
+        runs, total_scanned = self.conn.execute(
+            '''SELECT COALESCE(SUM(runs), 0), COALESCE(SUM(scanned), 0) FROM (
+                   SELECT COUNT(*) AS runs, MAX(total_scanned) AS scanned
+                   FROM runs WHERE date BETWEEN ? AND ? GROUP BY date
+               )''',
+            (start, end)
+        ).fetchone()
+        matches = dict(self.conn.execute(
+            'SELECT rule, SUM(matches) FROM run_matches WHERE date BETWEEN ? AND ? GROUP BY rule ORDER BY rule',
+            (start, end)
+        ).fetchall())
+        return {'start': start, 'end': end, 'runs': runs, 'total_scanned': total_scanned, 'matches': matches}
+
+    def import_legacy(self, path=LEGACY_STATS_FILE):
+        """Append the entries of an old daily_stats.json, then rename it out of the way."""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            entries = []
+
+        for entry in entries:
+            # Each rule the entry has a count for, e.g. ntm from "ntm_matches"
+            rules = [key[:-len('_matches')] for key in entry if key.endswith('_matches')]
+            self._append(
+                entry['date'],
+                entry['date'],
+                entry.get('total_scanned', 0),
+                {rule: entry[f'{rule}_matches'] for rule in rules},
+                [
+                    (rule, link.get('address', ''), link.get('url', ''))
+                    for rule in rules for link in entry.get(f'{rule}_links', [])
+                ]
+            )
+        os.replace(path, f'{path}.imported')
+        logging.info(f'Imported {len(entries)} entries from {path} into {self.path}')
+        return len(entries)
+
+
+def date_range(days, end=None):
+    # The ``days`` days up to and including ``end`` (today by default)
+    end = end or datetime.now()
+    return (end - timedelta(days=days)).strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summaries of the property monitor run history')
+    parser.add_argument('--db', default=STATS_DB)
+    parser.add_argument('--days', type=int, default=7, help='summarize the last N days')
+    parser.add_argument('--start', help='first date (YYYY-MM-DD), overrides --days')
+    parser.add_argument('--end', help='last date (YYYY-MM-DD)')
+    parser.add_argument('--daily', action='store_true', help='one line per day')
+    args = parser.parse_args()
+
+    start, end = date_range(args.days)
+    start, end = args.start or start, args.end or end
+    with StatsStore(args.db) as store:
+        if args.daily:
+            for day in store.days(start, end):
+                counts = ', '.join(f'{k[:-8]}={v}' for k, v in day.items() if k.endswith('_matches'))
+                print(f"{day['date']}  scanned={day['total_scanned']}  {counts}")
+        else:
+            print(json.dumps(store.summary(start, end), indent=2))
+
+
+if __name__ == '__main__':
+    main()
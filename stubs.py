@@ -0,0 +1,372 @@
+import json
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the external APIs, for exercising the pipeline
+# without live credentials.
+
+
+class StubServer:
+    """Threaded HTTP server on localhost that records every request it gets."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._dispatch(self, 'GET')
+
+            def do_POST(self):
+                stub._dispatch(self, 'POST')
+
+            def do_PATCH(self):
+                stub._dispatch(self, 'PATCH')
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, method=None, path=None):
+        with self._lock:
+            return sum(
+                1 for call in self.calls
+                if (method is None or call['method'] == method) and (path is None or call['path'] == path)
+            )
+
+    def _dispatch(self, handler, method):
+        parsed = urllib.parse.urlparse(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        raw_body = handler.rfile.read(length) if length else b''
+        call = {
+            'method': method,
+            'path': parsed.path,
+            'params': dict(urllib.parse.parse_qsl(parsed.query)),
+            'headers': dict(handler.headers),
+            'body': json.loads(raw_body) if raw_body else None,
+        }
+        with self._lock:
+            self.calls.append(call)
+        status, payload, headers = self.handle(call)
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, str(value))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def handle(self, call):
+        # Return (status, json payload, extra headers)
+        return 404, {'error': 'not found'}, None
+
+
+class StubZillowServer(StubServer):
+    """Serves propertyExtendedSearch pages from a list of ``props`` lists.
+
+    ``failures`` maps a page number to how many times that page should fail
+    with ``failure_status`` (sent with ``retry_after`` as Retry-After, if
+    given) before it succeeds. ``quota`` sends RapidAPI's remaining-quota
+    headers and answers 429 once it is used up, until ``quota_reset``
+    seconds after the window opened.
+    """
+
+    def __init__(self, pages, failures=None, delay=0, failure_status=500, retry_after=None, quota=None, quota_reset=60):
+        super().__init__()
+        self.pages = pages
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.quota = quota
+        self.quota_limit = quota
+        self.quota_reset = quota_reset
+        self._window = time.monotonic()
+
+    def handle(self, call):
+        page = int(call['params'].get('page', 1))
+        headers = {}
+        with self._lock:
+            remaining = self.failures.get(page, 0)
+            if remaining:
+                self.failures[page] = remaining - 1
+            if self.quota is not None:
+                if time.monotonic() - self._window >= self.quota_reset:
+                    self.quota, self._window = self.quota_limit, time.monotonic()
+                exhausted = self.quota <= 0
+                self.quota = max(0, self.quota - 1)
+                headers = {
+                    'X-RateLimit-Requests-Remaining': self.quota,
+                    'X-RateLimit-Requests-Reset': max(0, int(self.quota_reset - (time.monotonic() - self._window))),
+                }
+                if exhausted:
+                    return 429, {'message': 'You have exceeded the rate limit per hour for your plan'}, headers
+        if remaining:
+            if self.retry_after is not None:
+                headers['Retry-After'] = self.retry_after
+            return self.failure_status, {'message': 'stub failure'}, headers
+        if self.delay:
+            threading.Event().wait(self.delay)
+        if page < 1 or page > len(self.pages):
+            return 200, {'props': [], 'totalPages': len(self.pages)}, headers
+        return 200, {'props': self.pages[page - 1], 'totalPages': len(self.pages)}, headers
+
+
+class FakeAirtableServer(StubServer):
+    """In-memory Airtable table speaking the list and batch-create endpoints.
+
+    ``rate_limit`` is the number of requests allowed per rolling second;
+    anything over it gets a 429, like the real API.
+    """
+
+    def __init__(self, records=None, page_size=100, rate_limit=None, retry_after=None):
+        super().__init__()
+        self.records = [
+            {'id': f'rec{i}', 'fields': dict(fields)} for i, fields in enumerate(records or [])
+        ]
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._recent = []
+
+    def api_url(self):
+        return f"{self.url}/v0"
+
+    def _throttled(self):
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            if len(self._recent) >= self.rate_limit:
+                return True
+            self._recent.append(now)
+        return False
+
+    def handle(self, call):
+        if self._throttled():
+            headers = {'Retry-After': self.retry_after} if self.retry_after is not None else None
+            return 429, {'errors': [{'error': 'RATE_LIMIT_REACHED'}]}, headers
+
+        if call['method'] == 'GET':
+            page_size = min(int(call['params'].get('pageSize', self.page_size)), self.page_size)
+            start = int(call['params'].get('offset', 0))
+            with self._lock:
+                page = self.records[start:start + page_size]
+                more = start + page_size < len(self.records)
+            payload = {'records': page}
+            if more:
+                payload['offset'] = str(start + page_size)
+            return 200, payload, None
+
+        if call['method'] == 'POST':
+            new_records = (call['body'] or {}).get('records', [])
+            if len(new_records) > 10:
+                return 422, {'error': {'type': 'INVALID_RECORDS', 'message': 'Too many records'}}, None
+            created = []
+            with self._lock:
+                for record in new_records:
+                    created.append({'id': f'rec{len(self.records)}', 'fields': record.get('fields', {})})
+                    self.records.append(created[-1])
+            return 200, {'records': created}, None
+
+        return 405, {'error': 'method not allowed'}, None
+
+
+class FakeSendGridServer(StubServer):
+    """Accepts v3 mail sends; point a Mailer at it with ``host=server.url``.
+
+    The first ``failures`` sends get a 500 and every send waits ``delay``
+    seconds, to exercise retries and slow deliveries.
+    """
+
+    def __init__(self, failures=0, delay=0):
+        super().__init__()
+        self.failures = failures
+        self.delay = delay
+
+    @property
+    def messages(self):
+        with self._lock:
+            return [call['body'] for call in self.calls if call['method'] == 'POST' and call['path'] == '/v3/mail/send']
+
+    def handle(self, call):
+        if call['method'] != 'POST' or call['path'] != '/v3/mail/send':
+            return 404, {'errors': [{'message': 'not found'}]}, None
+        with self._lock:
+            failing = self.failures > 0
+            if failing:
+                self.failures -= 1
+        if self.delay:
+            threading.Event().wait(self.delay)
+        if failing:
+            return 500, {'errors': [{'message': 'stub failure'}]}, None
+        return 202, {}, None
+
+
+class StubArcGISServer(StubServer):
+    """Serves ``<layer>/query`` for in-memory layers of attribute dicts.
+
+    ``layers`` maps a layer path (e.g. ``/TaxParcels/MapServer/0``) to its
+    features. Understands the subset of the REST API the fetchers use:
+    simple AND-ed where clauses (including timestamp literals), objectIds,
+    returnIdsOnly, returnCountOnly, paging and ordering. ``geometries`` maps
+    a layer path to ``{OBJECTID: geometry}`` for returnGeometry.
+    ``edit_fields`` maps a layer path to its editor-tracking date field and
+    ``fields`` to its ``[{'name': ..., 'type': 'esriFieldType...'}]`` list,
+    both reported by the layer's own ``?f=json`` description.
+    """
+
+    def __init__(self, layers, max_record_count=1000, failures=0, geometries=None, edit_fields=None, fields=None):
+        super().__init__()
+        self.layers = layers
+        self.max_record_count = max_record_count
+        self.failures = failures
+        self.geometries = geometries or {}
+        self.edit_fields = edit_fields or {}
+        self.fields = fields or {}
+
+    def layer_url(self, path):
+        return f"{self.url}{path}"
+
+    @staticmethod
+    def _condition(clause):
+        clause = clause.strip().strip('()').strip()
+        if clause == '1=1':
+            return lambda row: True
+        for op in ('>=', '<=', '>', '<', '='):
+            if op in clause:
+                field, value = (part.strip() for part in clause.split(op, 1))
+                if value.startswith('timestamp '):
+                    # Dates are epoch milliseconds, like the real service returns
+                    stamp = datetime.strptime(value[len('timestamp '):].strip("'"), '%Y-%m-%d %H:%M:%S')
+                    value = stamp.replace(tzinfo=timezone.utc).timestamp() * 1000
+                elif value.startswith("'"):
+                    value = value.strip("'")
+                else:
+                    value = float(value)
+                compare = {
+                    '>=': lambda a, b: a is not None and a >= b,
+                    '<=': lambda a, b: a is not None and a <= b,
+                    '>': lambda a, b: a is not None and a > b,
+                    '<': lambda a, b: a is not None and a < b,
+                    '=': lambda a, b: a == b,
+                }[op]
+                return lambda row: compare(row.get(field), value)
+        raise ValueError(f'Unsupported where clause: {clause}')
+
+    def handle(self, call):
+        if call['path'] in self.layers:
+            edit_field = self.edit_fields.get(call['path'])
+            info = {'name': call['path'], 'objectIdField': 'OBJECTID'}
+            if edit_field:
+                info['editFieldsInfo'] = {'editDateField': edit_field}
+            if call['path'] in self.fields:
+                info['fields'] = self.fields[call['path']]
+            return 200, info, None
+        if not call['path'].endswith('/query'):
+            return 404, {'error': {'code': 404, 'message': 'not found'}}, None
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                return 503, {'error': {'code': 503, 'message': 'stub failure'}}, None
+
+        layer = call['path'][:-len('/query')]
+        rows = self.layers.get(layer)
+        if rows is None:
+            return 200, {'error': {'code': 400, 'message': 'Invalid layer'}}, None
+
+        params = call['params']
+        conditions = [self._condition(clause) for clause in params.get('where', '1=1').split(' AND ')]
+        matched = [row for row in rows if all(condition(row) for condition in conditions)]
+        if params.get('objectIds'):
+            object_ids = {int(object_id) for object_id in params['objectIds'].split(',')}
+            matched = [row for row in matched if row['OBJECTID'] in object_ids]
+
+        if params.get('returnIdsOnly') == 'true':
+            return 200, {'objectIdFieldName': 'OBJECTID', 'objectIds': [row['OBJECTID'] for row in matched]}, None
+        if params.get('returnCountOnly') == 'true':
+            return 200, {'count': len(matched)}, None
+
+        if params.get('orderByFields'):
+            field = params['orderByFields'].split()[0]
+            matched.sort(key=lambda row: row.get(field))
+        offset = int(params.get('resultOffset', 0))
+        count = min(int(params.get('resultRecordCount', self.max_record_count)), self.max_record_count)
+        page = matched[offset:offset + count]
+
+        out_fields = params.get('outFields', '*')
+        if out_fields != '*':
+            fields = out_fields.split(',')
+            page = [{field: row.get(field) for field in fields} for row in page]
+
+        if params.get('returnGeometry') == 'true':
+            geometries = self.geometries.get(layer, {})
+            features = [
+                {'attributes': row, 'geometry': geometries.get(full_row['OBJECTID'])}
+                for row, full_row in zip(page, matched[offset:offset + count])
+            ]
+        else:
+            features = [{'attributes': row} for row in page]
+        payload = {'features': features}
+        if offset + count < len(matched):
+            payload['exceededTransferLimit'] = True
+        return 200, payload, None
+
+
+class StubGeocoderServer(StubServer):
+    """GeocodeServer stand-in whose reverseGeocode answers from the coordinates.
+
+    Like the real service it reports errors inside a 200: the first
+    ``failures`` calls get a code 500 error, and points whose whole x is in
+    ``no_address`` get the code 400 "Unable to find address" answer.
+    """
+
+    def __init__(self, failures=0, no_address=()):
+        super().__init__()
+        self.failures = failures
+        self.no_address = set(no_address)
+
+    def handle(self, call):
+        if not call['path'].endswith('/reverseGeocode'):
+            return 404, {'error': {'code': 404, 'message': 'not found'}}, None
+        with self._lock:
+            failing = self.failures > 0
+            if failing:
+                self.failures -= 1
+        if failing:
+            return 200, {'error': {'code': 500, 'message': 'Unable to complete operation.'}}, None
+        location = json.loads(call['params']['location'])
+        if int(location['x']) in self.no_address:
+            return 200, {'error': {
+                'code': 400, 'message': 'Cannot perform query. Invalid query parameters.',
+                'details': ['Unable to find address for the specified location.'],
+            }}, None
+        address = f"{int(location['x']) % 10000} STUB ST N"
+        return 200, {'address': {'Match_addr': address}, 'location': location}, None
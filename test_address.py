@@ -0,0 +1,54 @@
+import pytest
+from address import canonical_address, core_address_key
+
+
+@pytest.mark.parametrize('address, expected', [
+    # Suffixes and directionals
+    ('123 Main Street North', '123 MAIN ST N'),
+    ('123 Main St. N.', '123 MAIN ST N'),
+    ('45 Oak Avenue Southeast', '45 OAK AVE SE'),
+    ('45 Oak Av SE', '45 OAK AVE SE'),
+    ('9 Coffee Pot Boulevard Northeast', '9 COFFEE POT BLVD NE'),
+    ('700 Bayou Grande Drive', '700 BAYOU GRANDE DR'),
+    ('12 Snell Isle', '12 SNELL ISLE'),
+    ('12 Snell Isle Boulevard', '12 SNELL ISLE BLVD'),
+    ('3 Treasure Island', '3 TREASURE IS'),
+    ('55 West Way', '55 W WAY'),
+    # Saint
+    ('100 Saint Petersburg Drive', '100 ST PETERSBURG DR'),
+    ('100 St. Petersburg Dr', '100 ST PETERSBURG DR'),
+    ("200 Saint John's Place", '200 ST JOHNS PL'),
+    # Ordinal words and numbers, including mis-suffixed ones
+    ('123 Third Avenue North', '123 3RD AVE N'),
+    ('123 3rd Ave N', '123 3RD AVE N'),
+    ('800 Twelfth Street South', '800 12TH ST S'),
+    ('10 1th St N', '10 1ST ST N'),
+    ('10 2st St N', '10 2ND ST N'),
+    ('10 11st St N', '10 11TH ST N'),
+    ('10 22th Ave S', '10 22ND AVE S'),
+    ('10 113rd Ave S', '10 113TH AVE S'),
+    # Unit designators, with and without a space after #
+    ('123 3rd Ave N, Apt 4', '123 3RD AVE N'),
+    ('123 3rd Ave N Apt 4', '123 3RD AVE N'),
+    ('123 3rd Ave N Unit B', '123 3RD AVE N'),
+    ('123 3rd Ave N #4', '123 3RD AVE N'),
+    ('123 3rd Ave N # 4', '123 3RD AVE N'),
+    ('123 3rd Ave N Suite 200 Bldg C', '123 3RD AVE N'),
+    # Everything after the first comma is dropped
+    ('123 3rd Ave N, St Petersburg, FL 33701', '123 3RD AVE N'),
+    ('', ''),
+    (None, ''),
+])
+def test_canonical_address(address, expected):
+    assert canonical_address(address) == expected
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('123 Third Avenue North, Apt 4', '123 3RD AVE'),
+    ('123 3rd Ave S', '123 3RD AVE'),
+    ('100 Saint Petersburg Drive', '100 ST PETERSBURG'),
+    ('12 Snell Isle Blvd NE #3', '12 SNELL ISLE'),
+    ('5 Main', '5 MAIN'),
+])
+def test_core_address_key(address, expected):
+    assert core_address_key(address) == expected
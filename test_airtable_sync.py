@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+import requests
+from airtable_sync import AirtableClient, RateLimiter, base_limiter
+from main import update_NTMairtable
+from stubs import FakeAirtableServer
+
+
+def make_properties(count, start=0):
+    return [
+        {'address': f'{i} main st n', 'detailUrl': f'https://example.com/{i}', 'lotAreaValue': 5000,
+         'price': 100000 + i, 'imgSrc': '', 'ntm_map_url': '', 'zoning_map_url': ''}
+        for i in range(start, start + count)
+    ]
+
+
+def sync(server, properties, rate=1000):
+    update_NTMairtable(properties, api_url=server.api_url(), base_id='app1', table_name='Properties',
+                       access_token='token', rate=rate)
+
+
+def test_one_name_fetch_and_batches_of_ten():
+    existing = [{'Name': f'Existing {i}'} for i in range(150)]
+    with FakeAirtableServer(existing) as server:
+        sync(server, make_properties(25))
+        # 150 existing records: two list pages, then 25 new ones in three batches
+        assert server.count('GET') == 2
+        assert server.count('POST') == 3
+        assert len(server.records) == 175
+
+
+def test_duplicates_are_skipped():
+    with FakeAirtableServer([{'Name': '1 main st n'}]) as server:
+        properties = make_properties(3)
+        sync(server, properties + properties[:2])
+        assert server.count('GET') == 1
+        assert server.count('POST') == 1
+        assert sorted(r['fields']['Name'] for r in server.records) == ['0 main st n', '1 main st n', '2 main st n']
+
+        # A second sync of the same properties writes nothing
+        sync(server, properties)
+        assert server.count('POST') == 1
+
+
+def test_nothing_new_makes_no_writes():
+    with FakeAirtableServer() as server:
+        sync(server, [])
+        assert server.count('GET') == 1
+        assert server.count('POST') == 0
+
+
+def test_429_waits_and_retries():
+    with FakeAirtableServer(rate_limit=2, retry_after=1) as server:
+        sync(server, make_properties(20))
+        # The Name fetch and the first batch get through; the second batch is
+        # refused once and written after waiting out Retry-After
+        assert server.count('GET') == 1
+        assert server.count('POST') == 3
+        assert sorted(r['fields']['Name'] for r in server.records) == sorted(p['address'] for p in make_properties(20))
+
+
+def test_429_raises_once_retries_are_spent():
+    with FakeAirtableServer(rate_limit=1, retry_after=0.01) as server:
+        client = AirtableClient('app1', 'Properties', 'token', api_url=server.api_url(), rate=1000, max_retries=0)
+        client.list_field('Name')
+        with pytest.raises(requests.HTTPError):
+            client.list_field('Name')
+
+
+def test_sends_the_access_token():
+    with FakeAirtableServer() as server:
+        sync(server, make_properties(1))
+        assert all(call['headers'].get('Authorization') == 'Bearer token' for call in server.calls)
+        assert server.calls[-1]['path'] == '/v0/app1/Properties'
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_clients_of_one_base_share_a_limiter():
+    first = AirtableClient('appA', 'One', 'token')
+    assert AirtableClient('appA', 'Two', 'token').limiter is first.limiter
+    assert AirtableClient('appB', 'One', 'token').limiter is not first.limiter
+    assert base_limiter('appA') is first.limiter
+
+
+def test_concurrent_deliveries_to_one_base_stay_under_its_limit():
+    with FakeAirtableServer(rate_limit=10, retry_after=1) as server:
+        # Three deliveries at once, each allowed 8 requests a second on its own
+        threads = [
+            threading.Thread(target=update_NTMairtable, args=(make_properties(40, start=100 * i),), kwargs={
+                'api_url': server.api_url(), 'base_id': 'appShared', 'table_name': f'Table{i}',
+                'access_token': 'token', 'rate': 8,
+            })
+            for i in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # One Name fetch and four batches each, none refused with a 429
+        assert server.count() == 15
+        assert len(server.records) == 120
@@ -0,0 +1,126 @@
+import glob
+import json
+import os
+import pandas as pd
+import pytest
+from arcgis_download import apply_dtypes, download_layer, infer_dtypes, merge_with_parts, read_layer
+from http_client import HttpClient, make_session
+from stubs import StubArcGISServer
+
+LAYER = '/TaxParcels/MapServer/0'
+
+FIELDS = [
+    {'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+    {'name': 'UNITS', 'type': 'esriFieldTypeSmallInteger'},
+    {'name': 'LAND_VALUE', 'type': 'esriFieldTypeInteger'},
+    {'name': 'ACRES', 'type': 'esriFieldTypeDouble'},
+    {'name': 'ZONECLASS', 'type': 'esriFieldTypeString'},
+    {'name': 'ADDRESSSHORT', 'type': 'esriFieldTypeString'},
+]
+
+
+def make_rows(count=60):
+    # The first range has tiny numbers and few zones; later ones need wider
+    # integers and have a distinct zone on every row
+    rows = []
+    for objectid in range(1, count + 1):
+        early = objectid <= 20
+        rows.append({
+            'OBJECTID': objectid,
+            'UNITS': objectid % 4 if early else None,
+            'LAND_VALUE': objectid if early else 1_000_000 + objectid,
+            'ACRES': 0.25 if early else objectid / 7,
+            'ZONECLASS': ['NT-1', 'CRT-1'][objectid % 2] if early else f'ZONE-{objectid}',
+            'ADDRESSSHORT': f'{objectid} MAIN ST N',
+        })
+    return rows
+
+
+def client():
+    return HttpClient(make_session(4), rate=1000, backoff=0.01)
+
+
+def part_dtypes(dest_dir):
+    return [
+        {column: str(dtype) for column, dtype in pd.read_parquet(path).dtypes.items()}
+        for path in sorted(glob.glob(os.path.join(dest_dir, 'part-*.parquet')))
+    ]
+
+
+def normalized(dtypes):
+    # string[pyarrow] prints as string once applied
+    return {column: 'string' if dtype.startswith('string') else dtype for column, dtype in dtypes.items()}
+
+
+@pytest.mark.parametrize('fields', [FIELDS, None])
+def test_every_part_shares_the_layer_dtypes(tmp_path, fields):
+    rows = make_rows()
+    with StubArcGISServer({LAYER: rows}, fields={LAYER: fields} if fields else None) as server:
+        dest = download_layer(server.layer_url(LAYER), str(tmp_path / 'parcels'), chunk_size=20, client=client())
+
+    schemas = part_dtypes(dest)
+    assert len(schemas) == 3
+    assert all(schema == schemas[0] for schema in schemas)
+    with open(os.path.join(dest, 'manifest.json')) as f:
+        assert normalized(json.load(f)['dtypes']) == schemas[0]
+
+    layer = read_layer(dest)
+    assert str(layer['ZONECLASS'].dtype) == 'category'
+    assert str(layer['ADDRESSSHORT'].dtype) == 'string'
+    assert layer['LAND_VALUE'].tolist() == [row['LAND_VALUE'] for row in rows]
+    assert layer['ZONECLASS'].astype(str).tolist() == [row['ZONECLASS'] for row in rows]
+    if fields:
+        assert schemas[0]['UNITS'] == 'Int16'
+        assert schemas[0]['LAND_VALUE'] == 'Int32'
+        assert schemas[0]['OBJECTID'] == 'Int64'
+    else:
+        assert schemas[0]['LAND_VALUE'] == 'Int64'
+
+
+def test_resumed_download_keeps_the_manifest_dtypes(tmp_path):
+    rows = make_rows()
+    with StubArcGISServer({LAYER: rows}, fields={LAYER: FIELDS}) as server:
+        dest = download_layer(server.layer_url(LAYER), str(tmp_path / 'parcels'), chunk_size=20, client=client())
+        parts = sorted(glob.glob(os.path.join(dest, 'part-*.parquet')))
+        os.remove(parts[0])
+        os.remove(parts[-1])
+        calls = server.count()
+        download_layer(server.layer_url(LAYER), dest, chunk_size=20, client=client())
+        # Two ranges fetched again; no new id list or field lookup
+        assert server.count() - calls == 2
+
+    schemas = part_dtypes(dest)
+    assert len(schemas) == 3 and all(schema == schemas[0] for schema in schemas)
+
+
+def test_parts_without_manifest_dtypes_are_downloaded_again(tmp_path):
+    rows = make_rows()
+    with StubArcGISServer({LAYER: rows}) as server:
+        dest = download_layer(server.layer_url(LAYER), str(tmp_path / 'parcels'), chunk_size=20, client=client())
+        manifest_path = os.path.join(dest, 'manifest.json')
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        del manifest['dtypes']
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+        download_layer(server.layer_url(LAYER), dest, chunk_size=20, client=client())
+    with open(manifest_path) as f:
+        assert 'dtypes' in json.load(f)
+
+
+def test_merge_with_parts_keeps_categories(tmp_path):
+    rows = make_rows()
+    with StubArcGISServer({LAYER: rows}, fields={LAYER: FIELDS}) as server:
+        dest = download_layer(server.layer_url(LAYER), str(tmp_path / 'parcels'), chunk_size=20, client=client())
+    left = pd.DataFrame({'OBJECTID': pd.array([5, 25, 45], dtype='Int64'), 'NOTE': ['a', 'b', 'c']})
+    merged = merge_with_parts(left, dest)
+    assert merged['OBJECTID'].tolist() == [5, 25, 45]
+    assert str(merged['ZONECLASS'].dtype) == 'category'
+
+
+def test_empty_range_gets_every_column():
+    dtypes = infer_dtypes(pd.DataFrame(make_rows(20)))
+    empty = apply_dtypes([], dtypes)
+    assert list(empty.columns) == list(dtypes)
+    assert {column: str(dtype) for column, dtype in empty.dtypes.items()} == normalized(dtypes)
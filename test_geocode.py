@@ -0,0 +1,102 @@
+import math
+import numpy as np
+import pytest
+from geocode import GeocodeCache, geocode_shapes, rest_backend, reverse_geocode_points, ring_centroids
+from http_client import CircuitBreaker, HttpClient, make_session
+from stubs import StubGeocoderServer
+
+
+def square(x, y, half):
+    return [[x - half, y - half], [x + half, y - half], [x + half, y + half], [x - half, y + half], [x - half, y - half]]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GeocodeCache(str(tmp_path / 'geocode_cache.db'), tolerance=10.0)
+    yield cache
+    cache.close()
+
+
+def backend(server, max_retries=2):
+    client = HttpClient(make_session(8), rate=1000, backoff=0.01, max_retries=max_retries,
+                        breaker=CircuitBreaker(threshold=100))
+    return rest_backend(server.url, client)
+
+
+def test_ring_centroids():
+    rings = [
+        square(5, 5, 1),
+        # An L shape, whose centroid is not the mean of its vertices
+        [[0, 0], [4, 0], [4, 1], [1, 1], [1, 4], [0, 4], [0, 0]],
+        # No area: the mean of its vertices
+        [[0, 0], [2, 0], [4, 0]],
+        [],
+    ]
+    centroids = ring_centroids(rings)
+    assert centroids[0].tolist() == pytest.approx([5, 5])
+    assert centroids[1].tolist() == pytest.approx([19 / 14, 19 / 14])
+    assert centroids[2].tolist() == pytest.approx([2, 0])
+    assert np.isnan(centroids[3]).all()
+    # Winding order does not matter
+    assert ring_centroids([square(5, 5, 1)[::-1]])[0].tolist() == pytest.approx([5, 5])
+
+
+def test_cache_cells_follow_the_tolerance(tmp_path, cache):
+    assert cache.key(1001.0, 2001.0, 2882) == cache.key(1004.9, 1996.0, 2882)
+    assert cache.key(1001.0, 2001.0, 2882) != cache.key(1016.0, 2001.0, 2882)
+    assert cache.key(1001.0, 2001.0, 2882) != cache.key(1001.0, 2001.0, 4326)
+
+    cache.put(cache.key(1001.0, 2001.0, 2882), '1001 STUB ST N')
+    reopened = GeocodeCache(str(tmp_path / 'geocode_cache.db'), tolerance=10.0)
+    assert reopened.get_many([reopened.key(1003.0, 2002.0, 2882)]) == {(2882, 100, 200): '1001 STUB ST N'}
+    reopened.close()
+
+
+def test_one_call_per_uncached_cell(cache):
+    # Points 1 ft apart share a cell; one point has no coordinates
+    points = [(1000.0 + 100 * i + j, 2000.0) for i in range(20) for j in range(3)] + [(math.nan, math.nan)]
+    with StubGeocoderServer() as server:
+        addresses = reverse_geocode_points(points, backend(server), cache, max_workers=4)
+        assert server.count() == 20
+        assert addresses[:-1] == [f'{1000 + 100 * i} STUB ST N' for i in range(20) for _ in range(3)]
+        assert addresses[-1] is None
+
+        # Everything is cached now; a point in a known cell costs nothing
+        assert reverse_geocode_points([(1101.0, 2002.0)], backend(server), cache) == ['1100 STUB ST N']
+        assert server.count() == 20
+
+
+def test_transient_errors_are_retried(cache):
+    with StubGeocoderServer(failures=2) as server:
+        assert reverse_geocode_points([(3000.0, 2000.0)], backend(server), cache) == ['3000 STUB ST N']
+        assert server.count() == 3
+
+
+def test_failed_lookup_is_not_cached(cache):
+    with StubGeocoderServer(failures=3) as server:
+        assert reverse_geocode_points([(3000.0, 2000.0)], backend(server), cache) == [None]
+        assert server.count() == 3
+        assert cache.get_many([cache.key(3000.0, 2000.0, 2882)]) == {}
+
+        # The next run asks again and gets the address
+        assert reverse_geocode_points([(3000.0, 2000.0)], backend(server), cache) == ['3000 STUB ST N']
+
+
+def test_no_address_is_cached(cache):
+    with StubGeocoderServer(no_address=[4000]) as server:
+        assert reverse_geocode_points([(4000.0, 2000.0)], backend(server), cache) == [None]
+        assert reverse_geocode_points([(4000.0, 2000.0)], backend(server), cache) == [None]
+        assert server.count() == 1
+    assert cache.get_many([cache.key(4000.0, 2000.0, 2882)]) == {(2882, 400, 200): None}
+
+
+def test_geocode_shapes_joins_each_ring(cache):
+    shapes = [
+        {'rings': [square(1000, 2000, 5)]},
+        {'rings': [square(5000, 2000, 5), square(6000, 2000, 5)]},
+        None,
+        {'rings': [square(4000, 2000, 5)]},
+    ]
+    with StubGeocoderServer(no_address=[4000]) as server:
+        addresses = geocode_shapes(shapes, backend(server), cache, max_workers=2)
+    assert addresses == ['1000 STUB ST N', '5000 STUB ST N; 6000 STUB ST N', None, '']
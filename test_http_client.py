@@ -0,0 +1,153 @@
+import email.utils
+import threading
+import time
+import pytest
+import requests
+import http_client
+from http_client import CircuitBreaker, CircuitOpenError, HttpClient, RAPIDAPI_QUOTA_HEADERS, TokenBucket, make_session, retry_after
+from stubs import StubZillowServer
+
+PAGES = [[{'zpid': 1}], [{'zpid': 2}]]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Records the client's retry waits instead of sleeping through them
+    waits = []
+    monkeypatch.setattr(http_client.time, 'sleep', waits.append)
+    return waits
+
+
+def make_client(**kwargs):
+    kwargs.setdefault('rate', 1000)
+    return HttpClient(make_session(4), **kwargs)
+
+
+def test_retry_after_is_honoured(sleeps):
+    with StubZillowServer(PAGES, failures={1: 2}, failure_status=503, retry_after=7) as server:
+        data = make_client(backoff=100).get_json(server.url, params={'page': 1})
+        assert server.count('GET') == 3
+    assert data['props'] == PAGES[0]
+    assert sleeps == [7.0, 7.0]
+
+
+def test_429_pauses_the_bucket_without_tripping_the_breaker():
+    breaker = CircuitBreaker(threshold=1)
+    client = make_client(breaker=breaker)
+    with StubZillowServer(PAGES, failures={1: 1}, failure_status=429, retry_after=0.3) as server:
+        start = time.monotonic()
+        client.get_json(server.url, params={'page': 1})
+        assert server.count('GET') == 2
+        assert time.monotonic() - start >= 0.25
+        # The pause is the bucket's, so every thread sharing the client waits
+        client.bucket.pause(0.3)
+        start = time.monotonic()
+        client.get_json(server.url, params={'page': 2})
+        assert time.monotonic() - start >= 0.25
+    assert breaker.state == 'closed'
+
+
+def test_full_jitter_backoff_then_gives_up(sleeps):
+    with StubZillowServer(PAGES, failures={1: 10}, failure_status=500) as server:
+        client = make_client(backoff=1.0, max_backoff=5.0, max_retries=4, breaker=CircuitBreaker(threshold=100))
+        with pytest.raises(requests.HTTPError, match='500'):
+            client.get_json(server.url, params={'page': 1})
+        assert server.count('GET') == 5
+    assert len(sleeps) == 4
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= min(5.0, 2 ** attempt)
+
+
+def test_client_errors_are_not_retried(sleeps):
+    breaker = CircuitBreaker(threshold=1)
+    with StubZillowServer(PAGES, failures={1: 1}, failure_status=404) as server:
+        with pytest.raises(requests.HTTPError, match='404'):
+            make_client(breaker=breaker).get_json(server.url, params={'page': 1})
+        assert server.count('GET') == 1
+    assert sleeps == []
+    # The service answered, so it is not counted as down
+    assert breaker.state == 'closed'
+
+
+def test_body_status_retries_errors_reported_in_a_200(sleeps):
+    answers = iter([{'error': {'code': 503}}, None])
+    with StubZillowServer(PAGES) as server:
+        data = make_client(backoff=0).get_json(
+            server.url, body_status=lambda body: 503 if next(answers) else None, params={'page': 2}
+        )
+        assert server.count('GET') == 2
+    assert data['props'] == PAGES[1]
+
+
+def test_breaker_opens_fails_fast_and_recovers(sleeps):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.2)
+    client = make_client(max_retries=0, breaker=breaker)
+    with StubZillowServer(PAGES, failures={1: 2}, failure_status=503) as server:
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError):
+                client.get_json(server.url, params={'page': 1})
+        assert breaker.state == 'open'
+        with pytest.raises(CircuitOpenError):
+            client.get_json(server.url, params={'page': 1})
+        # Failing fast means the server never saw the third call
+        assert server.count('GET') == 2
+
+        threading.Event().wait(0.25)
+        assert breaker.state == 'half-open'
+        assert client.get_json(server.url, params={'page': 1})['props'] == PAGES[0]
+        assert breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.before()
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.failure()
+    assert breaker.state == 'open'
+
+
+def test_quota_headers_slow_the_bucket(sleeps):
+    client = make_client(rate=50, quota_headers=RAPIDAPI_QUOTA_HEADERS)
+    with StubZillowServer(PAGES, quota=10, quota_reset=100) as server:
+        client.get_json(server.url, params={'page': 1})
+    # Nine requests left for the next 100 seconds or so
+    assert client.bucket.rate < 1
+
+
+def test_exhausted_quota_waits_for_the_window(sleeps):
+    bucket = TokenBucket(10)
+    bucket.update_quota(0, 30)
+    assert 29 < bucket.paused_for() <= 30
+
+
+def test_monthly_quota_with_plenty_left_keeps_the_rate(sleeps):
+    # RapidAPI reports its monthly window: 400 requests left for 20 days
+    bucket = TokenBucket(5)
+    bucket.update_quota(400, 20 * 86400)
+    assert bucket.rate == 5
+    for _ in range(5):
+        bucket.acquire()
+    assert sleeps == []
+
+
+def test_monthly_quota_waits_are_capped(sleeps):
+    bucket = TokenBucket(5, low_water=50, max_wait=60)
+    bucket.update_quota(40, 20 * 86400)
+    assert bucket.rate == pytest.approx(1 / 60)
+    bucket.update_quota(0, 20 * 86400)
+    assert 59 < bucket.paused_for() <= 60
+
+
+def test_retry_after_parses_seconds_and_dates():
+    response = requests.Response()
+    response.headers['Retry-After'] = '12'
+    assert retry_after(response) == 12.0
+    response.headers['Retry-After'] = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < retry_after(response) <= 60
+    del response.headers['Retry-After']
+    assert retry_after(response) is None
+    assert retry_after(None) is None
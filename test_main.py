@@ -0,0 +1,112 @@
+import glob
+import json
+import pytest
+import main
+from archive import read_archive
+from listing_store import ListingStore
+from listings import build_listing_frame
+from stats_store import StatsStore
+
+
+def tracked(cls, opened):
+    # A subclass that remembers every instance, to check they get closed
+    class Tracked(cls):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.closed = False
+            opened.append(self)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    return Tracked
+
+
+def test_failed_run_closes_its_databases(workdir, monkeypatch):
+    opened = []
+    monkeypatch.setattr(main, 'ListingStore', tracked(ListingStore, opened))
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('Failed to fetch page 1: stub')
+
+    monkeypatch.setattr(main, 'scan_property_data', fail)
+    main.main()
+
+    with open(workdir / 'run_report.json') as f:
+        assert json.load(f)['status'] == 'error'
+    assert opened and all(db.closed for db in opened)
+
+
+def test_failure_after_the_stats_are_opened_closes_them(workdir, monkeypatch):
+    opened = []
+    monkeypatch.setattr(main, 'ListingStore', tracked(ListingStore, opened))
+    monkeypatch.setattr(main, 'StatsStore', tracked(StatsStore, opened))
+    monkeypatch.setattr(main, 'scan_property_data', lambda *args, **kwargs: ([], {}))
+
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(main, 'save_daily_stats', fail)
+    main.main()
+
+    assert [type(db).__mro__[1] for db in opened] == [ListingStore, StatsStore]
+    assert all(db.closed for db in opened)
+
+
+def error_emails(workdir):
+    path = workdir / 'live' / 'emails.jsonl'
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [email for email in map(json.loads, f) if email['subject'].startswith('Property Monitor ERROR')]
+
+
+def test_daemon_emails_a_repeated_error_once(workdir, monkeypatch):
+    def fail_with(message):
+        def fail(*args, **kwargs):
+            raise RuntimeError(message)
+        return fail
+
+    errors = main.ErrorThrottle(interval=3600)
+    monkeypatch.setattr(main, 'scan_property_data', fail_with('Failed to fetch page 1: 503'))
+    for _ in range(3):
+        main.main(errors=errors)
+    assert len(error_emails(workdir)) == 1
+
+    monkeypatch.setattr(main, 'scan_property_data', fail_with('Circuit open'))
+    main.main(errors=errors)
+    assert len(error_emails(workdir)) == 2
+
+    # A poll that succeeds means the next failure is news again
+    monkeypatch.setattr(main, 'scan_property_data', lambda *args, **kwargs: ([], {}))
+    main.main(errors=errors)
+    monkeypatch.setattr(main, 'scan_property_data', fail_with('Circuit open'))
+    main.main(errors=errors)
+    assert len(error_emails(workdir)) == 3
+
+
+def test_repeated_error_is_sent_again_after_the_interval():
+    errors = main.ErrorThrottle(interval=0)
+    assert errors.allow('RuntimeError: boom')
+    assert errors.allow('RuntimeError: boom')
+
+
+def test_each_streamed_poll_keeps_its_own_archive(workdir, monkeypatch):
+    polls = iter(range(2))
+
+    def stream(engine, store, archive, *args, **kwargs):
+        poll = next(polls)
+        archive.append([{'zpid': f'{poll}-{n}', 'price': 100000, 'listingStatus': 'FOR_SALE'} for n in range(3)])
+        return 3, {rule['name']: build_listing_frame([]) for rule in engine.rules}
+
+    monkeypatch.setattr(main, 'stream_matches', stream)
+    main.main(stream=True)
+    main.main(stream=True)
+
+    archives = sorted(glob.glob(str(workdir / 'archive' / 'property_data_*.ndjson.gz')))
+    assert [[record['zpid'] for record in read_archive(path)] for path in archives] == [
+        ['0-0', '0-1', '0-2'], ['1-0', '1-1', '1-2']
+    ]
+    with ListingStore(str(workdir / 'listings.db')) as store:
+        assert len(store) == 6
@@ -0,0 +1,89 @@
+import os
+import random
+import pandas as pd
+import pytest
+from matcher import AddressMatcher, build_zone_index
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+def old_contains_any(patterns, text):
+    # The loop compare_NTMaddresses used before the automaton
+    return any(pattern in text for pattern in patterns)
+
+
+@pytest.fixture(scope='module')
+def ntm_patterns():
+    return pd.read_csv(os.path.join(REPO, 'NTMaddresses.csv'))['Address'].dropna().str.lower().tolist()
+
+
+def listing_texts(patterns, rng, count=3000):
+    # Listing-style addresses around watchlist entries, near misses and noise
+    cities = [', st petersburg, fl 33701', ', st. petersburg, fl 33713', '']
+    texts = []
+    for _ in range(count):
+        pattern = rng.choice(patterns)
+        kind = rng.randrange(5)
+        if kind == 0:
+            text = pattern + rng.choice(cities)
+        elif kind == 1:
+            # Different house number, same street
+            number, _, street = pattern.partition(' ')
+            text = f'{int(number) + rng.randint(1, 9) if number.isdigit() else number} {street}' + rng.choice(cities)
+        elif kind == 2:
+            text = f'{rng.randint(1, 9)}{pattern}' + rng.choice(cities)
+        elif kind == 3:
+            text = pattern[:rng.randrange(1, len(pattern) + 1)]
+        else:
+            text = ''.join(rng.choice('0123456789 abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(0, 40)))
+        texts.append(text)
+    return texts
+
+
+def test_contains_any_matches_old_loop_on_ntm_watchlist(ntm_patterns):
+    matcher = AddressMatcher(ntm_patterns)
+    texts = listing_texts(ntm_patterns, random.Random(1))
+    mismatches = [text for text in texts if matcher.contains_any(text) != old_contains_any(ntm_patterns, text)]
+    assert mismatches == []
+    # The sample exercises both outcomes
+    assert any(matcher.contains_any(text) for text in texts)
+    assert not all(matcher.contains_any(text) for text in texts)
+
+
+@pytest.mark.parametrize('patterns, text', [
+    ([''], ''),
+    ([''], '100 main st'),
+    (['', '100 main st'], 'nothing here'),
+    (['100 main st'], ''),
+    ([], ''),
+    ([], '100 main st'),
+    # Overlapping patterns: one a prefix, suffix or infix of another
+    (['100 main', '100 main st', 'main st'], '100 main st n'),
+    (['abcd', 'bc'], 'xbcx'),
+    (['abcd', 'bcx'], 'abcx'),
+    (['aab', 'ab'], 'aaab'),
+    (['he', 'she', 'his', 'hers'], 'ushers'),
+    (['aaa', 'aa'], 'a'),
+    (['100 main st'], '100 main s'),
+    (['100 main st', '100 main st'], '1100 main st n'),
+])
+def test_contains_any_edge_cases(patterns, text):
+    assert AddressMatcher(patterns).contains_any(text) == old_contains_any(patterns, text)
+
+
+def test_find_all_returns_every_contained_pattern(ntm_patterns):
+    matcher = AddressMatcher(ntm_patterns)
+    for text in listing_texts(ntm_patterns, random.Random(2), count=500):
+        assert set(matcher.find_all(text)) == {pattern for pattern in ntm_patterns if pattern in text}
+
+
+def test_find_all_with_overlaps_and_empty_pattern():
+    matcher = AddressMatcher(['', 'he', 'she', 'hers', 'he'])
+    assert len(matcher) == 4
+    assert matcher.find_all('ushers') == ['', 'she', 'he', 'hers']
+    assert matcher.find_all('') == ['']
+
+
+def test_build_zone_index_skips_excluded_zones():
+    index = build_zone_index(['1 a st', '1 a st', '2 b st'], ['NT-1', 'CRT-1', 'NT-1'], exclusion_zones=['NT-1'])
+    assert index == {'1 a st': 'CRT-1'}
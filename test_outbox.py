@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import time
+import pytest
+from emails import Mailer
+from main import update_NTMairtable
+from outbox import Outbox, OutboxDispatcher
+from stubs import FakeAirtableServer, FakeSendGridServer
+
+
+def email(n):
+    return {'subject': f'Matches {n}', 'recipients': ['to@example.com'], 'html': f'<p>{n}</p>'}
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    yield outbox
+    outbox.close()
+
+
+def send_email(server):
+    mailer = Mailer('key', 'from@example.com', host=server.url)
+    return lambda payload: mailer.send(payload['subject'], payload['recipients'], payload['html'])
+
+
+def row(outbox, key):
+    return outbox.conn.execute('SELECT status, attempts, last_error FROM outbox WHERE key = ?', (key,)).fetchone()
+
+
+def test_a_key_is_queued_and_sent_once(outbox):
+    assert outbox.enqueue('email', email(1), 'ntm-2026-10-17')
+    assert not outbox.enqueue('email', email(2), 'ntm-2026-10-17')
+    with FakeSendGridServer() as server:
+        assert OutboxDispatcher(outbox, {'email': send_email(server)}).start().close(timeout=5) == {'done': 1}
+        # Queueing it again after delivery, as a rerun after a crash would, sends nothing
+        assert not outbox.enqueue('email', email(1), 'ntm-2026-10-17')
+        assert OutboxDispatcher(outbox, {'email': send_email(server)}).start().close(timeout=5) == {'done': 1}
+    assert [message['subject'] for message in server.messages] == ['Matches 1']
+
+
+def test_failed_delivery_is_retried_then_dead(outbox):
+    outbox.enqueue('email', email(1), 'broken')
+    outbox.enqueue('email', email(2), 'flaky')
+    with FakeSendGridServer(failures=5) as server:
+        # Sends alternate between the two items; two retry delays allow three
+        # attempts, so "broken" fails all of its and "flaky" gets its third through
+        dispatcher = OutboxDispatcher(outbox, {'email': send_email(server)}, max_workers=1, delays=[0.01, 0.01])
+        counts = dispatcher.start().close(timeout=5)
+    assert counts == {'done': 1, 'dead': 1}
+    assert (dispatcher.delivered, dispatcher.failed) == (1, 5)
+    assert row(outbox, 'flaky') == ('done', 3, None)
+    status, attempts, last_error = row(outbox, 'broken')
+    assert (status, attempts) == ('dead', 3)
+    assert '500' in last_error
+    assert len(server.messages) == 6
+
+
+def test_unknown_destination_fails(outbox):
+    outbox.enqueue('fax', {}, 'fax-1')
+    counts = OutboxDispatcher(outbox, {}, delays=[]).start().close(timeout=5)
+    assert counts == {'dead': 1}
+    assert 'No handler' in row(outbox, 'fax-1')[2]
+
+
+def test_items_cut_off_mid_send_are_sent_on_reopen(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    outbox = Outbox(path)
+    outbox.enqueue('email', email(1), 'ntm')
+    assert [item['key'] for item in outbox.claim_due()] == ['ntm']
+    # The process dies here, before the send is marked done or failed
+    outbox.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT status FROM outbox').fetchall() == [('sending',)]
+
+    outbox = Outbox(path)
+    try:
+        assert outbox.counts() == {'pending': 1}
+        with FakeSendGridServer() as server:
+            assert OutboxDispatcher(outbox, {'email': send_email(server)}).start().close(timeout=5) == {'done': 1}
+        assert len(server.messages) == 1
+    finally:
+        outbox.close()
+
+
+def test_each_destination_has_its_own_rate(outbox):
+    finished = {'email': [], 'airtable': []}
+
+    def timed(destination, handler):
+        def deliver(payload):
+            handler(payload)
+            finished[destination].append(time.monotonic())
+        return deliver
+
+    for n in range(5):
+        outbox.enqueue('email', email(n), f'email-{n}')
+        outbox.enqueue('airtable', {'address': f'{n} main st n'}, f'airtable-{n}')
+    with FakeSendGridServer() as sendgrid, FakeAirtableServer() as airtable:
+        def sync(payload):
+            update_NTMairtable([payload], api_url=airtable.api_url(), base_id='appOutbox', table_name='Properties',
+                               access_token='token', rate=1000)
+
+        handlers = {'email': timed('email', send_email(sendgrid)), 'airtable': timed('airtable', sync)}
+        start = time.monotonic()
+        dispatcher = OutboxDispatcher(outbox, handlers, rates={'email': 10}, max_workers=10)
+        assert dispatcher.start().close(timeout=10) == {'done': 10}
+    assert len(sendgrid.messages) == 5
+    assert len(airtable.records) == 5
+    # Five emails at 10 a second span 0.4 s; Airtable is not held to that rate
+    assert max(finished['email']) - start >= 0.4 * 0.9
+    assert max(finished['airtable']) < sorted(finished['email'])[2]
+
+
+def test_close_waits_for_retries_only_until_its_timeout(outbox):
+    outbox.enqueue('email', email(1), 'soon')
+    with FakeSendGridServer(failures=1) as server:
+        counts = OutboxDispatcher(outbox, {'email': send_email(server)}, delays=[0.2]).start().close(timeout=5)
+    assert counts == {'done': 1}
+
+    outbox.enqueue('email', email(2), 'later')
+    with FakeSendGridServer(failures=1) as server:
+        start = time.monotonic()
+        counts = OutboxDispatcher(outbox, {'email': send_email(server)}, delays=[30]).start().close(timeout=0.5)
+        elapsed = time.monotonic() - start
+    # The retry is not due before the deadline, so it is left for the next run
+    assert counts == {'done': 1, 'pending': 1}
+    assert 0.4 <= elapsed < 5
+    assert row(outbox, 'later')[:2] == ('pending', 1)
+
+
+def test_items_queued_while_running_are_sent_after_notify(outbox):
+    with FakeSendGridServer() as server:
+        dispatcher = OutboxDispatcher(outbox, {'email': send_email(server)}, poll=60).start()
+        for n in range(3):
+            outbox.enqueue('email', email(n), f'email-{n}')
+            dispatcher.notify()
+        deadline = time.monotonic() + 5
+        while len(server.messages) < 3 and time.monotonic() < deadline:
+            threading.Event().wait(0.01)
+        assert len(server.messages) == 3
+        assert dispatcher.close(timeout=5) == {'done': 3}
@@ -0,0 +1,100 @@
+import functools
+import json
+import os
+import pandas as pd
+import pytest
+import main
+from stubs import StubZillowServer
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+RULES = [
+    {'name': 'ntm', 'csv': 'NTMaddresses.csv', 'match': 'key', 'template': 'ntm',
+     'subject': 'NTM-1 Property Matches', 'recipients': 'ntm@example.com',
+     'airtable': {'base_id': 'app1', 'table': 'Properties', 'access_token': 'token'}},
+    {'name': 'health', 'csv': 'HealthOfficeAddresses.csv', 'match': 'core',
+     'exclude_zones': ['NTM-1', 'RC-1', 'RC-2', 'RC-3'], 'template': 'health',
+     'subject': 'Medical Office Property Matches', 'recipients': 'health@example.com'},
+]
+
+
+def make_pages(page_count=3, per_page=8):
+    ntm = pd.read_csv(os.path.join(REPO, 'NTMaddresses.csv'))['Address'].tolist()
+    health = pd.read_csv(os.path.join(REPO, 'HealthOfficeAddresses.csv'))
+    health = health[health['Zone_Class'] != 'NTM-1']['Address'].tolist()
+    pages = []
+    for page in range(page_count):
+        props = []
+        for i in range(per_page):
+            n = page * per_page + i
+            address = [ntm[n * 37], health[n * 41], f'{9000 + n} nowhere st n'][n % 3]
+            props.append({
+                'zpid': str(1000 + n), 'address': f'{address}, St Petersburg, FL 33701',
+                'detailUrl': f'/homedetails/{1000 + n}_zpid/', 'price': 250000 + 1000 * n,
+                'lotAreaValue': 4000 + 300 * n, 'lotAreaUnit': 'sqft', 'livingArea': 1200 + n,
+                'imgSrc': f'https://photos.example.com/{n}.jpg', 'listingStatus': 'FOR_SALE',
+            })
+        pages.append(props)
+    return pages
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def workdir(workdir):
+    # Rules with an Airtable table, so the Airtable sync is replayed too
+    (workdir / 'watchlists.json').write_text(json.dumps(RULES))
+    return workdir
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_replay_reproduces_the_recorded_run(workdir, monkeypatch, stream):
+    cassette = str(workdir / 'run.jsonl.gz')
+    with StubZillowServer(make_pages()) as server:
+        monkeypatch.setattr(main, 'scan_property_data', functools.partial(main.scan_property_data, url=server.url))
+        monkeypatch.setattr(main, 'stream_matches', functools.partial(main.stream_matches, url=server.url))
+        main.main(stream=stream, record=cassette)
+        recorded_calls = server.count('GET')
+
+    with open(workdir / 'run_report.json') as f:
+        assert json.load(f)['status'] == 'ok'
+    live_emails = read_jsonl(workdir / 'live' / 'emails.jsonl')
+    live_airtable = read_jsonl(workdir / 'live' / 'airtable.jsonl')
+    assert {email['subject'].split(' (')[0] for email in live_emails} == {
+        'NTM-1 Property Matches', 'Medical Office Property Matches'
+    }
+    assert live_airtable and live_airtable[0]['rule'] == 'ntm'
+    assert recorded_calls == 3
+
+    # The server is gone: the replay is answered from the cassette alone
+    for _ in range(2):
+        main.main(stream=stream, replay=cassette)
+        with open(workdir / 'replay_out' / 'run_report.json') as f:
+            report = json.load(f)
+        assert report['status'] == 'ok'
+        assert report['replay'] is True
+        assert read_jsonl(workdir / 'replay_out' / 'emails.jsonl') == live_emails
+        assert read_jsonl(workdir / 'replay_out' / 'airtable.jsonl') == live_airtable
+
+    # The replay kept to its own state
+    assert os.path.exists(workdir / 'replay_out' / 'listings.db')
+    assert len(read_jsonl(workdir / 'live' / 'emails.jsonl')) == len(live_emails)
+
+
+def test_replay_of_a_request_not_recorded_fails_the_run(workdir, monkeypatch):
+    cassette = str(workdir / 'run.jsonl.gz')
+    with StubZillowServer(make_pages(page_count=1)) as server:
+        monkeypatch.setattr(main, 'scan_property_data', functools.partial(main.scan_property_data, url=server.url))
+        main.main(record=cassette)
+
+    monkeypatch.setattr(main, 'ZILLOW_QUERY', {**main.ZILLOW_QUERY, 'daysOn': '7'})
+    main.main(replay=cassette)
+    with open(workdir / 'replay_out' / 'run_report.json') as f:
+        report = json.load(f)
+    assert report['status'] == 'error'
+    assert 'No recorded response' in report['error']
+    # The error email went to the replay's sink, not out
+    assert read_jsonl(workdir / 'replay_out' / 'emails.jsonl')[0]['subject'].startswith('Property Monitor ERROR')
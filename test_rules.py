@@ -0,0 +1,74 @@
+import json
+import pytest
+from listings import build_listing_frame
+from rules import load_rule_engine, load_rules
+
+
+@pytest.fixture
+def engine(tmp_path):
+    (tmp_path / 'ntm.csv').write_text('Address\n100 MAIN ST N\n250 CENTRAL AVE\n')
+    (tmp_path / 'fuzzy.csv').write_text('Address,Zone_Class\n100 MAIN ST N,CRT-1\n412 BEACH DR NE,DC-1\n77 KINGS HWY N,NT-1\n')
+    rules = [
+        {'name': 'ntm', 'csv': str(tmp_path / 'ntm.csv'), 'match': 'key'},
+        {'name': 'near', 'csv': str(tmp_path / 'fuzzy.csv'), 'match': 'fuzzy', 'min_score': 0.8, 'template': 'health'},
+    ]
+    (tmp_path / 'watchlists.json').write_text(json.dumps(rules))
+    return load_rule_engine(load_rules(str(tmp_path / 'watchlists.json')), cache_dir=str(tmp_path / 'cache'))
+
+
+def listings(*addresses):
+    return build_listing_frame([{'zpid': str(i), 'address': a} for i, a in enumerate(addresses)])
+
+
+def test_exact_hits_skip_fuzzy_scoring(engine, monkeypatch):
+    scored = []
+    match_many = engine.fuzzy.match_many
+    monkeypatch.setattr(engine.fuzzy, 'match_many', lambda keys, workers=None: scored.extend(keys) or match_many(keys, workers))
+
+    frame = listings(
+        '100 Main St N, St Petersburg, FL 33701',   # exact for both rules
+        '412 Beach Drive NE, St Petersburg, FL',    # exact for the fuzzy rule only
+        '250 Central Ave, St Petersburg, FL',       # exact for ntm, not for the fuzzy rule
+        '77 Kigns Hwy N, St Petersburg, FL',        # fuzzy
+        '77 Kigns Hwy N, St. Petersburg, FL 33704', # the same key again
+        '9 Nowhere Ln, St Petersburg, FL',
+    )
+    results = engine.evaluate(frame)
+
+    assert sorted(scored) == sorted({frame['address_key'][i] for i in (2, 3, 5)})
+    assert results['ntm']['zpid'].tolist() == ['0', '2']
+    near = results['near']
+    assert near['zpid'].tolist() == ['0', '1', '3', '4']
+    assert near['match_score'].tolist()[:2] == [1.0, 1.0]
+    assert all(0.8 <= score < 1.0 for score in near['match_score'].tolist()[2:])
+    assert near['zone_class'].tolist() == ['CRT-1', 'DC-1', 'NT-1', 'NT-1']
+
+
+def test_scoring_matches_scoring_every_listing(engine):
+    frame = listings(
+        '100 Main St N', '412 Beach Dr NE', '412 Beach Dr SE', '77 Kings Hwy', '78 Kings Hwy N',
+        '100 Mian St N', '250 Central Ave', '',
+    )
+    every = engine.fuzzy.match_many(frame['address_key'].tolist())
+    results = engine.evaluate(frame)
+
+    expected = []
+    for position, (key, fuzzy) in enumerate(zip(frame['address_key'], every)):
+        exact = [zone for rule_index, zone in engine.key_index.get(key, ()) if rule_index == 1]
+        if exact:
+            expected.append((str(position), exact[0], 1.0))
+        elif fuzzy:
+            expected.append((str(position), fuzzy[0][1], fuzzy[0][2]))
+    near = results['near']
+    assert list(zip(near['zpid'], near['zone_class'], near['match_score'])) == expected
+
+
+def test_rule_without_a_known_template_is_rejected(tmp_path):
+    (tmp_path / 'crt.csv').write_text('Address,Zone_Class\n100 MAIN ST N,CRT-1\n')
+    path = tmp_path / 'watchlists.json'
+    path.write_text(json.dumps([{'name': 'crt', 'csv': str(tmp_path / 'crt.csv'), 'match': 'core'}]))
+    with pytest.raises(ValueError, match='Unknown template "crt" in rule crt'):
+        load_rules(str(path))
+
+    path.write_text(json.dumps([{'name': 'crt', 'csv': str(tmp_path / 'crt.csv'), 'match': 'core', 'template': 'health'}]))
+    assert load_rules(str(path))[0]['template'] == 'health'
@@ -0,0 +1,50 @@
+import math
+import pytest
+from spatial import PolygonIndex
+
+
+def square(x, y, half):
+    return [[x - half, y - half], [x + half, y - half], [x + half, y + half], [x - half, y + half], [x - half, y - half]]
+
+
+@pytest.fixture
+def index():
+    return PolygonIndex([
+        [square(5, 5, 5)],
+        # A square with a square hole
+        [square(25, 5, 5), square(25, 5, 2)],
+        # A triangle whose bounding box spans cells 0-4 across and 2-3 up
+        [[[0, 20], [40, 20], [0, 39], [0, 20]]],
+        [],
+    ], cell_size=10)
+
+
+@pytest.mark.parametrize('x, y, expected', [
+    (5, 5, [0]),
+    (0.5, 9.5, [0]),
+    (15, 5, []),
+    (21, 5, [1]),
+    (25, 5, []),
+    (23.5, 6.5, []),
+    (2, 22, [2]),
+    (35, 21, [2]),
+    (15, 35, []),
+    (5, 35, [2]),
+    (-1, -1, []),
+    (math.nan, 5, []),
+])
+def test_query(index, x, y, expected):
+    assert index.query(x, y) == expected
+
+
+def test_polygon_is_in_every_cell_it_touches(index):
+    assert len(index) == 4
+    assert [cell for cell, polygons in sorted(index.grid.items()) if 2 in polygons] == [
+        (gx, gy) for gx in range(5) for gy in range(2, 4)
+    ]
+
+
+def test_overlapping_polygons_all_match():
+    index = PolygonIndex([[square(5, 5, 5)], [square(8, 8, 5)]], cell_size=4)
+    assert index.query(7, 7) == [0, 1]
+    assert index.query(12, 12) == [1]
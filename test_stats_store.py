@@ -0,0 +1,69 @@
+import json
+from emails import render_weekly_summary
+from stats_store import StatsStore
+
+
+def matched(rule, count):
+    return [{'address': f'{n} {rule} st n', 'detailUrl': f'/homedetails/{rule}{n}_zpid/'} for n in range(count)]
+
+
+def test_daemon_polls_do_not_multiply_the_listings_scanned(tmp_path):
+    with StatsStore(str(tmp_path / 'stats.db')) as stats:
+        # A day of 15-minute polls, each seeing the day's listings again and
+        # matching only the ones that are new since the last poll
+        for poll in range(96):
+            stats.record(300 + poll, {'ntm': matched('ntm', 1 if poll % 12 == 0 else 0), 'health': []},
+                         date='2026-10-11')
+        stats.record(250, {'ntm': matched('ntm', 2), 'health': matched('health', 1)}, date='2026-10-12')
+
+        days = stats.days('2026-10-11', '2026-10-12')
+        assert [(day['date'], day['total_scanned']) for day in days] == [('2026-10-11', 395), ('2026-10-12', 250)]
+        assert [day['ntm_matches'] for day in days] == [8, 2]
+        assert len(days[0]['ntm_links']) == 8
+
+        summary = stats.summary('2026-10-11', '2026-10-12')
+        assert summary['runs'] == 97
+        assert summary['total_scanned'] == 645
+        assert summary['matches'] == {'health': 1, 'ntm': 10}
+
+
+def test_empty_range(tmp_path):
+    with StatsStore(str(tmp_path / 'stats.db')) as stats:
+        assert stats.days('2026-10-11', '2026-10-17') == []
+        assert stats.summary('2026-10-11', '2026-10-17')['total_scanned'] == 0
+
+
+def test_columns_follow_the_rules_recorded_in_the_range(tmp_path):
+    with StatsStore(str(tmp_path / 'stats.db')) as stats:
+        stats.record(100, {'ntm': matched('ntm', 1), 'health': []}, date='2026-10-01')
+        stats.record(100, {'ntm': [], 'health': [], 'duplex': matched('duplex', 2)}, date='2026-10-12')
+        stats.record(120, {'ntm': [], 'health': []}, date='2026-10-13')
+
+        assert stats.rules('2026-10-11', '2026-10-13') == ['ntm', 'health', 'duplex']
+        days = stats.days('2026-10-11', '2026-10-13')
+        assert [day['duplex_matches'] for day in days] == [2, 0]
+        assert days[1]['duplex_links'] == []
+        # ntm matched before the range, but it still has runs in it
+        assert [day['ntm_matches'] for day in days] == [0, 0]
+
+        html = render_weekly_summary(days)
+        assert '<th>NTM Matches</th><th>Health Matches</th><th>duplex Matches</th>' in html
+        assert '<td>2026-10-12</td><td>100</td><td>0</td><td>0</td><td>2</td>' in html
+        assert '<h4>duplex Matches</h4>' in html
+        assert 'Days with 0 matches: 2026-10-13' in html
+
+
+def test_legacy_import_keeps_every_rule(tmp_path):
+    legacy = tmp_path / 'daily_stats.json'
+    legacy.write_text(json.dumps([
+        {'date': '2026-09-01', 'total_scanned': 90, 'ntm_matches': 1, 'health_matches': 0,
+         'ntm_links': [{'address': '1 ntm st n', 'url': '/1'}], 'health_links': []},
+        {'date': '2026-09-02', 'total_scanned': 80, 'duplex_matches': 1,
+         'duplex_links': [{'address': '2 duplex st n', 'url': '/2'}]},
+    ]))
+    with StatsStore(str(tmp_path / 'stats.db')) as stats:
+        assert stats.import_legacy(str(legacy)) == 2
+        assert stats.summary('2026-09-01', '2026-09-02')['matches'] == {'duplex': 1, 'health': 0, 'ntm': 1}
+        days = stats.days('2026-09-01', '2026-09-02')
+        assert days[1]['duplex_links'] == [{'address': '2 duplex st n', 'url': '/2'}]
+    assert not legacy.exists()
@@ -0,0 +1,203 @@
+import csv
+import os
+import pytest
+from http_client import HttpClient, make_session
+from stubs import StubArcGISServer
+from watchlist_sync import HEALTH_ZONES, ZONE_FIELD, ParcelStore, sync_watchlists
+
+PATHS = {'parcels': '/TaxParcels/MapServer/0', 'zoning': '/Zoning/MapServer/2', 'ntm': '/NTM/MapServer/0'}
+FIELDS = {
+    'parcels': ['OBJECTID', 'ADDRESSSHORT', 'PARCELID', 'EDITDATE'],
+    'zoning': ['OBJECTID', ZONE_FIELD, 'EDITDATE'],
+    'ntm': ['OBJECTID', 'TYPE', 'EDITDATE'],
+}
+# 2026-10-01 00:00:00 UTC in epoch milliseconds, as ArcGIS reports dates
+EPOCH = 1790812800000
+
+
+def square(x, y, half):
+    return {'rings': [[[x - half, y - half], [x + half, y - half], [x + half, y + half], [x - half, y + half],
+                       [x - half, y - half]]]}
+
+
+class City(StubArcGISServer):
+    """Three stub layers: a CRT-1 district (x 0-10), an NT-1 one (x 10-20) and an NTM area (x 0-5).
+
+    Parcel ``i`` sits at x = 0.5 * i + 0.25, so parcels 0-9 are in the NTM
+    area and 0-19 in CRT-1. The layers can be edited between syncs.
+    """
+
+    def __init__(self, tracked=True, fields=FIELDS, parcels=24):
+        self.rows = {name: [] for name in PATHS}
+        super().__init__(
+            {PATHS[name]: rows for name, rows in self.rows.items()},
+            geometries={path: {} for path in PATHS.values()},
+            edit_fields={path: 'EDITDATE' for path in PATHS.values()} if tracked else None,
+            fields={PATHS[name]: [{'name': field} for field in fields[name]] for name in PATHS},
+        )
+        self.clock = EPOCH
+        # OBJECTIDs are never reused, even after a delete
+        self.last_id = {name: 0 for name in PATHS}
+        self.add('zoning', {ZONE_FIELD: 'CRT-1'}, square(5, 5, 5))
+        self.add('zoning', {ZONE_FIELD: 'NT-1'}, square(15, 5, 5))
+        self.add('ntm', {'TYPE': 'NTM'}, {'rings': [[[0, 0], [5, 0], [5, 10], [0, 10], [0, 0]]]})
+        for i in range(parcels):
+            self.add_parcel(i)
+
+    def add(self, name, attributes, geometry):
+        self.clock += 60000
+        objectid = self.last_id[name] = self.last_id[name] + 1
+        self.rows[name].append({'OBJECTID': objectid, **attributes, 'EDITDATE': self.clock})
+        self.geometries[PATHS[name]][objectid] = geometry
+        return objectid
+
+    def add_parcel(self, i, address=None):
+        return self.add('parcels', {'ADDRESSSHORT': address or f'{100 + i} MAIN ST N', 'PARCELID': f'P{i}'},
+                        square(0.5 * i + 0.25, 5, 0.1))
+
+    def edit(self, name, objectid, **attributes):
+        self.clock += 60000
+        row = next(row for row in self.rows[name] if row['OBJECTID'] == objectid)
+        row.update(attributes, EDITDATE=self.clock)
+
+    def delete(self, name, objectid):
+        self.rows[name][:] = [row for row in self.rows[name] if row['OBJECTID'] != objectid]
+
+    def sync_layers(self):
+        return {
+            'parcels': {'url': self.layer_url(PATHS['parcels']), 'out_fields': 'OBJECTID,ADDRESSSHORT,PARCELID'},
+            'zoning': {'url': self.layer_url(PATHS['zoning']), 'out_fields': f'OBJECTID,{ZONE_FIELD}'},
+            'ntm': {'url': self.layer_url(PATHS['ntm']), 'out_fields': 'OBJECTID,TYPE'},
+        }
+
+    def expected(self):
+        # Parcel x -> (address, zone) from the layouts above
+        zones = [row[ZONE_FIELD] for row in self.rows['zoning']]
+        parcels = [
+            (self.geometries[PATHS['parcels']][row['OBJECTID']]['rings'][0][0][0], row['ADDRESSSHORT'])
+            for row in self.rows['parcels']
+        ]
+        ntm = sorted(address for x, address in parcels if self.rows['ntm'] and x < 5)
+        health = sorted(
+            (address, zones[0] if x < 10 else zones[1]) for x, address in parcels
+            if (zones[0] if x < 10 else zones[1]) in HEALTH_ZONES
+        )
+        return ntm, health
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return [tuple(row) for row in list(csv.reader(f))[1:]]
+
+
+@pytest.fixture
+def sync(tmp_path):
+    store = ParcelStore(str(tmp_path / 'parcels.db'))
+    paths = {'ntm_csv': str(tmp_path / 'synced' / 'ntm.csv'), 'health_csv': str(tmp_path / 'synced' / 'health.csv')}
+
+    def run(city, **kwargs):
+        client = HttpClient(make_session(4), rate=1000, backoff=0.01)
+        result = sync_watchlists(store, client, layers=city.sync_layers(), **paths, **kwargs)
+        ntm, health = city.expected()
+        assert read_csv(paths['ntm_csv']) == [(address,) for address in ntm]
+        assert read_csv(paths['health_csv']) == health
+        return result
+
+    run.paths = paths
+    yield run
+    store.close()
+
+
+@pytest.mark.parametrize('tracked', [True, False])
+def test_insert_update_and_delete(sync, tracked):
+    with City(tracked) as city:
+        first = sync(city)
+        assert (first['ntm'], first['health']) == (10, 20)
+        assert len(first['written']) == 2
+
+        assert sync(city)['written'] == []
+
+        # One parcel inserted into the NTM area, one deleted from CRT-1 outside it
+        city.add_parcel(3, '999 NEW ST N')
+        city.delete('parcels', 17)
+        result = sync(city)
+        assert (result['ntm'], result['health']) == (11, 20)
+        assert len(result['written']) == 2
+
+        # Without editor tracking an edit only shows up in a full sync
+        city.edit('parcels', 3, ADDRESSSHORT='102 MAIN ST NE')
+        assert sync(city, full=not tracked)['written']
+
+
+def test_edit_tracking_fetches_only_what_changed(sync):
+    with City() as city:
+        sync(city)
+        calls = city.count()
+        city.edit('parcels', 6, ADDRESSSHORT='105 MAIN ST S')
+        sync(city)
+        fetched = [
+            {int(objectid) for objectid in call['params']['objectIds'].split(',')}
+            for call in city.calls[calls:]
+            if call['path'] == PATHS['parcels'] + '/query' and 'objectIds' in call['params']
+        ]
+    # The edited parcel, and the one edited at the last time seen before,
+    # which is fetched again in case more edits landed at that instant
+    assert fetched == [{6, 24}]
+
+
+@pytest.mark.parametrize('tracked', [True, False])
+def test_delete_and_insert_in_one_sync(sync, tracked):
+    # The feature count is unchanged, so it alone cannot show the delete
+    with City(tracked) as city:
+        sync(city)
+        city.delete('parcels', 2)
+        city.add_parcel(0, '500 OTHER AVE N')
+        result = sync(city)
+    assert (result['ntm'], result['health']) == (10, 20)
+    assert ('101 MAIN ST N',) not in read_csv(sync.paths['ntm_csv'])
+
+
+@pytest.mark.parametrize('tracked', [True, False])
+def test_zone_change_moves_every_parcel(sync, tracked):
+    with City(tracked) as city:
+        sync(city)
+        city.delete('zoning', 2)
+        city.add('zoning', {ZONE_FIELD: 'CRT-2'}, square(15, 5, 5))
+        result = sync(city)
+    assert result['health'] == 24
+    assert read_csv(sync.paths['health_csv'])[-1] == ('123 MAIN ST N', 'CRT-2')
+
+
+def test_missing_zone_field_fails_loudly(tmp_path):
+    fields = {**FIELDS, 'zoning': ['OBJECTID', 'ZONING', 'EDITDATE']}
+    with ParcelStore(str(tmp_path / 'parcels.db')) as store, City(fields=fields) as city:
+        client = HttpClient(make_session(4), rate=1000, backoff=0.01)
+        with pytest.raises(RuntimeError, match=f'zoning layer .* has no field {ZONE_FIELD}'):
+            sync_watchlists(store, client, layers=city.sync_layers(), ntm_csv=str(tmp_path / 'ntm.csv'),
+                            health_csv=str(tmp_path / 'health.csv'))
+    assert not (tmp_path / 'health.csv').exists()
+
+
+def test_shrinking_watchlist_needs_force(sync):
+    with City() as city:
+        sync(city)
+        with open(sync.paths['ntm_csv']) as f:
+            before = f.read()
+
+        for objectid in range(1, 4):
+            city.delete('parcels', objectid)
+        with pytest.raises(RuntimeError, match='Refusing to shrink'):
+            sync(city)
+        with open(sync.paths['ntm_csv']) as f:
+            assert f.read() == before
+
+        assert sync(city, force=True)['ntm'] == 7
+
+
+def test_empty_watchlist_needs_force(sync):
+    with City() as city:
+        city.delete('ntm', 1)
+        with pytest.raises(RuntimeError, match='empty watchlist'):
+            sync(city)
+        assert not os.path.exists(sync.paths['health_csv'])
+        assert sync(city, force=True)['ntm'] == 0
@@ -0,0 +1,62 @@
+import threading
+import pytest
+from http_client import CircuitBreaker, HttpClient, make_session
+from scanner import RequestBudget, iter_scan_pages
+from stubs import StubZillowServer
+from zillow import fetch_page
+
+QUERY = {'location': 'st petersburg, fl', 'page': '1'}
+
+
+def make_pages(count, per_page=3):
+    return [[{'zpid': page * 100 + i, 'address': f'{page}{i} main st'} for i in range(per_page)] for page in range(count)]
+
+
+def fast_client(max_retries=2):
+    return HttpClient(make_session(8), rate=1000, backoff=0.01, max_retries=max_retries,
+                      breaker=CircuitBreaker(threshold=100))
+
+
+def test_fetch_page_does_not_retry_client_errors():
+    with StubZillowServer(make_pages(2), failures={1: 1}, failure_status=403) as server:
+        with pytest.raises(RuntimeError, match='Failed to fetch page 1'):
+            fetch_page(fast_client(), server.url, {}, QUERY, 1)
+        assert server.count('GET') == 1
+
+
+def test_iter_scan_pages_covers_every_search_under_the_budget():
+    pages = make_pages(4)
+    scans = [{'name': name, 'query': {**QUERY, 'location': name}, 'rules': frozenset()} for name in ('a', 'b')]
+    with StubZillowServer(pages) as server:
+        yielded = list(iter_scan_pages(fast_client(), server.url, {}, scans, max_workers=4))
+        assert sorted((index, page) for index, page, _ in yielded) == [(i, p) for i in (0, 1) for p in range(1, 5)]
+
+        # Never more than max_workers pages ahead of the consumer
+        calls = server.count('GET')
+        consumed = 0
+        for _ in iter_scan_pages(fast_client(), server.url, {}, scans, max_workers=2):
+            consumed += 1
+            threading.Event().wait(0.02)
+            assert server.count('GET') - calls <= consumed + 2
+        assert consumed == 8
+
+        budget = RequestBudget(5)
+        yielded = list(iter_scan_pages(fast_client(), server.url, {}, scans, max_workers=4, budget=budget))
+        assert len(yielded) == 5
+        assert budget.used == 5
+
+
+def test_iter_scan_pages_retries_a_failing_page():
+    pages = make_pages(3)
+    scans = [{'name': 'a', 'query': QUERY, 'rules': frozenset()}]
+    with StubZillowServer(pages, failures={2: 2}) as server:
+        yielded = list(iter_scan_pages(fast_client(max_retries=2), server.url, {}, scans, max_workers=4))
+        assert server.count('GET') == 5
+    assert sorted((page, props) for _, page, props in yielded) == list(enumerate(pages, start=1))
+
+
+def test_iter_scan_pages_propagates_a_failed_page():
+    scans = [{'name': 'a', 'query': QUERY, 'rules': frozenset()}]
+    with StubZillowServer(make_pages(6), failures={5: 10}) as server:
+        with pytest.raises(RuntimeError, match='Failed to fetch page 5'):
+            list(iter_scan_pages(fast_client(max_retries=1), server.url, {}, scans, max_workers=3))
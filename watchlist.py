@@ -0,0 +1,117 @@
+import argparse
+import hashlib
+import logging
+import os
+import pickle
+
+CACHE_DIR = '.watchlist_cache'
+
+# Bump when the compiled layout or the address keys change so stale artifacts
+# get rebuilt
+CACHE_VERSION = 4
+
+NTM_CSV = 'NTMaddresses.csv'
+HEALTH_CSV = 'HealthOfficeAddresses.csv'
+HEALTH_EXCLUSION_ZONES = ['NTM-1', 'RC-1', 'RC-2', 'RC-3']
+
+# Compiled watchlists already loaded in this process, keyed by cache file
+_loaded = {}
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stamp(paths):
+    stamps = []
+    for path in paths:
+        stat = os.stat(path)
+        stamps.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(stamps)
+
+
+def _digest(paths):
+    if len(paths) == 1:
+        return _file_digest(paths[0])
+    return hashlib.sha256('\n'.join(_file_digest(path) for path in paths).encode()).hexdigest()
+
+
+def load_compiled(csv_file_path, kind, compile_fn, cache_dir=CACHE_DIR, rebuild=False):
+    """Return the compiled form of a watchlist CSV, rebuilding only if it changed.
+
+    ``csv_file_path`` may also be a list of CSVs compiled into one artifact.
+    The artifact on disk records each CSV's size, mtime and content hash. A
+    matching size and mtime is trusted as-is; otherwise the content hash
+    decides, so touching the file without editing it does not force a rebuild.
+    """
+    paths = [csv_file_path] if isinstance(csv_file_path, str) else list(csv_file_path)
+    if len(paths) == 1:
+        name = os.path.basename(paths[0])
+    else:
+        name = 'combined-' + hashlib.sha1('|'.join(paths).encode()).hexdigest()[:8]
+    cache_path = os.path.join(cache_dir, f"{name}.{kind}.pickle")
+    stamp = _stamp(paths)
+
+    cached = None if rebuild else _loaded.get(cache_path)
+    if cached is None and not rebuild:
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+            cached = None
+
+    if cached is not None and cached['version'] == CACHE_VERSION:
+        if cached['stamp'] == stamp:
+            _loaded[cache_path] = cached
+            return cached['data']
+        digest = _digest(paths)
+        if cached['digest'] == digest:
+            cached['stamp'] = stamp
+            _write_artifact(cache_path, cached)
+            _loaded[cache_path] = cached
+            return cached['data']
+    else:
+        digest = _digest(paths)
+
+    logging.info(f'Compiling watchlist {", ".join(paths)} ({kind})')
+    cached = {
+        'version': CACHE_VERSION,
+        'stamp': stamp,
+        'digest': digest,
+        'data': compile_fn(csv_file_path),
+    }
+    _write_artifact(cache_path, cached)
+    _loaded[cache_path] = cached
+    return cached['data']
+
+
+def _write_artifact(cache_path, artifact):
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prebuild the compiled watchlist cache')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--rules', default=os.getenv('RULES_FILE', 'watchlists.json'), help='watchlist rule configuration')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='rebuild even if the rules and CSVs are unchanged')
+    args = parser.parse_args()
+
+    # The combined index every watchlist rule is evaluated against, built
+    # exactly as a run loads it
+    from rules import load_rules, load_rule_engine
+    engine = load_rule_engine(load_rules(args.rules), args.cache_dir, rebuild=args.force)
+    print(f"Rule engine: {len(engine.rules)} rules, {len(engine.key_index)} address keys, {len(engine.core_index)} core addresses")
+    print(f"Cache written to {args.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from addresshort import PARCELS_LAYER_URL
+from arcgis_download import error_status, get_object_ids, make_arcgis_client, query
+from geocode import ring_centroids
+from spatial import LAYERS, PolygonIndex
+from watchlist import HEALTH_CSV, NTM_CSV
+
+SYNC_DB = 'parcels.db'
+
+# The synced watchlists are written here rather than over the CSVs checked
+# into the repo, so a sync never leaves the deploy checkout modified; point
+# the rules' "csv" at these files to match against them
+SYNC_DIR = 'synced'
+NTM_SYNC_CSV = os.path.join(SYNC_DIR, NTM_CSV)
+HEALTH_SYNC_CSV = os.path.join(SYNC_DIR, HEALTH_CSV)
+
+# Field holding the zoning district (e.g. 'CRT-1') on the zoning layer;
+# sync_layer checks it against the layer's description
+ZONE_FIELD = 'ZONECLASS'
+
+# A rebuilt watchlist that is empty, or has lost more than this share of
+# the rows of the one it replaces, is more likely a broken layer or query
+# than a real change; it is only written with force
+MAX_SHRINK = 0.2
+
+# Layers the watchlists are built from. Parcels are kept as one point each;
+# zoning districts and NTM areas as polygons.
+SYNC_LAYERS = {
+    'parcels': {'url': PARCELS_LAYER_URL, 'out_fields': 'OBJECTID,ADDRESSSHORT,PARCELID'},
+    'zoning': {'url': LAYERS['zoning']['url'], 'out_fields': f'OBJECTID,{ZONE_FIELD}'},
+    'ntm': {'url': LAYERS['ntm']['url'], 'out_fields': 'OBJECTID,TYPE'},
+}
+
+# Zoning districts whose parcels go into the health office watchlist. The
+# watchlist keeps the zone, so exclusions are still up to the rule.
+HEALTH_ZONES = (
+    'CCS-1', 'CCS-2', 'CCT-1', 'CCT-2', 'CRS-1', 'CRS-2', 'CRT-1', 'CRT-2',
+    'DC-1', 'DC-2', 'DC-3', 'DC-C', 'NT-4', 'NTM-1', 'RC-1', 'RC-2', 'RC-3',
+)
+
+# Features fetched per objectIds query
+FETCH_CHUNK = 500
+
+
+def arcgis_timestamp(epoch_ms):
+    # ArcGIS returns dates as epoch milliseconds and takes them back as UTC literals
+    return datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc).strftime("timestamp '%Y-%m-%d %H:%M:%S'")
+
+
+class ParcelStore:
+    """Local copy of the parcel, zoning and NTM layers, kept current incrementally.
+
+    ``features`` holds every synced feature; ``parcels`` has one row per
+    parcel with the zoning district and NTM membership of its centroid,
+    indexed for building the watchlists. ``layers`` remembers, per layer,
+    the latest edit date seen, so the next sync asks only for what changed.
+    """
+
+    def __init__(self, path=SYNC_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            '''CREATE TABLE IF NOT EXISTS layers (
+                name TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                edit_field TEXT,
+                last_edit INTEGER,
+                features INTEGER NOT NULL DEFAULT 0,
+                synced_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS features (
+                layer TEXT NOT NULL,
+                objectid INTEGER NOT NULL,
+                attributes TEXT NOT NULL,
+                rings TEXT,
+                x REAL,
+                y REAL,
+                PRIMARY KEY (layer, objectid)
+            );
+            CREATE TABLE IF NOT EXISTS parcels (
+                objectid INTEGER PRIMARY KEY,
+                address TEXT,
+                zone TEXT,
+                ntm INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS parcels_zone ON parcels (zone);
+            CREATE INDEX IF NOT EXISTS parcels_ntm ON parcels (ntm);'''
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def state(self, name):
+        row = self.conn.execute(
+            'SELECT url, edit_field, last_edit, features FROM layers WHERE name = ?', (name,)
+        ).fetchone()
+        return dict(zip(('url', 'edit_field', 'last_edit', 'features'), row)) if row else None
+
+    def object_ids(self, layer):
+        return {row[0] for row in self.conn.execute('SELECT objectid FROM features WHERE layer = ?', (layer,))}
+
+    def stored(self, layer):
+        # OBJECTID -> the stored row, to tell real edits from features fetched again
+        return {
+            row[0]: row[1:] for row in self.conn.execute(
+                'SELECT objectid, attributes, rings, x, y FROM features WHERE layer = ?', (layer,)
+            )
+        }
+
+    def apply(self, name, url, edit_field, last_edit, upserts, deletes, full=False):
+        """Apply one sync's changes to a layer in a single transaction."""
+        with self.conn:
+            if full:
+                self.conn.execute('DELETE FROM features WHERE layer = ?', (name,))
+            self.conn.executemany(
+                'DELETE FROM features WHERE layer = ? AND objectid = ?', ((name, oid) for oid in deletes)
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO features (layer, objectid, attributes, rings, x, y) VALUES (?, ?, ?, ?, ?, ?)',
+                ((name, objectid, *row) for objectid, row in upserts.items())
+            )
+            count = self.conn.execute('SELECT COUNT(*) FROM features WHERE layer = ?', (name,)).fetchone()[0]
+            self.conn.execute(
+                'INSERT OR REPLACE INTO layers (name, url, edit_field, last_edit, features, synced_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (name, url, edit_field, last_edit, count, datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def polygons(self, layer):
+        rows = self.conn.execute('SELECT attributes, rings FROM features WHERE layer = ? AND rings IS NOT NULL', (layer,))
+        return [(json.loads(attributes), json.loads(rings)) for attributes, rings in rows]
+
+    def assign_zones(self, object_ids=None):
+        """Work out the zone and NTM membership of parcels from their centroids.
+
+        Only ``object_ids`` are redone (and removed parcels dropped) unless it
+        is None, meaning the zoning or NTM polygons changed and every parcel
+        needs it.
+        """
+        zoning = self.polygons('zoning')
+        zone_index = PolygonIndex([rings for _, rings in zoning])
+        ntm_index = PolygonIndex([rings for _, rings in self.polygons('ntm')])
+
+        sql = "SELECT objectid, attributes, x, y FROM features WHERE layer = 'parcels'"
+        if object_ids is None:
+            rows = self.conn.execute(sql).fetchall()
+        else:
+            object_ids = list(object_ids)
+            rows = []
+            for start in range(0, len(object_ids), FETCH_CHUNK):
+                chunk = object_ids[start:start + FETCH_CHUNK]
+                rows.extend(self.conn.execute(
+                    f"{sql} AND objectid IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+
+        assigned = []
+        for objectid, attributes, x, y in rows:
+            zones = zone_index.query(x, y) if x is not None else []
+            assigned.append((
+                objectid,
+                json.loads(attributes).get('ADDRESSSHORT'),
+                zoning[zones[0]][0].get(ZONE_FIELD) if zones else None,
+                int(bool(x is not None and ntm_index.query(x, y))),
+            ))
+
+        with self.conn:
+            if object_ids is None:
+                self.conn.execute('DELETE FROM parcels')
+            else:
+                self.conn.execute(
+                    "DELETE FROM parcels WHERE objectid NOT IN (SELECT objectid FROM features WHERE layer = 'parcels')"
+                )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO parcels (objectid, address, zone, ntm) VALUES (?, ?, ?, ?)', assigned
+            )
+        return len(assigned)
+
+    def ntm_addresses(self):
+        return [row[0] for row in self.conn.execute(
+            'SELECT DISTINCT address FROM parcels WHERE ntm = 1 AND address IS NOT NULL ORDER BY address'
+        )]
+
+    def health_addresses(self, zones=HEALTH_ZONES):
+        return self.conn.execute(
+            f"SELECT DISTINCT address, zone FROM parcels WHERE zone IN ({','.join('?' * len(zones))}) "
+            'AND address IS NOT NULL ORDER BY address, zone',
+            zones
+        ).fetchall()
+
+
+def _feature(raw):
+    rings = (raw.get('geometry') or {}).get('rings') or []
+    return {'attributes': raw['attributes'], 'rings': rings}
+
+
+def fetch_features(client, layer_url, out_fields, object_ids, max_workers=4):
+    """Fetch the attributes and WGS84 geometry of the given features."""
+    object_ids = sorted(object_ids)
+
+    def fetch(start):
+        data = query(client, layer_url, {
+            'objectIds': ','.join(str(oid) for oid in object_ids[start:start + FETCH_CHUNK]),
+            'outFields': out_fields,
+            'returnGeometry': 'true',
+            'outSR': 4326,
+        })
+        return [_feature(raw) for raw in data.get('features', [])]
+
+    features = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in executor.map(fetch, range(0, len(object_ids), FETCH_CHUNK)):
+            features.extend(chunk)
+    return features
+
+
+def sync_layer(client, store, name, layer, full=False, max_workers=4):
+    """Bring one layer's local copy up to date.
+
+    With editor tracking, only features edited since the last sync are
+    fetched, and the full OBJECTID list is pulled only when the feature
+    count says something was deleted. Without it, the OBJECTID lists are
+    compared, which catches inserts and deletes but not edits; run with
+    ``full`` now and then to pick those up. Returns the OBJECTIDs inserted
+    or updated, those deleted, and whether the layer was replaced outright.
+    """
+    url = layer['url']
+    state = store.state(name)
+    full = full or state is None or state['url'] != url
+    info = client.get_json(url, body_status=error_status, params={'f': 'json'})
+    # A field the layer lacks comes back as None on every feature, which
+    # would quietly empty the watchlists built from it
+    fields = {field['name'] for field in info.get('fields') or []}
+    missing = [field for field in layer['out_fields'].split(',') if field not in fields]
+    if missing:
+        raise RuntimeError(
+            f'{name} layer {url} has no field {", ".join(missing)}; '
+            f'its fields are {", ".join(sorted(fields)) or "not listed"}'
+        )
+    edit_field = (info.get('editFieldsInfo') or {}).get('editDateField')
+    out_fields = f"{layer['out_fields']},{edit_field}" if edit_field else layer['out_fields']
+
+    known = set() if full else store.object_ids(name)
+    last_edit = None if full else state['last_edit']
+    deleted = set()
+    if not full and edit_field and last_edit is not None:
+        # Edits at the last seen instant are fetched again; applying them is idempotent
+        changed = set(get_object_ids(client, url, f"{edit_field} >= {arcgis_timestamp(last_edit)}"))
+        count = query(client, url, {'where': '1=1', 'returnCountOnly': 'true'}).get('count', 0)
+        if count != len(known | changed):
+            deleted = known - set(get_object_ids(client, url))
+    else:
+        current = set(get_object_ids(client, url))
+        deleted = known - current
+        changed = current - known
+
+    features = fetch_features(client, url, out_fields, changed, max_workers) if changed else []
+    # Parcels are kept as the centroid of their outer ring, polygons as rings
+    if name == 'parcels':
+        centroids = ring_centroids([f['rings'][0] if f['rings'] else [] for f in features]) if features else []
+        for feature, (x, y) in zip(features, centroids):
+            feature['rings'] = None
+            feature['x'], feature['y'] = (None, None) if x != x else (float(x), float(y))
+    else:
+        for feature in features:
+            feature['x'] = feature['y'] = None
+
+    edits = [f['attributes'].get(edit_field) for f in features if edit_field]
+    last_edit = max([edit for edit in edits if edit is not None] + ([last_edit] if last_edit is not None else []),
+                    default=None)
+
+    # Only rows that differ from the stored copy count as changed
+    stored = {} if full else store.stored(name)
+    upserts = {}
+    for feature in features:
+        objectid = feature['attributes']['OBJECTID']
+        row = (
+            json.dumps(feature['attributes'], sort_keys=True),
+            json.dumps(feature['rings']) if feature['rings'] is not None else None,
+            feature['x'], feature['y'],
+        )
+        if stored.get(objectid) != row:
+            upserts[objectid] = row
+    store.apply(name, url, edit_field, last_edit, upserts, deleted, full)
+    logging.info(
+        f'{name}: {len(features)} features fetched, {len(upserts)} new or changed, {len(deleted)} deleted'
+        f'{" (full sync)" if full else ""}'
+    )
+    return set(upserts), deleted, full
+
+
+def check_shrink(path, rows, max_shrink=MAX_SHRINK):
+    """Raise if ``rows`` would empty the watchlist at ``path`` or shrink it by more than ``max_shrink``."""
+    if not rows:
+        raise RuntimeError(f'Refusing to write an empty watchlist to {path}; use --force to write it anyway')
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', newline='') as f:
+        before = sum(1 for _ in csv.reader(f)) - 1
+    if len(rows) < before * (1 - max_shrink):
+        raise RuntimeError(
+            f'Refusing to shrink {path} from {before} to {len(rows)} rows; use --force to write it anyway'
+        )
+
+
+def write_csv_if_changed(path, header, rows):
+    # Unchanged watchlists keep their mtime, so compiled caches stay valid
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(header)
+    writer.writerows(rows)
+    text = buffer.getvalue()
+    if os.path.exists(path):
+        with open(path, 'r', newline='') as f:
+            if f.read() == text:
+                return False
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.tmp', 'w', newline='') as f:
+        f.write(text)
+    os.replace(f'{path}.tmp', path)
+    return True
+
+
+def sync_watchlists(store, client=None, full=False, max_workers=4, ntm_csv=NTM_SYNC_CSV, health_csv=HEALTH_SYNC_CSV,
+                    layers=SYNC_LAYERS, force=False):
+    """Sync every layer, then rebuild the watchlist CSVs from the local table.
+
+    Neither CSV is written if either would come out empty or shrink by more
+    than MAX_SHRINK, unless ``force`` is set; the layers stay synced, so a
+    rerun with ``force`` only has to write them.
+    """
+    client = client or make_arcgis_client(pool_size=max_workers)
+    changes = {name: sync_layer(client, store, name, layer, full, max_workers) for name, layer in layers.items()}
+
+    # New zoning or NTM polygons can move any parcel; otherwise only the
+    # parcels that changed need placing
+    polygons_changed = any(changes[name][0] or changes[name][1] or changes[name][2] for name in ('zoning', 'ntm'))
+    parcel_ids = None if polygons_changed or changes['parcels'][2] else changes['parcels'][0]
+    if parcel_ids is None or parcel_ids or changes['parcels'][1]:
+        assigned = store.assign_zones(parcel_ids)
+        logging.info(f'Placed {assigned} parcels in their zones')
+
+    ntm = store.ntm_addresses()
+    health = store.health_addresses()
+    if not force:
+        check_shrink(ntm_csv, ntm)
+        check_shrink(health_csv, health)
+    written = [
+        path for path, changed in (
+            (ntm_csv, write_csv_if_changed(ntm_csv, ['Address'], [(address,) for address in ntm])),
+            (health_csv, write_csv_if_changed(health_csv, ['Address', 'Zone_Class'], health)),
+        ) if changed
+    ]
+    logging.info(f'{len(ntm)} NTM and {len(health)} health office addresses; rewrote {", ".join(written) or "nothing"}')
+    return {'ntm': len(ntm), 'health': len(health), 'written': written}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f'Keep watchlist CSVs current from the city ArcGIS layers (written to {SYNC_DIR}/ by default)'
+    )
+    parser.add_argument('--db', default=SYNC_DB)
+    parser.add_argument('--full', action='store_true', help='download every feature again instead of only changes')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent feature queries')
+    parser.add_argument('--ntm', default=NTM_SYNC_CSV, help='NTM watchlist CSV to write')
+    parser.add_argument('--health', default=HEALTH_SYNC_CSV, help='health office watchlist CSV to write')
+    parser.add_argument(
+        '--force', action='store_true',
+        help=f'write the watchlists even if one is empty or lost more than {MAX_SHRINK:.0%}% of its rows'
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
+    with ParcelStore(args.db) as store:
+        result = sync_watchlists(
+            store, full=args.full, max_workers=args.workers, ntm_csv=args.ntm, health_csv=args.health, force=args.force
+        )
+    print(f"{result['ntm']} NTM and {result['health']} health office addresses")
+
+
+if __name__ == '__main__':
+    main()
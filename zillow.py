@@ -0,0 +1,24 @@
+import logging
+import requests
+from http_client import RAPIDAPI_QUOTA_HEADERS, CircuitOpenError, make_client
+
+ZILLOW_URL = "https://us-housing-market-data1.p.rapidapi.com/propertyExtendedSearch"
+ZILLOW_HOST = "us-housing-market-data1.p.rapidapi.com"
+
+# Requests per second the client allows itself; RapidAPI's quota headers
+# slow it down further as the plan's quota runs low
+ZILLOW_RATE = 5
+
+
+def make_zillow_client(pool_size=10):
+    return make_client(pool_size, rate=ZILLOW_RATE, quota_headers=RAPIDAPI_QUOTA_HEADERS, name='Zillow')
+
+
+def fetch_page(client, url, headers, querystring, page_num):
+    params = {**querystring, "page": str(page_num)}
+    try:
+        return client.get_json(url, headers=headers, params=params)
+    except (requests.RequestException, ValueError, CircuitOpenError) as e:
+        logging.error(f'Page {page_num} failed: {e}')
+        raise RuntimeError(f'Failed to fetch page {page_num}: {e}')
+